@@ -12,14 +12,154 @@ import sys
 import datetime  # for parsing dates and calculating ages
 # import datetime module to handle date objects and operations
 
+import argparse  # for the non-interactive command line (benchmarks etc.)
+import bisect    # for ordered slot lookups
+import collections.abc  # for dict-like views over database tables
+import contextlib  # for transaction context managers
+import csv       # for bulk import files
+import array     # for compact integer posting lists
+import gc        # for pausing garbage collection during bulk loads
+import heapq     # for top-N ranking
+import itertools  # for lazy slicing of streamed rows
+import json      # for the journal and snapshot formats
+import os        # for file syncing and atomic renames
+import sqlite3   # for the optional SQLite storage backend
+import tempfile  # for benchmark scratch directories
+import tracemalloc  # for the memory benchmark
+import zlib      # for journal entry checksums
+import base64    # for the export cursor's bitmap in JSON
+import struct    # for the columnar export's block headers
+import random    # for generating benchmark workloads
+import time as _time  # for benchmark timings (aliased: 'time' is a slot field)
+import collections  # for counting aggregate groups
+import threading  # for the thread-safe system's locks
+import asyncio   # for the network service and its load generator
+import signal    # for shutting the network service down on SIGTERM
+import subprocess  # for running the service under the server benchmark
+import concurrent.futures  # for the waiting-list optimiser's process pool
+import functools  # for binding solver options sent to the process pool
+import io        # for feeding canned answers to prompts in the benchmark suite
+import cProfile  # for the opt-in operation profiler
+import pstats    # for summarising profiler output
+
+try:
+    import numpy  # optional: vectorised aggregates over appointment columns
+except ImportError:
+    numpy = None
+
 CONSULTATION_FEE = 3000  # JMD$
 
 
+# -----------------------------------------------------------------------------
+# Rendering Helpers (paginated listings)
+# -----------------------------------------------------------------------------
+PAGE_SIZE = 20  # rows per page in interactive listings
+
+
+def render_pages(rows, format_row, title: str, page_size: int = None):
+    # lazily turn rows into rendered pages: each page is built in a single
+    # string buffer and rows are pulled from the iterable only as needed
+    page_size = page_size or PAGE_SIZE
+    buf = [title]
+    number = 1
+    for row in rows:
+        buf.append(format_row(row))
+        if len(buf) > page_size:
+            yield "\n".join(buf) + "\n"
+            number += 1
+            buf = [f"{title.rstrip(':')} (page {number})"]
+    if len(buf) > 1:
+        yield "\n".join(buf) + "\n"
+
+
+def show_pages(pages, interactive: bool = None) -> int:
+    # write pages one at a time; on a terminal, pause between pages and
+    # stop early on 'q'. Returns the number of pages shown
+    if interactive is None:
+        interactive = sys.stdin.isatty()
+    shown = 0
+    page = next(pages, None)
+    while page is not None:
+        sys.stdout.write(page)
+        shown += 1
+        page = next(pages, None)
+        if page is not None and interactive:
+            if input("-- more (Enter = next page, q = quit) -- ").strip().lower() == "q":
+                break
+    # blank line after the listing
+    sys.stdout.write("\n")
+    return shown
+
+
+def parse_patient_query(text: str) -> dict:
+    # split a search box entry into PatientIndex.search() criteria:
+    # digits (7+) are a phone number, YYYY-MM-DD (or A..B) a DOB (range),
+    # everything else name words
+    criteria = {"names": []}
+    for token in text.split():
+        low, sep, high = token.partition("..")
+        if len(low) == 10 and low[4] == "-" and (not sep or len(high) == 10):
+            parse_dob(low)
+            if sep:
+                parse_dob(high)
+            criteria["dob_from"], criteria["dob_to"] = low, high or low
+        elif token.isdigit() and len(token) >= 7:
+            criteria["phone"] = token
+        else:
+            criteria["names"].extend(PatientIndex.tokens(token))
+    return criteria
+
+
+def parse_filters(text: str) -> dict:
+    # parse "doctor=D001 status=Confirmed from=2025-01-01 to=2025-01-31"
+    # (also patient=P001)
+    # into appointment_rows() keyword arguments (raises ValueError)
+    names = {"doctor": "doctor_id", "patient": "patient_id",
+             "status": "status", "from": "date_from", "to": "date_to"}
+    filters = {}
+    for token in text.split():
+        key, sep, val = token.partition("=")
+        if not sep or key.lower() not in names or not val:
+            raise ValueError(f"Unknown filter '{token}'; use doctor=, "
+                             f"patient=, status=, from=, to=.")
+        if key.lower() in ("from", "to"):
+            parse_dob(val)  # same YYYY-MM-DD check as dates of birth
+        filters[names[key.lower()]] = val
+    return filters
+
+
 # -----------------------------------------------------------------------------
 # Base Class: Person
 # -----------------------------------------------------------------------------
+# repeated values (names, gender, ward, religion, status, ...) are interned
+# so a million records share one string object per distinct value
+_intern = sys.intern
+
+
+def _day_number(date: str):
+    # store a 'YYYY-MM-DD' date as its ordinal (an int); anything else
+    # (e.g. a doctor's blank DOB) is kept as the original string
+    if len(date) == 10:
+        try:
+            return datetime.date.fromisoformat(date).toordinal()
+        except ValueError:
+            pass
+    return _intern(date)
+
+
+def _day_text(day) -> str:
+    # inverse of _day_number
+    if day.__class__ is int:
+        return datetime.date.fromordinal(day).isoformat()
+    return day
+
+
 class Person:
-    # base class for storing common personal information
+    # base class for storing common personal information; __slots__ keeps
+    # records free of a per-instance __dict__
+    __slots__ = ("first_name", "middle_name", "last_name", "_dob", "age",
+                 "gender")
+
     def __init__(self,
                  first_name: str,
                  middle_name: str,
@@ -28,18 +168,27 @@ class Person:
                  age: int,
                  gender: str):
         # store first name
-        self.first_name = first_name
+        self.first_name = _intern(first_name)
         # store middle name
-        self.middle_name = middle_name
+        self.middle_name = _intern(middle_name)
         # Store last name
-        self.last_name = last_name
-        # store date of birth as string 
-        self.dob = dob
+        self.last_name = _intern(last_name)
+        # store date of birth as a day ordinal (read back as a string)
+        self._dob = _day_number(dob)
         # store age
         self.age = age
         # store gender
-        self.gender = gender
-        
+        self.gender = _intern(gender)
+
+    @property
+    def dob(self) -> str:
+        # date of birth as 'YYYY-MM-DD'
+        return _day_text(self._dob)
+
+    @dob.setter
+    def dob(self, value: str) -> None:
+        self._dob = _day_number(value)
+
     # return a single-line summary of the person’s details 
     def display(self) -> str:
          # concatenate name parts and remove extra spaces    
@@ -52,8 +201,21 @@ class Person:
 # -----------------------------------------------------------------------------
 # Subclass: Patient
 # -----------------------------------------------------------------------------
+# Patient attributes in constructor order (used to serialise patients)
+PATIENT_FIELDS = (
+    "first_name", "middle_name", "last_name", "dob", "age", "gender",
+    "address", "telephone", "place_of_birth", "occupation", "employer",
+    "father_fn", "father_ln", "mother_fn", "mother_ln",
+    "ward", "union_status", "religion",
+    "nok_fn", "nok_ln", "nok_address", "nok_relation", "nok_phone",
+    "patient_id",
+)
+
+
 class Patient(Person):
    # define Patient class that extends Person to include medical system details
+    __slots__ = PATIENT_FIELDS[6:] + ("_appointments",)
+
     def __init__(self,
                  fn: str, mn: str, ln: str,
                  dob: str, age: int, gender: str,
@@ -72,84 +234,642 @@ class Patient(Person):
         # store patient telephone number as string of digits
         self.telephone = telephone
         # store place of birth
-        self.place_of_birth = pob
+        self.place_of_birth = _intern(pob)
         # store current occupation
-        self.occupation = occupation
+        self.occupation = _intern(occupation)
         # store employer name
-        self.employer = employer
-        # combine father's first and last names into one string
-        self.father_name = f"{father_fn} {father_ln}"
-        # combine mother's first and last names into one string
-        self.mother_name = f"{mother_fn} {mother_ln}"
+        self.employer = _intern(employer)
+        # store parents' first and last names
+        self.father_fn = _intern(father_fn)
+        self.father_ln = _intern(father_ln)
+        self.mother_fn = _intern(mother_fn)
+        self.mother_ln = _intern(mother_ln)
         # store ward assignment or region
-        self.ward = ward
+        self.ward = _intern(ward)
         # store marital or union status
-        self.union_status = union_status
+        self.union_status = _intern(union_status)
         # store declared religion
-        self.religion = religion
-        # combine NOK's first and last names
-        self.nok_name = f"{nok_fn} {nok_ln}"
+        self.religion = _intern(religion)
+        # store NOK's first and last names
+        self.nok_fn = _intern(nok_fn)
+        self.nok_ln = _intern(nok_ln)
         # store next-of-kin address
         self.nok_address = nok_address
         # store relation of NOK to patient
-        self.nok_relation = nok_relation
+        self.nok_relation = _intern(nok_relation)
         # store NOK telephone number
         self.nok_phone = nok_phone
         # assign the auto-generated patient ID
         self.patient_id = patient_id
-        # initialize empty list to hold Appointment objects for this patient
-        self.appointment_list = []
+        # Appointment objects for this patient; the list is only created
+        # once the first appointment is booked
+        self._appointments = None
 
+    @property
+    def appointment_list(self) -> list:
+        # this patient's appointments, in booking order
+        if self._appointments is None:
+            self._appointments = []
+        return self._appointments
 
-    def view_profile(self) -> None:
+    @property
+    def father_name(self) -> str:
+        # combine father's first and last names into one string
+        return f"{self.father_fn} {self.father_ln}"
+
+    @property
+    def mother_name(self) -> str:
+        # combine mother's first and last names into one string
+        return f"{self.mother_fn} {self.mother_ln}"
+
+    @property
+    def nok_name(self) -> str:
+        # combine NOK's first and last names
+        return f"{self.nok_fn} {self.nok_ln}"
+
+    def record(self) -> list:
+        # constructor arguments, in order, for journals and snapshots
+        return [getattr(self, field) for field in PATIENT_FIELDS]
+
+    def view_profile(self, page_size: int = None,
+                     interactive: bool = None, history: list = None) -> None:
+        # the profile block is built in one buffer and written once;
+        # history (see HospitalSystem.patient_history) replaces the
+        # in-memory appointment list when archived ones should show too
+        appts = self.appointment_list if history is None else history
+        lines = []
+        out = lines.append
         # display a header with the patient’s unique ID
-        print(f"\n--- Patient Profile [{self.patient_id}] ---")
+        out(f"\n--- Patient Profile [{self.patient_id}] ---")
         # call Person.display() to show name, DOB, age, gender
-        print(self.display())
-        # print stored address
-        print(f"Address          : {self.address}")
-        # print stored telephone number
-        print(f"Telephone        : {self.telephone}")
-        # print place of birth
-        print(f"Place of Birth   : {self.place_of_birth}")
-        # print occupation
-        print(f"Occupation       : {self.occupation}")
-        # print employer
-        print(f"Employer         : {self.employer}")
-        # print father's name
-        print(f"Father's Name    : {self.father_name}")
-        # print mother's name
-        print(f"Mother's Name    : {self.mother_name}")
-        # print ward
-        print(f"Ward             : {self.ward}")
-        # print union status
-        print(f"Union Status     : {self.union_status}")
-        # print religion
-        print(f"Religion         : {self.religion}")
+        out(self.display())
+        # stored address
+        out(f"Address          : {self.address}")
+        # stored telephone number
+        out(f"Telephone        : {self.telephone}")
+        # place of birth
+        out(f"Place of Birth   : {self.place_of_birth}")
+        # occupation
+        out(f"Occupation       : {self.occupation}")
+        # employer
+        out(f"Employer         : {self.employer}")
+        # father's name
+        out(f"Father's Name    : {self.father_name}")
+        # mother's name
+        out(f"Mother's Name    : {self.mother_name}")
+        # ward
+        out(f"Ward             : {self.ward}")
+        # union status
+        out(f"Union Status     : {self.union_status}")
+        # religion
+        out(f"Religion         : {self.religion}")
         # label next-of-kin block
-        print("Next of Kin:")
-        # print NOK name
-        print(f"  Name           : {self.nok_name}")
-        # print NOK address
-        print(f"  Address        : {self.nok_address}")
-        # print NOK relation
-        print(f"  Relation       : {self.nok_relation}")
-        # print NOK telephone
-        print(f"  Telephone      : {self.nok_phone}\n")
+        out("Next of Kin:")
+        # NOK name
+        out(f"  Name           : {self.nok_name}")
+        # NOK address
+        out(f"  Address        : {self.nok_address}")
+        # NOK relation
+        out(f"  Relation       : {self.nok_relation}")
+        # NOK telephone
+        out(f"  Telephone      : {self.nok_phone}\n")
         # if there are no appointments in the list
-        if not self.appointment_list:
+        if not appts:
             # inform user no appointments booked
-            print("No appointments booked.\n")
+            out("No appointments booked.\n")
+            sys.stdout.write("\n".join(lines) + "\n")
+            return
+        sys.stdout.write("\n".join(lines) + "\n")
+        # otherwise page through the booked appointments
+        show_pages(render_pages(
+            appts,
+            # ID, doctor’s name, date/time, and status
+            lambda appt: (f"  • {appt.appointment_id}: Dr. "
+                          f"{appt.doctor.first_name} {appt.doctor.last_name} "
+                          f"@ {appt.date} {appt.time} [{appt.status}]"),
+            "Appointments:", page_size), interactive)
+
+
+# -----------------------------------------------------------------------------
+# Class: SlotIndex
+# -----------------------------------------------------------------------------
+def parse_slot(date: str, time: str) -> datetime.datetime:
+    # parse a 'YYYY-MM-DD' date and 'HH:MM' time into a datetime
+    if len(date) != 10 or len(time) != 5:
+        # reject anything that is not exactly in the documented format
+        raise ValueError(f"Invalid slot '{date} {time}'; use 'YYYY-MM-DD HH:MM'.")
+    # fromisoformat is implemented in C and much faster than strptime
+    return datetime.datetime.fromisoformat(f"{date} {time}")
+
+
+def format_slot(dt: datetime.datetime) -> tuple:
+    # convert a slot datetime back into its (date, time) string pair
+    return dt.date().isoformat(), f"{dt.hour:02}:{dt.minute:02}"
+
+
+def _minutes(dt: datetime.datetime) -> int:
+    # minutes since 0001-01-01 00:00 (the unit of Appointment.at)
+    return dt.toordinal() * 1440 + dt.hour * 60 + dt.minute
+
+
+class SlotIndex:
+    # indexed store of a doctor's free slots:
+    #   _free  : hash set of free slot datetimes -> O(1) availability checks
+    #   _order : sorted list of every slot ever added (free or booked)
+    #   _known : dict mirroring _order (slot -> (date, time) labels), so
+    #            restores know if a re-insert is needed and listings need
+    #            no re-formatting
+    # booking only removes the slot from _free and leaves a tombstone in
+    # _order; iteration skips tombstones and compacts them once they
+    # outnumber the free slots, so book/cancel never shift the whole list.
+    # keys are slot datetimes, or any ordered key such as the
+    # (datetime, doctor_id) pairs used by SpecialityIndex
+    # explicit slots are always finite (see RuleSchedule)
+    bounded = True
+
+    def __init__(self, slots=()):
+        # parse and de-duplicate the initial (date, time) pairs
+        known = {}
+        for date, time in slots:
+            known[parse_slot(date, time)] = (date, time)
+        # hash set of free slots
+        self._free = set(known)
+        # ordered list built with a single sort instead of repeated inserts
+        self._order = sorted(known)
+        # membership/label map for _order
+        self._known = known
+
+    def __contains__(self, item) -> bool:
+        # accept either a datetime or a (date, time) string pair
+        if not isinstance(item, datetime.datetime):
+            try:
+                item = parse_slot(*item)
+            except (TypeError, ValueError):
+                # malformed slots are simply never available
+                return False
+        return item in self._free
+
+    def __len__(self) -> int:
+        # number of free slots
+        return len(self._free)
+
+    def __iter__(self):
+        # yield free slots as (date, time) pairs in chronological order
+        known = self._known
+        for dt in self.iter_datetimes():
+            yield known[dt] or format_slot(dt)
+
+    def iter_datetimes(self):
+        # yield free slot datetimes in chronological order
+        free = self._free
+        for dt in self._order:
+            if dt in free:
+                yield dt
+
+    def add(self, dt: datetime.datetime, label: tuple = None) -> bool:
+        # mark a slot free; returns False if it was already free
+        if dt in self._free:
+            return False
+        self._free.add(dt)
+        # only insert into the ordered list if no tombstone is there already
+        if dt not in self._known:
+            self._known[dt] = label
+            # appending is O(1) when slots are added in chronological order
+            if not self._order or self._order[-1] < dt:
+                self._order.append(dt)
+            else:
+                bisect.insort(self._order, dt)
+        return True
+
+    def discard(self, dt: datetime.datetime) -> bool:
+        # mark a slot booked; returns False if it was not free
+        if dt not in self._free:
+            return False
+        self._free.remove(dt)
+        # compact tombstones once they outnumber free slots (amortised O(1))
+        if len(self._order) > 2 * len(self._free) + 64:
+            self._compact()
+        return True
+
+    def _compact(self) -> None:
+        # drop tombstones from the ordered list
+        free = self._free
+        self._order = [dt for dt in self._order if dt in free]
+        known = self._known
+        self._known = {dt: known[dt] for dt in self._order}
+
+    def step(self, dt: datetime.datetime) -> datetime.timedelta:
+        # length of the slot starting at dt (explicit slots are all
+        # SLOT_MINUTES long)
+        return _SLOT_STEP
+
+    def label(self, dt: datetime.datetime) -> tuple:
+        # return the (date, time) string pair for a known slot
+        return self._known.get(dt) or format_slot(dt)
+
+    def record(self) -> list:
+        # JSON-ready form for the journal/snapshot: the free slots
+        return list(self)
+
+    def first_after(self, start: datetime.datetime = None):
+        # return the earliest free slot at or after start (None if none)
+        for dt in self.between(start, None):
+            return dt
+        return None
+
+    def count_between(self, start: datetime.datetime,
+                      end: datetime.datetime) -> int:
+        # number of free slots with start <= slot < end
+        order = self._order
+        i, j = bisect.bisect_left(order, start), bisect.bisect_left(order, end)
+        if len(order) == len(self._free):
+            # no tombstones: the positions give the count directly
+            return j - i
+        free = self._free
+        return sum(1 for k in range(i, j) if order[k] in free)
+
+    def between(self, start: datetime.datetime = None,
+                end: datetime.datetime = None):
+        # yield free slot datetimes with start <= slot < end (either optional)
+        order = self._order
+        free = self._free
+        # binary search for the first candidate position
+        i = 0 if start is None else bisect.bisect_left(order, start)
+        n = len(order)
+        while i < n:
+            dt = order[i]
+            if end is not None and dt >= end:
+                break
+            if dt in free:
+                yield dt
+            i += 1
+
+
+# -----------------------------------------------------------------------------
+# Class: AvailabilityRule / RuleSchedule (recurring availability)
+# -----------------------------------------------------------------------------
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+# default slot length (minutes) when a rule gives no 'every'; also the
+# grid appointment durations are measured in
+SLOT_MINUTES = 15
+_SLOT_STEP = datetime.timedelta(minutes=SLOT_MINUTES)
+# longest procedure one appointment may book (minutes)
+MAX_DURATION = 8 * 60
+# listings of open-ended schedules stop this many days after the first slot
+RULE_HORIZON_DAYS = 28
+
+
+def _parse_rule_date(value: str, what: str) -> int:
+    # 'YYYY-MM-DD' -> proleptic ordinal
+    try:
+        if len(value) != 10:
+            raise ValueError
+        return datetime.date.fromisoformat(value).toordinal()
+    except ValueError:
+        raise ValueError(f"{what}: use YYYY-MM-DD, not {value!r}") from None
+
+
+def _parse_rule_minutes(value: str) -> int:
+    # 'HH:MM' (24:00 allowed as an end time) -> minutes past midnight
+    hours, sep, minutes = value.partition(":")
+    if (not sep or len(hours) != 2 or len(minutes) != 2
+            or not (hours + minutes).isdigit()
+            or int(minutes) > 59 or int(hours) * 60 + int(minutes) > 1440):
+        raise ValueError(f"hours: use HH:MM-HH:MM, not {value!r}")
+    return int(hours) * 60 + int(minutes)
+
+
+class AvailabilityRule:
+    # one weekly recurrence: slots of `every` minutes from start to end
+    # (minutes past midnight) on the given weekdays (Monday = 0), between
+    # the first and last days (proleptic ordinals; last None = open-ended),
+    # except on leave. Leave is kept as merged (from, to) ordinal ranges.
+    # The text form, also used by the journal and imports, is e.g.
+    #   Mon-Fri 09:00-17:00 every 15 from 2025-01-06 until 2025-12-31
+    #       except 2025-04-18,2025-08-04..2025-08-15
+    __slots__ = ("weekdays", "start", "end", "every", "first", "last",
+                 "_leave_from", "_leave_to", "_steps")
+
+    def __init__(self, weekdays, start: int, end: int, every: int,
+                 first: int, last: int = None, leave=()):
+        self.weekdays = frozenset(weekdays)
+        if not self.weekdays or not self.weekdays <= set(range(7)):
+            raise ValueError("weekdays: give at least one of Mon..Sun")
+        if every <= 0 or not 0 <= start < end <= 1440 or start + every > end:
+            raise ValueError("hours: the day must fit at least one slot")
+        if last is not None and last < first:
+            raise ValueError("until: before from")
+        self.start, self.end, self.every = start, end, every
+        self.first, self.last = first, last
+        # offsets of each slot from midnight, shared by every day expanded
+        self._steps = tuple(datetime.timedelta(minutes=m)
+                            for m in range(start, end - every + 1, every))
+        # merge overlapping/adjacent leave so one bisect answers _on_leave
+        merged = []
+        for lo, hi in sorted(leave):
+            if hi < lo:
+                raise ValueError("except: range ends before it starts")
+            if merged and lo <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], hi)
+            else:
+                merged.append([lo, hi])
+        self._leave_from = [lo for lo, _ in merged]
+        self._leave_to = [hi for _, hi in merged]
+
+    @classmethod
+    def parse(cls, text: str, today: datetime.date = None):
+        # build a rule from its text form; 'from' defaults to today
+        words = text.split()
+        try:
+            if len(words) < 2:
+                raise ValueError("give weekdays and hours, "
+                                 "e.g. 'Mon-Fri 09:00-17:00'")
+            weekdays = set()
+            names = {name.lower(): n for n, name in enumerate(WEEKDAYS)}
+            for part in words[0].lower().split(","):
+                if part == "daily":
+                    weekdays.update(range(7))
+                    continue
+                lo, _, hi = part.partition("-")
+                if lo not in names or (hi and hi not in names):
+                    raise ValueError(f"weekdays: unknown day in {part!r}")
+                # ranges may wrap past Sunday (Sat-Mon)
+                n = names[lo]
+                while True:
+                    weekdays.add(n)
+                    if not hi or n == names[hi]:
+                        break
+                    n = (n + 1) % 7
+            start, sep, end = words[1].partition("-")
+            if not sep:
+                raise ValueError(f"hours: use HH:MM-HH:MM, not {words[1]!r}")
+            options = {"every": str(SLOT_MINUTES), "from": None,
+                       "until": None, "except": ""}
+            rest = words[2:]
+            if len(rest) % 2:
+                raise ValueError(f"{rest[-1]!r} needs a value")
+            for key, value in zip(rest[::2], rest[1::2]):
+                if key.lower() not in options:
+                    raise ValueError(f"unknown option {key!r}")
+                options[key.lower()] = value
+            if not options["every"].isdigit():
+                raise ValueError("every: give the slot length in minutes")
+            first = (_parse_rule_date(options["from"], "from")
+                     if options["from"]
+                     else (today or datetime.date.today()).toordinal())
+            last = (_parse_rule_date(options["until"], "until")
+                    if options["until"] else None)
+            leave = []
+            for item in options["except"].split(","):
+                if item:
+                    lo, _, hi = item.partition("..")
+                    lo = _parse_rule_date(lo, "except")
+                    leave.append((lo, _parse_rule_date(hi, "except")
+                                  if hi else lo))
+            return cls(weekdays, _parse_rule_minutes(start),
+                       _parse_rule_minutes(end), int(options["every"]),
+                       first, last, leave)
+        except ValueError as err:
+            raise ValueError(f"Bad availability rule {text!r}: {err}") from None
+
+    def text(self) -> str:
+        # canonical text form (parse(rule.text()) gives an equal rule)
+        days = []
+        n = 0
+        while n < 7:
+            # collapse runs of three or more days into 'Mon-Fri'
+            if n not in self.weekdays:
+                n += 1
+                continue
+            run = n
+            while run + 1 < 7 and run + 1 in self.weekdays:
+                run += 1
+            if run - n >= 2:
+                days.append(f"{WEEKDAYS[n]}-{WEEKDAYS[run]}")
+            else:
+                days.extend(WEEKDAYS[n:run + 1])
+            n = run + 1
+
+        def day(ordinal):
+            return datetime.date.fromordinal(ordinal).isoformat()
+
+        parts = [",".join(days),
+                 f"{self.start // 60:02}:{self.start % 60:02}-"
+                 f"{self.end // 60:02}:{self.end % 60:02}",
+                 f"every {self.every}", f"from {day(self.first)}"]
+        if self.last is not None:
+            parts.append(f"until {day(self.last)}")
+        if self._leave_from:
+            parts.append("except " + ",".join(
+                day(lo) if lo == hi else f"{day(lo)}..{day(hi)}"
+                for lo, hi in zip(self._leave_from, self._leave_to)))
+        return " ".join(parts)
+
+    def _on_leave(self, day: int) -> int:
+        # last day of the leave covering day, or 0 if it is a working day
+        i = bisect.bisect_right(self._leave_from, day) - 1
+        if i >= 0 and self._leave_to[i] >= day:
+            return self._leave_to[i]
+        return 0
+
+    def covers(self, dt: datetime.datetime) -> bool:
+        # True if dt is one of the rule's slots (booked or not)
+        if dt.second or dt.microsecond:
+            return False
+        day = dt.toordinal()
+        if day < self.first or (self.last is not None and day > self.last):
+            return False
+        # ordinal 1 (0001-01-01) was a Monday
+        if (day + 6) % 7 not in self.weekdays:
+            return False
+        offset = dt.hour * 60 + dt.minute - self.start
+        if (offset < 0 or offset % self.every
+                or self.start + offset + self.every > self.end):
+            return False
+        return not self._on_leave(day)
+
+    def count_between(self, start: datetime.datetime,
+                      end: datetime.datetime) -> int:
+        # number of the rule's slots with start <= slot < end, counted a
+        # day at a time (only the first and last days are partial)
+        first, last = start.toordinal(), end.toordinal()
+        per_day = len(self._steps)
+        count = 0
+        for day in range(max(first, self.first),
+                         min(last, self.last if self.last is not None
+                             else last) + 1):
+            if (day + 6) % 7 not in self.weekdays or self._on_leave(day):
+                continue
+            if day == first or day == last:
+                midnight = datetime.datetime.fromordinal(day)
+                count += sum(1 for step in self._steps
+                             if start <= midnight + step < end)
+            else:
+                count += per_day
+        return count
+
+    def between(self, start: datetime.datetime = None,
+                end: datetime.datetime = None):
+        # lazily yield the rule's slots with start <= slot < end; only the
+        # days actually walked are expanded, so open-ended rules are fine
+        day = self.first if start is None else max(self.first,
+                                                   start.toordinal())
+        stop = self.last
+        if end is not None:
+            stop = end.toordinal() if stop is None else min(stop,
+                                                            end.toordinal())
+        steps = self._steps
+        weekdays = self.weekdays
+        while stop is None or day <= stop:
+            leave_ends = self._on_leave(day)
+            if leave_ends:
+                # skip the whole leave period at once
+                day = leave_ends + 1
+                continue
+            if (day + 6) % 7 in weekdays:
+                midnight = datetime.datetime.fromordinal(day)
+                for step in steps:
+                    dt = midnight + step
+                    if start is not None and dt < start:
+                        continue
+                    if end is not None and dt >= end:
+                        return
+                    yield dt
+            day += 1
+
+
+class RuleSchedule:
+    # a doctor's free slots as recurrence rules instead of explicit tuples:
+    #   rules : AvailabilityRule list (overlapping rules just merge)
+    #   extra : SlotIndex of one-off slots outside every rule
+    #   taken : rule slots that are booked, i.e. exceptions to the rules
+    # it answers the same questions as SlotIndex (membership, add/discard,
+    # ordered iteration, between/first_after), expanding rules only over
+    # the range being walked. Iteration never ends if a rule is open-ended
+    # (check .bounded before walking the whole schedule).
+    def __init__(self, rules=(), slots=(), taken=()):
+        self.rules = [rule if isinstance(rule, AvailabilityRule)
+                      else AvailabilityRule.parse(rule) for rule in rules]
+        # one-off slots that a rule already provides would be duplicates
+        self.extra = SlotIndex((date, time) for date, time in slots
+                               if not self._covered(parse_slot(date, time)))
+        self.taken = set()
+        for date, time in taken:
+            dt = parse_slot(date, time)
+            if self._covered(dt):
+                self.taken.add(dt)
+
+    @property
+    def bounded(self) -> bool:
+        # True if every rule has an end date (the schedule is finite)
+        return all(rule.last is not None for rule in self.rules)
+
+    def _covered(self, dt: datetime.datetime) -> bool:
+        return any(rule.covers(dt) for rule in self.rules)
+
+    def __contains__(self, item) -> bool:
+        # accept either a datetime or a (date, time) string pair
+        if not isinstance(item, datetime.datetime):
+            try:
+                item = parse_slot(*item)
+            except (TypeError, ValueError):
+                return False
+        if item in self.extra:
+            return True
+        return item not in self.taken and self._covered(item)
+
+    def __bool__(self) -> bool:
+        # True while any slot is free
+        return self.first_after() is not None
+
+    def __len__(self) -> int:
+        # number of free slots; only defined for bounded schedules
+        if not self.bounded:
+            raise TypeError("an open-ended schedule has no length")
+        return sum(1 for _ in self.iter_datetimes())
+
+    def __iter__(self):
+        # yield free slots as (date, time) pairs in chronological order
+        for dt in self.iter_datetimes():
+            yield self.label(dt)
+
+    def iter_datetimes(self):
+        # yield free slot datetimes in chronological order
+        return self.between(None, None)
+
+    def add(self, dt: datetime.datetime, label: tuple = None) -> bool:
+        # mark a slot free; returns False if it was already free
+        if self._covered(dt):
+            if dt not in self.taken:
+                return False
+            self.taken.remove(dt)
+            return True
+        return self.extra.add(dt, label)
+
+    def discard(self, dt: datetime.datetime) -> bool:
+        # mark a slot booked; returns False if it was not free
+        if self.extra.discard(dt):
+            return True
+        if dt in self.taken or not self._covered(dt):
+            return False
+        self.taken.add(dt)
+        return True
+
+    def step(self, dt: datetime.datetime) -> datetime.timedelta:
+        # length of the slot starting at dt: the `every` of the first rule
+        # providing it (booked or not), SLOT_MINUTES for one-off slots
+        for rule in self.rules:
+            if rule.covers(dt):
+                return datetime.timedelta(minutes=rule.every)
+        return _SLOT_STEP
+
+    def label(self, dt: datetime.datetime) -> tuple:
+        # return the (date, time) string pair for a slot
+        return self.extra.label(dt) if dt in self.extra else format_slot(dt)
+
+    def first_after(self, start: datetime.datetime = None):
+        # return the earliest free slot at or after start (None if none)
+        for dt in self.between(start, None):
+            return dt
+        return None
+
+    def between(self, start: datetime.datetime = None,
+                end: datetime.datetime = None):
+        # yield free slot datetimes with start <= slot < end (either optional)
+        streams = [rule.between(start, end) for rule in self.rules]
+        if self.extra:
+            streams.append(self.extra.between(start, end))
+        taken = self.taken
+        last = None
+        for dt in (streams[0] if len(streams) == 1
+                   else heapq.merge(*streams)):
+            # skip booked slots and repeats from overlapping rules
+            if dt == last or dt in taken:
+                continue
+            last = dt
+            yield dt
+
+    def count_between(self, start: datetime.datetime,
+                      end: datetime.datetime) -> int:
+        # number of free slots with start <= slot < end; a single rule is
+        # counted per day, overlapping rules have to be walked
+        if len(self.rules) != 1:
+            return sum(1 for _ in self.between(start, end))
+        rule = self.rules[0]
+        if (start.toordinal() <= rule.first and rule.last is not None
+                and end.toordinal() > rule.last):
+            # the range spans the whole rule, so every booking is inside
+            taken = len(self.taken)
         else:
-            # otherwise list all booked appointments
-            print("Appointments:")
-            for appt in self.appointment_list:
-                # print ID, doctor’s name, date/time, and status
-                print(f"  • {appt.appointment_id}: Dr. {appt.doctor.first_name} "
-                      f"{appt.doctor.last_name} @ {appt.date} {appt.time} "
-                      f"[{appt.status}]")
-            # blank line after listing
-            print()
+            taken = sum(1 for dt in self.taken if start <= dt < end)
+        return (rule.count_between(start, end) - taken
+                + self.extra.count_between(start, end))
+
+    def record(self) -> dict:
+        # JSON-ready form for the journal/snapshot (see Doctor.__init__)
+        return {"rules": [rule.text() for rule in self.rules],
+                "slots": list(self.extra),
+                "taken": [format_slot(dt) for dt in sorted(self.taken)]}
 
 
 # -----------------------------------------------------------------------------
@@ -157,33 +877,100 @@ class Patient(Person):
 # -----------------------------------------------------------------------------
 class Doctor(Person):
     # define Doctor class that extends Person but hides DOB/age
+    __slots__ = ("doctor_id", "speciality", "schedule", "watchers")
+
     def __init__(self,
                  first_name: str,
                  last_name: str,
                  gender: str,
                  doctor_id: str,
                  speciality: str,
-                 schedule: list):
+                 schedule):
         # call Person.__init__ with empty middle name, DOB, and age=0
         super().__init__(first_name, "", last_name, "", 0, gender)
         # assign auto-generated doctor ID
         self.doctor_id = doctor_id
         # store medical speciality
-        self.speciality = speciality
-        # store list of available (date, time) tuples
-        self.schedule = schedule
+        self.speciality = _intern(speciality)
+        # index the available (date, time) slots; a dict is a recurring
+        # schedule in its RuleSchedule.record() form
+        if isinstance(schedule, dict):
+            schedule = RuleSchedule(**schedule)
+        self.schedule = (schedule
+                         if isinstance(schedule, (SlotIndex, RuleSchedule))
+                         else SlotIndex(schedule))
+        # callbacks (doctor, slot, free) run whenever a slot changes state
+        self.watchers = []
+
+    def is_available(self, date: str, time: str,
+                     duration: int = SLOT_MINUTES) -> bool:
+        # return True if the given slot exists in schedule (and, for a
+        # longer procedure, every slot after it that it spans)
+        if duration <= SLOT_MINUTES:
+            return (date, time) in self.schedule
+        try:
+            return all(dt in self.schedule
+                       for dt in self.span(date, time, duration))
+        except ValueError:
+            return False
+
+    def span(self, date: str, time: str, duration: int) -> list:
+        # the schedule slots [start, start + duration) occupies, stepping
+        # by each slot's length (a rule's `every`, else SLOT_MINUTES), so a
+        # 30-minute booking takes one slot of an "every 30" rule
+        start = parse_slot(date, time)
+        end = start + datetime.timedelta(minutes=duration)
+        slots = [start]
+        step = self.schedule.step
+        while True:
+            dt = slots[-1] + step(slots[-1])
+            if dt >= end:
+                return slots
+            slots.append(dt)
+
+    def book_slot(self, date: str, time: str,
+                  duration: int = SLOT_MINUTES) -> None:
+        # remove a booked slot (every slot a longer procedure spans) from
+        # schedule; nothing is removed unless all of them are free
+        slots = self.span(date, time, duration)
+        if len(slots) > 1 and not all(dt in self.schedule for dt in slots):
+            raise ValueError(f"Slot {date} {time} is not available.")
+        for dt in slots:
+            if not self.schedule.discard(dt):
+                # mirror list.remove(): booking a missing slot is an error
+                raise ValueError(f"Slot {date} {time} is not available.")
+            self._notify(dt, False)
+
+    def _notify(self, dt: datetime.datetime, free: bool) -> None:
+        # tell registered indexes that a slot was freed or taken
+        for watcher in self.watchers:
+            watcher(self, dt, free)
 
-    def is_available(self, date: str, time: str) -> bool:
-        # return True if the given slot exists in schedule
-        return (date, time) in self.schedule
+    def cancel_slot(self, date: str, time: str,
+                    duration: int = SLOT_MINUTES) -> None:
+        # add a canceled slot (and the rest of its span) back into
+        # schedule (never duplicated)
+        for n, dt in enumerate(self.span(date, time, duration)):
+            if self.schedule.add(dt, None if n else (date, time)):
+                self._notify(dt, True)
 
-    def book_slot(self, date: str, time: str) -> None:
-        # remove a booked slot from schedule
-        self.schedule.remove((date, time))
+    def slots_between(self, start: datetime.datetime,
+                      end: datetime.datetime) -> list:
+        # return free (date, time) slots with start <= slot < end
+        return [self.schedule.label(dt)
+                for dt in self.schedule.between(start, end)]
 
-    def cancel_slot(self, date: str, time: str) -> None:
-        # add a canceled slot back into schedule
-        self.schedule.append((date, time))
+    def upcoming(self, days: int = None):
+        # free (date, time) slots in order; with days, stop that many days
+        # after the first free slot (needed for open-ended schedules)
+        if days is None:
+            return iter(self.schedule)
+        first = self.schedule.first_after()
+        if first is None:
+            return iter(())
+        end = datetime.datetime.fromordinal(first.toordinal() + days)
+        return (self.schedule.label(dt)
+                for dt in self.schedule.between(first, end))
 
     def view_profile(self) -> None:
         # build full name string
@@ -197,20 +984,232 @@ class Doctor(Person):
         # display speciality
         print(f"Speciality : {self.speciality}\n")
 
-    def view_schedule(self) -> None:
-        # list available slots
-        print("Available Slots:")
+    def view_schedule(self, page_size: int = None,
+                      interactive: bool = None, days: int = None) -> None:
+        # list the weekly rules behind a recurring schedule
+        if isinstance(self.schedule, RuleSchedule):
+            print("Availability Rules:")
+            for rule in self.schedule.rules:
+                print(f"  • {rule.text()}")
         # if no slots left
         if not self.schedule:
             # indicate none available
+            print("Available Slots:")
             print("  • No slots available.\n")
+            return
+        if interactive is None:
+            interactive = sys.stdin.isatty()
+        # pages are expanded lazily on a terminal; printed in full, an
+        # open-ended schedule is cut off after RULE_HORIZON_DAYS
+        if days is None and not interactive and not self.schedule.bounded:
+            days = RULE_HORIZON_DAYS
+        # otherwise page through slots (the index is already sorted)
+        show_pages(render_pages(self.upcoming(days),
+                                lambda slot: f"  • {slot[0]} {slot[1]}",
+                                "Available Slots:", page_size), interactive)
+
+
+# -----------------------------------------------------------------------------
+# Class: SpecialityIndex
+# -----------------------------------------------------------------------------
+class SpecialityIndex:
+    # merged, ordered index of every free slot per speciality, so
+    # "next available" queries never walk each doctor's schedule
+    def __init__(self):
+        # normalised speciality -> SlotIndex keyed on (datetime, doctor_id)
+        self._by_speciality = {}
+        # normalised speciality -> doctors with a RuleSchedule; their slots
+        # are merged lazily at query time instead of being copied in
+        self._by_rules = {}
+
+    @staticmethod
+    def normalise(speciality: str) -> str:
+        # case/whitespace-insensitive speciality key
+        return " ".join(speciality.lower().split())
+
+    def add_doctor(self, doctor: Doctor) -> None:
+        # merge the doctor's free slots and follow future changes
+        if isinstance(doctor.schedule, RuleSchedule):
+            self._by_rules.setdefault(
+                self.normalise(doctor.speciality), []).append(doctor)
+            return
+        index = self._by_speciality.setdefault(
+            self.normalise(doctor.speciality), SlotIndex())
+        for dt in doctor.schedule.iter_datetimes():
+            index.add((dt, doctor.doctor_id))
+        doctor.watchers.append(self._on_slot_change)
+
+    def _on_slot_change(self, doctor: Doctor,
+                        dt: datetime.datetime, free: bool) -> None:
+        # keep the merged index in step with Doctor.book_slot/cancel_slot
+        index = self._by_speciality[self.normalise(doctor.speciality)]
+        if free:
+            index.add((dt, doctor.doctor_id))
         else:
-            # otherwise iterate sorted slots
-            for date, time in sorted(self.schedule):
-                # print each slot
-                print(f"  • {date} {time}")
-            # blank line after schedule
-            print()
+            index.discard((dt, doctor.doctor_id))
+
+    def specialities(self) -> list:
+        # known speciality keys, sorted
+        return sorted(self._by_speciality.keys() | self._by_rules.keys())
+
+    def next_available(self, speciality: str, count: int = 5,
+                       after: datetime.datetime = None) -> list:
+        # return up to count (datetime, doctor_id) pairs, earliest first
+        key = self.normalise(speciality)
+        index = self._by_speciality.get(key)
+        streams = [] if index is None else [
+            # (after, "") sorts before every doctor's slot at that instant
+            index.between(None if after is None else (after, ""), None)]
+        for doctor in self._by_rules.get(key, ()):
+            streams.append(zip(doctor.schedule.between(after, None),
+                               itertools.repeat(doctor.doctor_id)))
+        return list(itertools.islice(heapq.merge(*streams), count))
+
+
+# -----------------------------------------------------------------------------
+# Class: PatientIndex
+# -----------------------------------------------------------------------------
+class PatientIndex:
+    # secondary indexes over registered patients:
+    #   names : trigram -> positions, with "$$" start padding so a query's
+    #           anchored trigrams find prefixes and plain ones substrings
+    #   phones: telephone / NOK telephone digits -> positions (hash)
+    #   dobs  : 'YYYY-MM-DD' -> positions, plus a sorted list of the
+    #           distinct dates for range queries
+    # postings are compact array('I') of positions, appended in order and
+    # therefore sorted, so they can be intersected with bisect
+    def __init__(self):
+        # position -> Patient
+        self._patients = []
+        self._postings = {}
+        self._phones = {}
+        self._dobs = {}
+        self._dob_keys = []
+
+    @staticmethod
+    def tokens(text: str) -> list:
+        # lower-case name words (spaces and hyphens separate words)
+        return text.lower().replace("-", " ").split()
+
+    @staticmethod
+    def _grams(token: str, anchored: bool = True) -> set:
+        # trigrams of a token; anchored ones also mark the word start
+        padded = "$$" + token if anchored else token
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    @classmethod
+    def name_grams(cls, first: str, middle: str, last: str) -> set:
+        # every (anchored) trigram of a patient's name words
+        grams = set()
+        for token in cls.tokens(f"{first} {middle} {last}"):
+            grams |= cls._grams(token)
+        return grams
+
+    @classmethod
+    def query_grams(cls, token: str) -> set:
+        # trigrams every name matching query word token has (prefix for
+        # 1-2 letters, substring otherwise)
+        return cls._grams(token, anchored=len(token) < 3)
+
+    def add(self, patient: Patient) -> None:
+        # index a newly registered patient
+        pos = len(self._patients)
+        self._patients.append(patient)
+        for gram in self.name_grams(patient.first_name, patient.middle_name,
+                                    patient.last_name):
+            postings = self._postings.get(gram)
+            if postings is None:
+                postings = self._postings[gram] = array.array("I")
+            postings.append(pos)
+        for phone in {patient.telephone, patient.nok_phone}:
+            if phone:
+                self._phones.setdefault(phone, array.array("I")).append(pos)
+        if patient.dob not in self._dobs:
+            self._dobs[patient.dob] = array.array("I")
+            bisect.insort(self._dob_keys, patient.dob)
+        self._dobs[patient.dob].append(pos)
+
+    @staticmethod
+    def _contains(postings, pos: int) -> bool:
+        # binary search in a sorted posting array
+        i = bisect.bisect_left(postings, pos)
+        return i < len(postings) and postings[i] == pos
+
+    def _name_postings(self, token: str) -> list:
+        # posting arrays that all contain every patient whose name may
+        # match token
+        return [self._postings.get(gram, ())
+                for gram in self.query_grams(token)]
+
+    @staticmethod
+    def score(patient: Patient, name_tokens: list) -> int:
+        # rank a patient against query words (see score_name)
+        return PatientIndex.score_name(patient.first_name, patient.middle_name,
+                                       patient.last_name, name_tokens)
+
+    @staticmethod
+    def score_name(first: str, middle: str, last: str,
+                   name_tokens: list) -> int:
+        # rank a name against query words: exact word 3 (+1 on the last
+        # name), prefix 2, substring 1; 0 if any query word does not match
+        last = PatientIndex.tokens(last)
+        words = PatientIndex.tokens(f"{first} {middle}") + last
+        total = 0
+        for query in name_tokens:
+            best = 0
+            for word in words:
+                if word == query:
+                    best = max(best, 4 if word in last else 3)
+                elif word.startswith(query):
+                    best = max(best, 2)
+                elif query in word:
+                    best = max(best, 1)
+            if not best:
+                return 0
+            total += best
+        return total
+
+    def search(self, names=(), phone: str = None, dob_from: str = None,
+               dob_to: str = None, limit: int = 20) -> list:
+        # patients matching every given criterion, best matches first;
+        # returns [(score, Patient)]
+        names = [token for token in names if token]
+        # every criterion contributes posting lists that must all contain
+        # a match; the shortest one drives the scan and the others are
+        # probed with binary search
+        required = []
+        for token in names:
+            required.extend(self._name_postings(token))
+        if phone:
+            required.append(self._phones.get(phone, ()))
+        driver = min(required, key=len) if required else None
+        dob_keys = None
+        if dob_from:
+            lo = bisect.bisect_left(self._dob_keys, dob_from)
+            hi = bisect.bisect_right(self._dob_keys, dob_to or dob_from)
+            dob_keys = self._dob_keys[lo:hi]
+            if driver is None or sum(len(self._dobs[key])
+                                     for key in dob_keys) < len(driver):
+                driver = [pos for key in dob_keys for pos in self._dobs[key]]
+        if driver is None:
+            return []
+        contains = self._contains
+        candidates = [pos for pos in driver
+                      if all(other is driver or contains(other, pos)
+                             for other in required)]
+        if dob_keys is not None:
+            low, high = dob_from, dob_to or dob_from
+            candidates = [pos for pos in candidates
+                          if low <= self._patients[pos].dob <= high]
+        patients = self._patients
+        scored = []
+        for pos in candidates:
+            patient = patients[pos]
+            points = self.score(patient, names) if names else 1
+            if points:
+                scored.append((points, -pos, patient))
+        best = heapq.nlargest(limit, scored, key=lambda item: item[:2])
+        return [(points, patient) for points, _, patient in best]
 
 
 # -----------------------------------------------------------------------------
@@ -218,398 +1217,7083 @@ class Doctor(Person):
 # -----------------------------------------------------------------------------
 class Appointment:
     # define Appointment linking Patient + Doctor at date/time
+    __slots__ = ("appointment_id", "patient", "doctor", "at", "booked",
+                 "duration", "_status")
+
     def __init__(self,
                  appointment_id: str,
                  patient: Patient,
                  doctor: Doctor,
                  date: str,
-                 time: str):
+                 time: str,
+                 duration: int = SLOT_MINUTES):
         # store unique appointment ID
         self.appointment_id = appointment_id
         # reference Patient object
         self.patient = patient
         # reference Doctor object
         self.doctor = doctor
-        # store appointment date string
+        # store the slot as one int: minutes since 0001-01-01 00:00, which
+        # also sorts in date/time order
+        self.at = 0
         self.date = date
-        # store appointment time string
         self.time = time
+        # when the booking was made, in the same unit (0 = not recorded)
+        self.booked = 0
+        # length in minutes; the appointment holds [at, at + duration)
+        self.duration = duration
         # initial status set to "Scheduled"
-        self.status = "Scheduled"
+        self._status = "Scheduled"
+
+    @property
+    def date(self) -> str:
+        # appointment date as 'YYYY-MM-DD'
+        return datetime.date.fromordinal(self.at // 1440).isoformat()
+
+    @date.setter
+    def date(self, value: str) -> None:
+        if len(value) != 10:
+            raise ValueError(f"Invalid date '{value}'; use 'YYYY-MM-DD'.")
+        day = datetime.date.fromisoformat(value).toordinal()
+        self.at = day * 1440 + self.at % 1440
+
+    @property
+    def time(self) -> str:
+        # appointment time as 'HH:MM'
+        hour, minute = divmod(self.at % 1440, 60)
+        return f"{hour:02}:{minute:02}"
+
+    @time.setter
+    def time(self, value: str) -> None:
+        if len(value) != 5 or value[2] != ":":
+            raise ValueError(f"Invalid time '{value}'; use 'HH:MM'.")
+        hour, minute = int(value[:2]), int(value[3:])
+        if not (0 <= hour < 24 and 0 <= minute < 60):
+            raise ValueError(f"Invalid time '{value}'; use 'HH:MM'.")
+        self.at = self.at - self.at % 1440 + hour * 60 + minute
+
+    @property
+    def end(self) -> int:
+        # first minute after the appointment (same unit as at)
+        return self.at + self.duration
+
+    @property
+    def status(self) -> str:
+        return self._status
+
+    @status.setter
+    def status(self, value: str) -> None:
+        # statuses read back from storage share the interned constants
+        self._status = _intern(value)
+
+    def record(self) -> list:
+        # JSON-ready form for snapshots and the archive
+        return [self.appointment_id, self.patient.patient_id,
+                self.doctor.doctor_id, self.date, self.time, self._status,
+                self.booked, self.duration]
+
+    def copy(self) -> "Appointment":
+        # a detached copy (same patient and doctor objects)
+        other = Appointment.__new__(Appointment)
+        for name in Appointment.__slots__:
+            setattr(other, name, getattr(self, name))
+        return other
 
     def confirm(self) -> None:
         # mark this appointment as confirmed
-        self.status = "Confirmed"
+        self._status = "Confirmed"
 
     def cancel(self) -> None:
         # mark this appointment as canceled
-        self.status = "Canceled"
+        self._status = "Canceled"
 
 
 # -----------------------------------------------------------------------------
-# Core System / Class Hospital System
+# Errors
 # -----------------------------------------------------------------------------
-class HospitalSystem:
-    # manage collections of patients, doctors, appointments
+class BookingError(ValueError):
+    # raised when a booking or cancellation request is rejected
+    pass
+
+
+def check_duration(duration: int) -> int:
+    # appointment lengths are whole SLOT_MINUTES steps up to MAX_DURATION
+    if (not isinstance(duration, int) or isinstance(duration, bool)
+            or duration <= 0 or duration % SLOT_MINUTES
+            or duration > MAX_DURATION):
+        raise BookingError(f"Duration must be a multiple of {SLOT_MINUTES} "
+                           f"minutes, at most {MAX_DURATION}.")
+    return duration
+
+
+# -----------------------------------------------------------------------------
+# Class: IntervalIndex
+# -----------------------------------------------------------------------------
+class IntervalIndex:
+    # [start, end) intervals (in minutes) ordered by start, as parallel
+    # int arrays plus the items they belong to. No interval is longer
+    # than `longest`, so everything overlapping [lo, hi) starts in
+    # (lo - longest, hi): overlap queries are two binary searches plus
+    # the few candidates in between, O(log n + k)
+    __slots__ = ("_starts", "_ends", "_items", "longest")
+
     def __init__(self):
-        # dictionary patient_id -> Patient instance
-        self.patients = {}
-        # dictionary doctor_id  -> Doctor instance
-        self.doctors = {}
-        # dictionary appointment_id -> Appointment instance
-        self.appointments = {}
-        # counters for auto-generating IDs
-        self._pcounter = 0
-        self._dcounter = 0
-        self._acounter = 0
+        self._starts = array.array("q")
+        self._ends = array.array("q")
+        self._items = []
+        self.longest = 0
 
-    def _generate_id(self, prefix: str) -> str:
-        # generate zero-padded IDs based on prefix
-        if prefix == "P":
-            self._pcounter += 1
-            return f"P{self._pcounter:03}"
-        if prefix == "D":
-            self._dcounter += 1
-            return f"D{self._dcounter:03}"
-        if prefix == "A":
-            self._acounter += 1
-            return f"A{self._acounter:03}"
-        # error if unknown prefix supplied
-        raise ValueError("Unknown ID prefix")
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def add(self, start: int, end: int, item) -> None:
+        i = bisect.bisect_right(self._starts, start)
+        self._starts.insert(i, start)
+        self._ends.insert(i, end)
+        self._items.insert(i, item)
+        if end - start > self.longest:
+            self.longest = end - start
+
+    def remove(self, start: int, item) -> None:
+        # drop item's interval (longest is kept: it stays an upper bound)
+        i = bisect.bisect_left(self._starts, start)
+        while i < len(self._starts) and self._starts[i] == start:
+            if self._items[i] is item:
+                del self._starts[i], self._ends[i], self._items[i]
+                return
+            i += 1
+
+    def overlapping(self, lo: int, hi: int):
+        # yield items whose interval overlaps [lo, hi), by start
+        ends, items = self._ends, self._items
+        for k in range(bisect.bisect_right(self._starts, lo - self.longest),
+                       bisect.bisect_left(self._starts, hi)):
+            if ends[k] > lo:
+                yield items[k]
+
+    def overlaps(self, lo: int, hi: int) -> bool:
+        for _ in self.overlapping(lo, hi):
+            return True
+        return False
+
+
+# -----------------------------------------------------------------------------
+# Class: AppointmentIndex
+# -----------------------------------------------------------------------------
+class AppointmentIndex:
+    # secondary indexes over HospitalSystem.appointments, kept up to date
+    # by booking and cancellation:
+    #   by date (plus a sorted list of distinct dates for ranges),
+    #   by doctor_id, by patient_id and by status -> {appointment_id: appt}
+    # plus the time spans of confirmed appointments per doctor and per
+    # patient (IntervalIndex), for overlap checks
+    def __init__(self):
+        self._by_date = {}
+        self._dates = []
+        self._by_doctor = {}
+        self._by_patient = {}
+        self._by_status = {}
+        self._doctor_spans = {}
+        self._patient_spans = {}
+
+    def _spans(self, appt: "Appointment"):
+        # the doctor's and the patient's IntervalIndex for appt
+        found = []
+        for spans, key in ((self._doctor_spans, appt.doctor.doctor_id),
+                           (self._patient_spans, appt.patient.patient_id)):
+            index = spans.get(key)
+            if index is None:
+                index = spans[key] = IntervalIndex()
+            found.append(index)
+        return found
+
+    def _add_span(self, appt: "Appointment") -> None:
+        for spans in self._spans(appt):
+            spans.add(appt.at, appt.at + appt.duration, appt)
+
+    def _remove_span(self, appt: "Appointment") -> None:
+        for spans in self._spans(appt):
+            spans.remove(appt.at, appt)
+
+    def add(self, appt: "Appointment") -> None:
+        # index a new appointment
+        aid = appt.appointment_id
+        if appt.date not in self._by_date:
+            self._by_date[appt.date] = {}
+            bisect.insort(self._dates, appt.date)
+        self._by_date[appt.date][aid] = appt
+        self._by_doctor.setdefault(appt.doctor.doctor_id, {})[aid] = appt
+        self._by_patient.setdefault(appt.patient.patient_id, {})[aid] = appt
+        self._by_status.setdefault(appt.status, {})[aid] = appt
+        if appt.status == "Confirmed":
+            self._add_span(appt)
+
+    def remove(self, appt: "Appointment") -> None:
+        # drop an appointment from every index
+        aid = appt.appointment_id
+        if appt.status == "Confirmed":
+            self._remove_span(appt)
+        for index, key in ((self._by_date, appt.date),
+                           (self._by_doctor, appt.doctor.doctor_id),
+                           (self._by_patient, appt.patient.patient_id),
+                           (self._by_status, appt.status)):
+            index.get(key, {}).pop(aid, None)
+
+    def status_changed(self, appt: "Appointment", old: str) -> None:
+        # move an appointment between status buckets
+        self._by_status.get(old, {}).pop(appt.appointment_id, None)
+        self._by_status.setdefault(appt.status, {})[appt.appointment_id] = appt
+        if old == "Confirmed":
+            self._remove_span(appt)
+        elif appt.status == "Confirmed":
+            self._add_span(appt)
+
+    def overlapping(self, start: int, end: int, doctor_id: str = None,
+                    patient_id: str = None):
+        # confirmed appointments of a doctor or a patient overlapping the
+        # minutes [start, end), ordered by start
+        spans = (self._doctor_spans.get(doctor_id) if doctor_id
+                 else self._patient_spans.get(patient_id))
+        return iter(()) if spans is None else spans.overlapping(start, end)
+
+    def query(self, date_from: str = None, date_to: str = None,
+              status: str = None, doctor_id: str = None,
+              patient_id: str = None):
+        # yield matching appointments ordered by date and time, touching
+        # only the smallest matching index bucket; dates are inclusive
+        buckets = []
+        if doctor_id:
+            buckets.append(self._by_doctor.get(doctor_id, {}))
+        if patient_id:
+            buckets.append(self._by_patient.get(patient_id, {}))
+        if status:
+            buckets.append(self._by_status.get(status, {}))
+        lo = 0 if not date_from else bisect.bisect_left(self._dates, date_from)
+        hi = (len(self._dates) if not date_to
+              else bisect.bisect_right(self._dates, date_to))
+        dates = self._dates[lo:hi]
+        dated = date_from or date_to
+        smallest = min(buckets, key=len) if buckets else None
+        if smallest is not None and (not dated or len(smallest) <=
+                                     sum(len(self._by_date[d]) for d in dates)):
+            # drive from the smallest bucket, then sort the (few) matches
+            others = [b for b in buckets if b is not smallest]
+            if not dates:
+                return
+            # the range as Appointment.at bounds, from the first and last
+            # booked dates inside it
+            low = datetime.date.fromisoformat(dates[0]).toordinal() * 1440
+            high = (datetime.date.fromisoformat(dates[-1]).toordinal() + 1) * 1440
+            found = [appt for aid, appt in smallest.items()
+                     if low <= appt.at < high
+                     and all(aid in other for other in others)]
+            found.sort(key=lambda a: (a.at, a.appointment_id))
+            yield from found
+            return
+        # drive from the date index: one day at a time, in order
+        for date in dates:
+            day = [appt for aid, appt in self._by_date[date].items()
+                   if all(aid in bucket for bucket in buckets)]
+            day.sort(key=lambda a: (a.at, a.appointment_id))
+            yield from day
+
+
+# -----------------------------------------------------------------------------
+# Class: AppointmentColumns
+# -----------------------------------------------------------------------------
+class AppointmentColumns:
+    # column-per-field copy of HospitalSystem.appointments for aggregate
+    # queries, one row per appointment in booking order:
+    #   patient, doctor : array('I') codes into patient_ids / doctor_ids
+    #   at              : array('q') Appointment.at (minutes since 0001-01-01)
+    #   status          : array('B') index into STATUSES (REMOVED once a
+    #                     batch rollback has undone the booking)
+    #   billed          : array('d') total of the last bill issued
+    #   booked          : array('q') Appointment.booked (0 = unknown)
+    # with NumPy installed the aggregates run on NumPy copies of the
+    # arrays; otherwise they are single passes over the arrays in Python
+    STATUSES = ("Scheduled", "Confirmed", "Canceled")
+    REMOVED = 255
+
+    def __init__(self, appointments=()):
+        self.patient = array.array("I")
+        self.doctor = array.array("I")
+        self.at = array.array("q")
+        self.status = array.array("B")
+        self.billed = array.array("d")
+        self.booked = array.array("q")
+        # code -> ID, and ID -> code
+        self.patient_ids, self._patient_codes = [], {}
+        self.doctor_ids, self._doctor_codes = [], {}
+        # appointment ID -> row
+        self._rows = {}
+        self._status_codes = {s: i for i, s in enumerate(self.STATUSES)}
+        for appt in appointments:
+            self.add(appt)
+
+    def __len__(self) -> int:
+        # number of live appointments
+        return len(self._rows)
+
+    @staticmethod
+    def _code(codes: dict, ids: list, key: str) -> int:
+        # small-int code for an ID, assigned on first sight
+        code = codes.get(key)
+        if code is None:
+            code = codes[key] = len(ids)
+            ids.append(key)
+        return code
+
+    def add(self, appt: "Appointment") -> None:
+        # append a row for a new appointment
+        self.add_row(appt.appointment_id, appt.patient.patient_id,
+                     appt.doctor.doctor_id, appt.at, appt.status, appt.booked)
+
+    def add_row(self, appointment_id: str, patient_id: str, doctor_id: str,
+                at: int, status: str, booked: int = 0) -> None:
+        # append a row from plain values (e.g. straight from SQL); all
+        # columns or none (an append fails if someone holds a buffer)
+        row = len(self.at)
+        values = ((self.patient, self._code(self._patient_codes,
+                                            self.patient_ids, patient_id)),
+                  (self.doctor, self._code(self._doctor_codes,
+                                           self.doctor_ids, doctor_id)),
+                  (self.at, at), (self.status, self._status_codes[status]),
+                  (self.billed, 0.0), (self.booked, booked))
+        try:
+            for column, value in values:
+                column.append(value)
+        except BaseException:
+            for column, _ in values:
+                del column[row:]
+            raise
+        self._rows[appointment_id] = row
+
+    def remove(self, appt: "Appointment") -> None:
+        # drop an undone booking: rollbacks undo the newest rows first, so
+        # the row is normally the last one and is popped outright
+        row = self._rows.pop(appt.appointment_id)
+        if row == len(self.at) - 1:
+            for column in (self.patient, self.doctor, self.at, self.status,
+                           self.billed, self.booked):
+                column.pop()
+        else:
+            self.status[row] = self.REMOVED
+
+    def status_changed(self, appt: "Appointment", old: str = None) -> None:
+        # copy the appointment's new status into its row
+        self.status[self._rows[appt.appointment_id]] = (
+            self._status_codes[appt.status])
+
+    def set_billed(self, appointment_id: str, amount: float) -> None:
+        # record the total of the bill just issued for an appointment
+        self.billed[self._rows[appointment_id]] = amount
+
+    @staticmethod
+    def _view(column: array.array):
+        # read-only NumPy array over a copy of an array.array column. The
+        # copy is one memcpy into immutable bytes: a view over the column
+        # itself would export its buffer, and while any such view was
+        # alive every append (i.e. every booking) would fail
+        return numpy.frombuffer(column.tobytes(), dtype=column.typecode)
+
+    @staticmethod
+    def _bounds(date_from: str = None, date_to: str = None) -> tuple:
+        # inclusive 'YYYY-MM-DD' range as [low, high) bounds on 'at'
+        low = (datetime.date.fromisoformat(date_from).toordinal() * 1440
+               if date_from else 0)
+        high = ((datetime.date.fromisoformat(date_to).toordinal() + 1) * 1440
+                if date_to else 1 << 62)
+        return low, high
+
+    def daily_counts(self, date_from: str = None, date_to: str = None,
+                     status: str = None) -> dict:
+        # {(doctor_id, 'YYYY-MM-DD'): appointments} per doctor per day,
+        # optionally for one status and an inclusive date range
+        low, high = self._bounds(date_from, date_to)
+        code = self._status_codes.get(status) if status else None
+        if status and code is None:
+            return {}
+        day_text = lambda day: datetime.date.fromordinal(day).isoformat()
+        if numpy is None:
+            counts = collections.Counter(
+                (doctor, at // 1440)
+                for doctor, at, st in zip(self.doctor, self.at, self.status)
+                if low <= at < high
+                and (st == code if code is not None else st != self.REMOVED))
+            return {(self.doctor_ids[doctor], day_text(day)): n
+                    for (doctor, day), n in sorted(counts.items())}
+        at, st = self._view(self.at), self._view(self.status)
+        mask = (at >= low) & (at < high)
+        mask &= (st == code) if code is not None else (st != self.REMOVED)
+        days = at[mask] // 1440
+        if not len(days):
+            return {}
+        first = int(days.min())
+        span = int(days.max()) - first + 1
+        keys = (self._view(self.doctor)[mask].astype(numpy.int64) * span
+                + (days - first))
+        groups, counts = numpy.unique(keys, return_counts=True)
+        return {(self.doctor_ids[int(key) // span],
+                 day_text(first + int(key) % span)): int(n)
+                for key, n in zip(groups, counts)}
+
+    def _per_doctor(self, weights=None) -> list:
+        # [(live appointments, canceled, sum of weights)] per doctor code
+        n = len(self.doctor_ids)
+        canceled_code = self._status_codes["Canceled"]
+        if numpy is None:
+            totals, canceled, summed = [0] * n, [0] * n, [0.0] * n
+            for i, (doctor, st) in enumerate(zip(self.doctor, self.status)):
+                if st == self.REMOVED:
+                    continue
+                totals[doctor] += 1
+                if st == canceled_code:
+                    canceled[doctor] += 1
+                if weights is not None:
+                    summed[doctor] += weights[i]
+            return list(zip(totals, canceled, summed))
+        doctor, st = self._view(self.doctor), self._view(self.status)
+        live = st != self.REMOVED
+        totals = numpy.bincount(doctor[live], minlength=n)
+        canceled = numpy.bincount(doctor[st == canceled_code], minlength=n)
+        summed = (numpy.bincount(doctor[live], self._view(weights)[live],
+                                 minlength=n)
+                  if weights is not None else numpy.zeros(n))
+        return list(zip(totals.tolist(), canceled.tolist(), summed.tolist()))
+
+    def cancellation_rates(self) -> dict:
+        # {doctor_id: share of that doctor's appointments that are canceled}
+        return {self.doctor_ids[code]: canceled / total
+                for code, (total, canceled, _) in enumerate(self._per_doctor())
+                if total}
+
+    def billed_totals(self) -> dict:
+        # {doctor_id: total billed} for doctors with any bills
+        return {self.doctor_ids[code]: amount
+                for code, (_, _, amount)
+                in enumerate(self._per_doctor(self.billed)) if amount}
+
+    def span(self) -> tuple:
+        # ('YYYY-MM-DD', 'YYYY-MM-DD') of the earliest and latest live
+        # appointments, or (None, None) when there are none
+        live = [at for at, st in zip(self.at, self.status)
+                if st != self.REMOVED] if numpy is None else (
+            self._view(self.at)[self._view(self.status) != self.REMOVED])
+        if not len(live):
+            return None, None
+        return (datetime.date.fromordinal(int(min(live)) // 1440).isoformat(),
+                datetime.date.fromordinal(int(max(live)) // 1440).isoformat())
+
+    def operations(self, date_from: str = None, date_to: str = None,
+                   group_of: dict = None) -> dict:
+        # one pass over the appointments in [date_from, date_to]:
+        #   "doctor" / "group" : {key: (confirmed, canceled, mean lead days,
+        #                        median lead days)}, where groups come from
+        #                        group_of (doctor_id -> e.g. speciality)
+        #   "hours"            : {(weekday, hour): confirmed appointments}
+        # lead time is booking to appointment, over every appointment that
+        # carries a booking stamp (None when no appointment does)
+        low, high = self._bounds(date_from, date_to)
+        group_of = group_of or {}
+        groups = sorted(set(group_of.values()))
+        group_code = {name: n for n, name in enumerate(groups)}
+        # doctor code -> group code (the last code: no group)
+        lookup = [group_code.get(group_of.get(did), len(groups))
+                  for did in self.doctor_ids]
+        confirmed_code = self._status_codes["Confirmed"]
+        canceled_code = self._status_codes["Canceled"]
+        n_doctors, n_groups = len(self.doctor_ids), len(groups) + 1
+        if numpy is None:
+            stats = [[[0, 0, []] for _ in range(n)]
+                     for n in (n_doctors, n_groups)]
+            hours = collections.Counter()
+            for doctor, at, st, booked in zip(self.doctor, self.at,
+                                              self.status, self.booked):
+                if not low <= at < high or st == self.REMOVED:
+                    continue
+                for table, key in zip(stats, (doctor, lookup[doctor])):
+                    row = table[key]
+                    if st == confirmed_code:
+                        row[0] += 1
+                    elif st == canceled_code:
+                        row[1] += 1
+                    if booked:
+                        row[2].append((at - booked) / 1440)
+                if st == confirmed_code:
+                    # ordinal 1 (0001-01-01) was a Monday
+                    hours[(at // 1440 + 6) % 7, at % 1440 // 60] += 1
+
+            def summary(row):
+                leads = sorted(row[2])
+                if not leads:
+                    return row[0], row[1], None, None
+                mid = len(leads) // 2
+                median = (leads[mid] if len(leads) % 2
+                          else (leads[mid - 1] + leads[mid]) / 2)
+                return row[0], row[1], sum(leads) / len(leads), median
+
+            doctors, by_group = ([summary(row) for row in table]
+                                 for table in stats)
+        else:
+            at, st = self._view(self.at), self._view(self.status)
+            mask = (at >= low) & (at < high) & (st != self.REMOVED)
+            at, st = at[mask], st[mask]
+            doctor = self._view(self.doctor)[mask].astype(numpy.int64)
+            booked = self._view(self.booked)[mask]
+            group = numpy.array(lookup, dtype=numpy.int64)[doctor]
+            known = booked > 0
+            # lead times in whole minutes, shifted to be non-negative
+            leads = at[known] - booked[known]
+            shift = int(leads.min()) if len(leads) else 0
+            leads -= shift
+            spread = int(leads.max()) + 1 if len(leads) else 1
+
+            def summarise(keys, n):
+                # counts, mean and median lead per key, all vectorised
+                confirmed = numpy.bincount(keys[st == confirmed_code],
+                                           minlength=n)
+                canceled = numpy.bincount(keys[st == canceled_code],
+                                          minlength=n)
+                lead_keys = keys[known]
+                counts = numpy.bincount(lead_keys, minlength=n)
+                sums = numpy.bincount(lead_keys, leads, minlength=n)
+                # one integer sort orders the leads within each key
+                ordered = numpy.sort(lead_keys * spread + leads) % spread
+                starts = numpy.cumsum(counts) - counts
+                has = counts > 0
+                lo = (starts + (counts - 1) // 2)[has]
+                hi = (starts + counts // 2)[has]
+                medians = numpy.full(n, numpy.nan)
+                medians[has] = ((ordered[lo] + ordered[hi]) / 2 + shift) / 1440
+                means = numpy.full(n, numpy.nan)
+                means[has] = (sums[has] / counts[has] + shift) / 1440
+                return [(c, x, None if m != m else m, None if d != d else d)
+                        for c, x, m, d in zip(confirmed.tolist(),
+                                              canceled.tolist(),
+                                              means.tolist(),
+                                              medians.tolist())]
+
+            doctors = summarise(doctor, n_doctors)
+            by_group = summarise(group, n_groups)
+            ok = at[st == confirmed_code]
+            slots = numpy.bincount((ok // 1440 + 6) % 7 * 24
+                                   + ok % 1440 // 60, minlength=7 * 24)
+            hours = {divmod(k, 24): int(n)
+                     for k, n in enumerate(slots.tolist()) if n}
+        return {"doctor": dict(zip(self.doctor_ids, doctors)),
+                "group": dict(zip(groups, by_group)),
+                "hours": dict(hours)}
+
+
+# -----------------------------------------------------------------------------
+# Class: BatchReport
+# -----------------------------------------------------------------------------
+class BatchReport:
+    # per-row outcome of HospitalSystem.book_batch
+    def __init__(self, total: int):
+        # number of rows submitted
+        self.total = total
+        # True once every row has been booked
+        self.applied = False
+        # row number -> rejection reason
+        self.rejections = {}
+        # appointment IDs, in row order, when applied
+        self.appointment_ids = []
+
+    @property
+    def rejected(self) -> int:
+        return len(self.rejections)
+
+    def reject(self, number: int, reason: str) -> None:
+        # record why a row failed validation
+        self.rejections[number] = reason
+
+    def errors(self) -> list:
+        # (row number, reason) pairs in row order
+        return sorted(self.rejections.items())
+
+    def outcomes(self):
+        # yield one dict per row: booked ID, rejection, or skipped
+        for number in range(1, self.total + 1):
+            if self.applied:
+                yield {"row": number, "status": "booked",
+                       "appointment_id": self.appointment_ids[number - 1]}
+            elif number in self.rejections:
+                yield {"row": number, "status": "rejected",
+                       "error": self.rejections[number]}
+            else:
+                yield {"row": number, "status": "not applied",
+                       "error": "batch rejected because of other rows"}
+
+
+class BatchRejected(BookingError):
+    # raised where a rejected batch is a failed request (the "book_batch"
+    # command); report says which rows failed and why
+    def __init__(self, report: BatchReport):
+        super().__init__("batch rejected")
+        self.report = report
+
+
+# -----------------------------------------------------------------------------
+# Class: WaitingList (refilling cancelled slots)
+# -----------------------------------------------------------------------------
+# urgency levels accepted on the waiting list (higher = seen sooner)
+WAITLIST_URGENCIES = range(1, 6)
+
+
+class WaitlistEntry:
+    # one patient waiting for a slot with a doctor or in a speciality
+    __slots__ = ("entry_id", "patient_id", "doctor_id", "speciality",
+                 "urgency", "joined", "earliest", "latest", "status",
+                 "appointment_id", "vacated")
+
+    def __init__(self, entry_id: str, patient_id: str, doctor_id: str,
+                 speciality: str, urgency: int, joined: int,
+                 earliest: str = None, latest: str = None):
+        self.entry_id = entry_id
+        self.patient_id = patient_id
+        # exactly one of doctor_id / speciality is set
+        self.doctor_id = doctor_id
+        self.speciality = speciality
+        self.urgency = urgency
+        # minutes since 0001-01-01, like Appointment.booked
+        self.joined = joined
+        # acceptable appointment dates, inclusive 'YYYY-MM-DD' (None = open)
+        self.earliest = earliest
+        self.latest = latest
+        # Waiting -> Booked (appointment_id took the slot vacated by
+        # the cancelled appointment 'vacated') or Removed
+        self.status = "Waiting"
+        self.appointment_id = None
+        self.vacated = None
+
+    def key(self) -> tuple:
+        # priority order: most urgent first, then longest waiting
+        return (-self.urgency, self.joined, int(self.entry_id[1:]))
+
+    def accepts(self, date: str) -> bool:
+        # True if an appointment on date falls inside the patient's window
+        return ((self.earliest is None or self.earliest <= date) and
+                (self.latest is None or date <= self.latest))
+
+    def record(self) -> list:
+        # JSON-ready row (constructor arguments, then the outcome)
+        return [self.entry_id, self.patient_id, self.doctor_id,
+                self.speciality, self.urgency, self.joined, self.earliest,
+                self.latest, self.status, self.appointment_id, self.vacated]
+
+
+class WaitingList:
+    # per-doctor and per-speciality priority queues of waiting patients.
+    # Each queue is split by date window: entries with the same (earliest,
+    # latest) share a heap of (entry.key(), entry), so a heap either
+    # accepts a freed slot's date as a whole or is skipped without being
+    # touched. Entries that leave or are booked stay in their heap and are
+    # dropped when they reach the top, so joining, leaving and taking the
+    # best entry are O(log n) per window. Only entries whose patient is
+    # busy at the freed slot's time are set aside and pushed back
+    def __init__(self):
+        # entry_id -> WaitlistEntry (including booked/removed history)
+        self.entries = {}
+        # ("D", doctor_id) / ("S", speciality key) ->
+        #     {(earliest, latest): heap}
+        self._queues = {}
+        # cancelled appointment_id -> the entry booked into its slot
+        self.filled = {}
+        self.waiting = 0
+
+    @staticmethod
+    def scope(doctor_id: str = None, speciality: str = None) -> tuple:
+        # queue key for a doctor or a speciality
+        if doctor_id:
+            return ("D", doctor_id)
+        return ("S", SpecialityIndex.normalise(speciality))
+
+    def __len__(self) -> int:
+        # number of patients still waiting
+        return self.waiting
+
+    def add(self, entry: WaitlistEntry) -> None:
+        # register an entry; waiting entries join their queue
+        self.entries[entry.entry_id] = entry
+        if entry.status == "Waiting":
+            windows = self._queues.setdefault(
+                self.scope(entry.doctor_id, entry.speciality), {})
+            heapq.heappush(windows.setdefault(
+                (entry.earliest, entry.latest), []), (entry.key(), entry))
+            self.waiting += 1
+        elif entry.status == "Booked":
+            self.filled[entry.vacated] = entry
+
+    def remove(self, entry: WaitlistEntry) -> None:
+        # take a waiting entry off its queue (lazily)
+        entry.status = "Removed"
+        self.waiting -= 1
+
+    def fulfil(self, entry: WaitlistEntry, appointment_id: str,
+               vacated: str) -> None:
+        # record that entry was booked into the slot of vacated
+        entry.status = "Booked"
+        entry.appointment_id = appointment_id
+        entry.vacated = vacated
+        self.filled[vacated] = entry
+        self.waiting -= 1
+
+    @staticmethod
+    def _top(heap: list, busy=None, bound: tuple = None):
+        # best waiting (key, entry) in heap whose patient is not
+        # busy(patient_id), or None; entries keyed after bound (the best
+        # found so far elsewhere) are never checked
+        skipped = []
+        found = None
+        while heap:
+            item = heap[0]
+            if item[1].status != "Waiting":
+                # booked or removed since it was queued
+                heapq.heappop(heap)
+            elif bound is not None and bound < item[0]:
+                break
+            elif busy and busy(item[1].patient_id):
+                skipped.append(heapq.heappop(heap))
+            else:
+                found = item
+                break
+        for item in skipped:
+            heapq.heappush(heap, item)
+        return found
+
+    def best_for(self, doctor: "Doctor", date: str, busy=None):
+        # the entry that should get doctor's freed slot on date: the best
+        # of the doctor's own windows and the speciality's windows that
+        # accept date (or None)
+        best = None
+        for scope in (("D", doctor.doctor_id),
+                      self.scope(speciality=doctor.speciality)):
+            windows = self._queues.get(scope)
+            if not windows:
+                continue
+            emptied = []
+            for window, heap in windows.items():
+                earliest, latest = window
+                if ((earliest is not None and date < earliest)
+                        or (latest is not None and latest < date)):
+                    continue
+                item = self._top(heap, busy, best and best[0])
+                if not heap:
+                    # every entry has been booked or has left
+                    emptied.append(window)
+                elif item is not None:
+                    best = item
+            for window in emptied:
+                del windows[window]
+        return None if best is None else best[1]
+
+    def queue(self, doctor_id: str = None, speciality: str = None) -> list:
+        # waiting entries for one doctor or speciality, in priority order
+        windows = self._queues.get(self.scope(doctor_id, speciality), {})
+        return sorted((entry for heap in windows.values()
+                       for _, entry in heap if entry.status == "Waiting"),
+                      key=WaitlistEntry.key)
+
+
+# -----------------------------------------------------------------------------
+# Billing: Fee Catalogue, Invoices & Revenue
+# -----------------------------------------------------------------------------
+class FeeCatalogue:
+    # priced services, keyed case/whitespace-insensitively; the
+    # consultation fee is the entry every invoice starts with
+    CONSULTATION = "Consultation Fee"
+
+    def __init__(self):
+        # normalised name -> (display name, fee in JMD$)
+        self._fees = {}
+        self.set(self.CONSULTATION, CONSULTATION_FEE)
+
+    @staticmethod
+    def normalise(service: str) -> str:
+        return " ".join(service.lower().split())
+
+    @staticmethod
+    def check_fee(service: str, fee) -> int:
+        # fees are whole JMD$ amounts
+        if not isinstance(fee, int) or isinstance(fee, bool) or fee < 0:
+            raise ValueError(f"fee for {service!r} must be a whole number")
+        return fee
+
+    def set(self, service: str, fee: int) -> None:
+        # add or re-price a service (re-pricing keeps the listed name)
+        service = " ".join(str(service).split())
+        if not service:
+            raise ValueError("service: required")
+        key = self.normalise(service)
+        if key in self._fees:
+            service = self._fees[key][0]
+        self._fees[key] = (service, self.check_fee(service, fee))
+
+    def get(self, service: str):
+        # (display name, fee) of a catalogue service, or None
+        return self._fees.get(self.normalise(service))
+
+    def __iter__(self):
+        # (name, fee) pairs sorted by name
+        return iter(sorted(self._fees.values()))
+
+    def items(self, extras=()) -> list:
+        # bill lines: the consultation fee, then each extra, given either
+        # as a catalogue service name or an ad-hoc (service, fee) pair
+        lines = [self.get(self.CONSULTATION)]
+        for extra in extras:
+            if isinstance(extra, str):
+                line = self.get(extra)
+                if line is None:
+                    raise ValueError(f"unknown service {extra!r}")
+            else:
+                service, fee = extra
+                line = (str(service), self.check_fee(service, fee))
+            lines.append(line)
+        return lines
+
+
+class Invoice:
+    # a stored bill: one per appointment, never changed once issued
+    __slots__ = ("invoice_id", "appointment_id", "doctor_id", "date",
+                 "issued", "items")
+
+    def __init__(self, invoice_id: str, appointment_id: str, doctor_id: str,
+                 date: str, issued: str, items):
+        self.invoice_id = invoice_id
+        self.appointment_id = appointment_id
+        # the doctor and service date are kept so roll-ups need no
+        # appointment lookups
+        self.doctor_id = doctor_id
+        self.date = date
+        self.issued = issued
+        self.items = tuple((service, fee) for service, fee in items)
+
+    @classmethod
+    def for_appointment(cls, invoice_id: str, appt: "Appointment",
+                        issued: str, items):
+        return cls(invoice_id, appt.appointment_id, appt.doctor.doctor_id,
+                   appt.date, issued, items)
+
+    @property
+    def total(self) -> int:
+        return sum(fee for _, fee in self.items)
+
+    def record(self) -> list:
+        # JSON-ready form for the journal/snapshot
+        return [self.invoice_id, self.appointment_id, self.issued,
+                [list(item) for item in self.items]]
+
+
+class RevenueLedger:
+    # revenue roll-ups kept up to date as invoices are issued, so reports
+    # never re-scan the invoices:
+    #   _totals : dimension -> Counter of all-time totals
+    #   _days   : sorted service dates, with _cells[day] a Counter of
+    #             (doctor_id, service) -> amount for date-range reports
+    DIMENSIONS = ("doctor", "day", "service")
+
+    def __init__(self):
+        self._totals = {by: collections.Counter() for by in self.DIMENSIONS}
+        self._days = []
+        self._cells = {}
+
+    def add(self, invoice: Invoice) -> None:
+        day = invoice.date
+        cells = self._cells.get(day)
+        if cells is None:
+            cells = self._cells[day] = collections.Counter()
+            bisect.insort(self._days, day)
+        totals = self._totals
+        for service, fee in invoice.items:
+            cells[invoice.doctor_id, service] += fee
+            totals["service"][service] += fee
+        totals["doctor"][invoice.doctor_id] += invoice.total
+        totals["day"][day] += invoice.total
+
+    def revenue(self, by: str = "doctor", date_from: str = None,
+                date_to: str = None) -> dict:
+        # {key: revenue} per doctor_id, service date or service name,
+        # optionally for service dates in [date_from, date_to]
+        if by not in self.DIMENSIONS:
+            raise ValueError(f"by: one of {', '.join(self.DIMENSIONS)}")
+        if date_from is None and date_to is None:
+            return dict(self._totals[by])
+        days = self._days
+        lo = 0 if date_from is None else bisect.bisect_left(days, date_from)
+        hi = (len(days) if date_to is None
+              else bisect.bisect_right(days, date_to))
+        result = collections.Counter()
+        for day in days[lo:hi]:
+            if by == "day":
+                result[day] = self._totals["day"][day]
+                continue
+            k = 0 if by == "doctor" else 1
+            for key, amount in self._cells[day].items():
+                result[key[k]] += amount
+        return dict(result)
+
+
+# -----------------------------------------------------------------------------
+# Operations Report (utilisation, lead times, cancellations, busy hours)
+# -----------------------------------------------------------------------------
+class OperationsReport:
+    # per-doctor and per-speciality figures for one date range:
+    #   booked       : confirmed appointments
+    #   free         : free slots left in the doctors' schedules
+    #   utilisation  : booked / (booked + free)
+    #   cancel_rate  : canceled / (booked + canceled)
+    #   lead days    : mean/median days from booking to appointment
+    # plus confirmed appointments per (weekday, hour) for the busiest hours
+    COLUMNS = ("level", "name", "speciality", "booked", "free",
+               "utilisation", "canceled", "cancel_rate", "lead_mean_days",
+               "lead_median_days")
+
+    def __init__(self, date_from: str, date_to: str, group_of: dict,
+                 stats: dict, free: dict):
+        self.date_from, self.date_to = date_from, date_to
+        self.hours = stats["hours"]
+        self.rows = []
+        free_by_group = collections.Counter()
+        for did in sorted(group_of):
+            free_by_group[group_of[did]] += free.get(did, 0)
+            self.rows.append(self._row("doctor", did, group_of[did],
+                                       stats["doctor"].get(did),
+                                       free.get(did, 0)))
+        for name in sorted(free_by_group):
+            self.rows.append(self._row("speciality", name, name,
+                                       stats["group"].get(name),
+                                       free_by_group[name]))
+
+    @staticmethod
+    def _row(level: str, name: str, speciality: str, stat, free: int):
+        booked, canceled, mean, median = stat or (0, 0, None, None)
+        capacity, made = booked + free, booked + canceled
+        return (level, name, speciality, booked, free,
+                booked / capacity if capacity else None, canceled,
+                canceled / made if made else None, mean, median)
+
+    def busiest(self, top: int = 5) -> list:
+        # [('Mon 10:00', confirmed appointments)], busiest first
+        ranked = sorted(self.hours.items(), key=lambda kv: (-kv[1], kv[0]))
+        return [(f"{WEEKDAYS[day]} {hour:02}:00", n)
+                for (day, hour), n in ranked[:top]]
+
+    def render(self, top: int = 5) -> str:
+        # formatted tables for the terminal
+        def pct(value):
+            return "-" if value is None else f"{value:.1%}"
+
+        def days(value):
+            return "-" if value is None else f"{value:.1f}"
+
+        lines = [f"Operations report {self.date_from} to {self.date_to}"]
+        for level, title in (("doctor", "Doctor"),
+                             ("speciality", "Speciality")):
+            lines.append("")
+            lines.append(f"{title:<20}{'Booked':>8}{'Free':>8}{'Util.':>8}"
+                         f"{'Canc.':>7}{'Canc.%':>8}{'Lead':>7}{'Median':>8}")
+            for row in self.rows:
+                if row[0] != level:
+                    continue
+                name = row[1] if level == "speciality" else f"{row[1]} {row[2]}"
+                lines.append(f"{name[:19]:<20}{row[3]:>8,}{row[4]:>8,}"
+                             f"{pct(row[5]):>8}{row[6]:>7,}{pct(row[7]):>8}"
+                             f"{days(row[8]):>7}{days(row[9]):>8}")
+        lines.append("")
+        lines.append("Busiest hours (confirmed appointments):")
+        for label, n in self.busiest(top) or [("none", 0)]:
+            lines.append(f"  • {label:<12}{n:>8,}")
+        return "\n".join(lines) + "\n"
+
+    def write_csv(self, f, top: int = 5) -> None:
+        # one row per doctor and speciality, then one per busiest hour
+        writer = csv.writer(f)
+        writer.writerow(self.COLUMNS)
+        for row in self.rows:
+            writer.writerow(["" if v is None else
+                             round(v, 4) if isinstance(v, float) else v
+                             for v in row])
+        for label, n in self.busiest(top):
+            writer.writerow(["hour", label, "", n] + [""] * 6)
+
+
+# -----------------------------------------------------------------------------
+# Core System / Class Hospital System
+# -----------------------------------------------------------------------------
+class HospitalSystem:
+    # manage collections of patients, doctors, appointments
+    def __init__(self):
+        # dictionary patient_id -> Patient instance
+        self.patients = {}
+        # dictionary doctor_id  -> Doctor instance
+        self.doctors = {}
+        # dictionary appointment_id -> Appointment instance
+        self.appointments = {}
+        # merged per-speciality index of free slots
+        self.slot_finder = SpecialityIndex()
+        # name/phone/DOB search index over patients
+        self.patient_index = PatientIndex()
+        # date/doctor/patient/status indexes over appointments
+        self.appointment_index = AppointmentIndex()
+        # columnar copy for aggregates, built on first use (see analytics())
+        self.columns = None
+        # priced services, issued invoices and their revenue roll-ups
+        self.fees = FeeCatalogue()
+        self.invoices = {}
+        self._invoice_of = {}  # appointment_id -> Invoice
+        self.ledger = RevenueLedger()
+        # patients waiting for a cancelled slot
+        self.waitlist = WaitingList()
+        # counters for auto-generating IDs
+        self._pcounter = 0
+        self._dcounter = 0
+        self._acounter = 0
+        self._icounter = 0
+        self._wcounter = 0
+        # optional write-ahead journal (see Journal.attach)
+        self.journal = None
+        # cold tier for past appointments (see archive_appointments);
+        # Journal.attach opens one inside its data directory
+        self.archive = None
+        # open ReadSnapshots; writers keep what they change for each one
+        self._snapshots = []
+        # time source for booking stamps (benchmarks substitute their own)
+        self.clock = datetime.datetime.now
+        # OperationMetrics when instrumented (see instrument())
+        self.metrics = None
+        # reject bookings that overlap the patient's or the doctor's
+        # confirmed appointments (journal replay turns this off, so logs
+        # written before the check existed still load)
+        self.check_overlaps = True
+
+    def _log(self, op: str, *args) -> None:
+        # append a committed operation to the journal, if one is attached
+        if self.journal is not None:
+            self.journal.append(op, args)
+
+    def close(self) -> None:
+        # flush and fsync any pending journal entries
+        if self.journal is not None:
+            self.journal.close()
+        if self.archive is not None:
+            self.archive.close()
+
+    def read_snapshot(self) -> "ReadSnapshot":
+        # a consistent, read-only view of the current state that stays
+        # unchanged while bookings go on (see ReadSnapshot); close it, or
+        # use it in a with block, when done
+        snapshot = ReadSnapshot(self)
+        self._snapshots.append(snapshot)
+        return snapshot
+
+    def _release_snapshot(self, snapshot: "ReadSnapshot") -> None:
+        if snapshot in self._snapshots:
+            self._snapshots.remove(snapshot)
+
+    def _preserve(self, appt: "Appointment", detach: bool = True) -> None:
+        # let open snapshots keep appt as it is, before it changes (detach:
+        # keep a copy, as appt itself is about to change)
+        for snapshot in self._snapshots:
+            snapshot._keep_appointment(appt, detach)
+
+    def _preserve_slots(self, doctor: Doctor, date: str, time: str,
+                        duration: int) -> None:
+        # let open snapshots keep the free/booked state of a span of slots,
+        # before it changes
+        slots = doctor.span(date, time, duration)
+        for snapshot in self._snapshots:
+            snapshot._keep_slots(doctor, slots)
+
+    @contextlib.contextmanager
+    def bulk(self):
+        # group many operations; the journal is committed once at the end
+        yield self
+        if self.journal is not None:
+            self.journal.commit()
+
+    def _generate_id(self, prefix: str) -> str:
+        # generate zero-padded IDs based on prefix
+        if prefix == "P":
+            self._pcounter += 1
+            return f"P{self._pcounter:03}"
+        if prefix == "D":
+            self._dcounter += 1
+            return f"D{self._dcounter:03}"
+        if prefix == "A":
+            self._acounter += 1
+            return f"A{self._acounter:03}"
+        if prefix == "I":
+            self._icounter += 1
+            return f"I{self._icounter:03}"
+        if prefix == "W":
+            self._wcounter += 1
+            return f"W{self._wcounter:03}"
+        # error if unknown prefix supplied
+        raise ValueError("Unknown ID prefix")
+
+    def add_patient(self) -> None:
+        # start patient registration sequence
+        print("\n-- Register New Patient --")
+
+        # prompt for and validate each name part
+        fn = get_alpha("First Name        : ")
+        mn = get_alpha("Middle Name       : ")
+        ln = get_alpha("Last Name         : ")
+
+        # loop until DOB and age match
+        while True:
+            # get valid date object for DOB
+            dob_date = get_dob("Date of Birth (YYYY-MM-DD): ")
+            # get integer age
+            age = get_int("Age               : ")
+            # calculate age from DOB
+            calc_age = compute_age(dob_date)
+            # if mismatch between entered and calculated age
+            if calc_age != age:
+                print(f"Invalid age; calculated age is {calc_age} based on DOB.")
+                continue
+            # convert date object back to ISO string
+            dob_str = dob_date.isoformat()
+            break
+
+        # prompt for gender and contact details
+        gender = input("Gender            : ").strip()
+        address = input("Address           : ").strip()
+        telephone = get_phone("Telephone Number  : ")
+        pob = input("Place of Birth    : ").strip()
+        occupation = input("Occupation        : ").strip()
+        employer = input("Employer          : ").strip()
+        # ward, union status, religion are patient-level fields
+        ward = input("Ward               : ").strip()
+        union_status = input("Union Status       : ").strip()
+        religion = input("Religion           : ").strip()
+
+        # parental names, validated alphabetically
+        print("\n-- Parental Details --")
+        father_fn = get_alpha("Father's First Name: ")
+        father_ln = get_alpha("Father's Last Name : ")
+        mother_fn = get_alpha("Mother's First Name: ")
+        mother_ln = get_alpha("Mother's Last Name : ")
+
+        # next-of-kin information
+        print("\n-- Next of Kin (NOK) Details --")
+        nok_fn = get_alpha("NOK First Name     : ")
+        nok_ln = get_alpha("NOK Last Name      : ")
+        nok_address = input("NOK Address        : ").strip()
+        nok_relation = input("NOK Relation       : ").strip()
+        nok_phone = get_phone("NOK Telephone No.  : ")
+        
+        # register the patient with all collected data
+        pid = self.register_patient(
+            fn, mn, ln,              # name parts
+            dob_str, age, gender,    # DOB, age, gender
+            address, telephone,      # contact info
+            pob, occupation, employer,# additional patient info
+            father_fn, father_ln,    # father's name
+            mother_fn, mother_ln,    # mother's name
+            ward, union_status, religion,                  # social info
+            nok_fn, nok_ln, nok_address, nok_relation,    # next-of-kin name & details
+            nok_phone                # NOK phone
+        )
+        # confirm registration to user
+        print(f"\nPatient registered. Patient ID: {pid}\n")
+
+    def register_patient(self, *fields) -> str:
+        # non-interactive patient registration; fields are the Patient
+        # constructor arguments without the ID. Returns the new patient ID
+        pid = self._generate_id("P")
+        # create Patient instance and store it in the system dictionary
+        self._insert_patient(Patient(*fields, pid))
+        # record the operation in the journal
+        self._log("P", pid, *fields)
+        return pid
+
+    def _insert_patient(self, patient: Patient) -> None:
+        # add an already-built Patient to the registry
+        self.patients[patient.patient_id] = patient
+        # keep the name/phone/DOB search index up to date
+        self.patient_index.add(patient)
+
+    def search_patients(self, text: str, limit: int = 20) -> list:
+        # find patients by name words, phone number and/or DOB
+        # ('YYYY-MM-DD', or 'YYYY-MM-DD..YYYY-MM-DD' for a range);
+        # returns [(score, Patient)] with the best matches first
+        return self.patient_index.search(limit=limit, **parse_patient_query(text))
+
+    def find_patient(self) -> None:
+        # interactive patient search
+        text = input("Search (name, phone or DOB YYYY-MM-DD): ").strip()
+        try:
+            results = self.search_patients(text)
+        except ValueError as err:
+            print(f"Error: {err}\n"); return
+        if not results:
+            print("No matching patients.\n"); return
+        print(f"\n--- Search Results ({len(results)}) ---")
+        for _, patient in results:
+            print(f"  • {patient.patient_id}: {patient.first_name} "
+                  f"{patient.middle_name} {patient.last_name} | DOB "
+                  f"{patient.dob} | Tel {patient.telephone}")
+        print()
+        
+    def add_doctor(self) -> None:
+        # begin the doctor registration process
+        print("\n-- Register New Doctor --")  
+
+        # prompt for the doctor's first name
+        fn = input("First Name       : ").strip()  
+        # prompt for the doctor's last name
+        ln = input("Last Name        : ").strip()  
+        # prompt for the doctor's gender
+        gender = input("Gender           : ").strip()  
+        # prompt for the doctor's specialty
+        speciality = input("Speciality       : ").strip()  
+
+        # weekly rules save typing out every slot one by one
+        print("Enter weekly availability rules, e.g. 'Mon-Fri 09:00-17:00 "
+              "every 15 until 2025-12-31 except 2025-08-04..2025-08-15'.")
+        print("Type 'done' to finish (or straight away for none).")
+        rules = []
+        while True:
+            text = input("Rule              : ").strip()
+            if text.lower() in ("done", ""):
+                break
+            try:
+                # store the canonical text, with 'from' pinned to today
+                rules.append(AvailabilityRule.parse(text).text())
+            except ValueError as err:
+                print(err)
+
+        # inform user how to enter available schedule slots
+        print("Enter extra one-off slots (YYYY-MM-DD HH:MM). Type 'done' to finish.")
+        # initialize empty list to hold (date, time) tuples
+        schedule = []
+        # loop until the user types 'done'
+        while True:  
+            # read a slot entry from the user
+            slot = input("Slot              : ").strip()  
+            # if the user indicates completion, exit loop
+            if slot.lower() == "done":  
+                break  
+            try:
+                # split the input into date and time components
+                date, time = slot.split()
+                # reject dates/times that cannot be parsed
+                parse_slot(date, time)
+                # append the tuple to the schedule list
+                schedule.append((date, time))
+            except ValueError:
+                # notify user if the input is not in the correct format
+                print("Format error; use 'YYYY-MM-DD HH:MM'.")  
+
+        if rules:
+            # recurring schedule (see RuleSchedule.record)
+            schedule = {"rules": rules, "slots": schedule}
+        # register the doctor and get the new unique ID
+        did = self.register_doctor(fn, ln, gender, speciality, schedule)
+        # confirm successful registration and display the new ID
+        print(f"\nDoctor registered. Doctor ID: {did}\n")
+
+    def register_doctor(self, fn: str, ln: str, gender: str,
+                        speciality: str, schedule) -> str:
+        # non-interactive doctor registration; returns the new doctor ID
+        did = self._generate_id("D")
+        # instantiate a Doctor object with collected information
+        doctor = Doctor(fn, ln, gender, did, speciality, schedule)
+        self._insert_doctor(doctor)
+        # record the operation (with the slots as registered)
+        self._log("D", did, fn, ln, gender, speciality,
+                  doctor.schedule.record())
+        return did
+
+    def check_schedule(self, schedule) -> None:
+        # raise ValueError if this backend cannot store a register_doctor
+        # schedule (every kind fits in memory)
+        pass
+
+    def _insert_doctor(self, doctor: Doctor) -> None:
+        # add the new doctor to the system's dictionary
+        self.doctors[doctor.doctor_id] = doctor
+        # merge the doctor's slots into the speciality index
+        self.slot_finder.add_doctor(doctor)
+
+    def next_available(self, speciality: str, count: int = 5,
+                       after: datetime.datetime = None) -> list:
+        # earliest free (date, time, Doctor) slots across a speciality
+        result = []
+        for dt, did in self.slot_finder.next_available(speciality, count, after):
+            doctor = self.doctors[did]
+            date, time = doctor.schedule.label(dt)
+            result.append((date, time, doctor))
+        return result
+
+    def find_next_available(self) -> None:
+        # interactive "next available slot" search
+        speciality = input("Speciality        : ").strip()
+        count = get_int("How many slots    : ") or 5
+        after = input("After (YYYY-MM-DD HH:MM, blank = now): ").strip()
+        try:
+            start = (parse_slot(*after.split()) if after
+                     else datetime.datetime.now())
+        except (TypeError, ValueError):
+            print("Format error; use 'YYYY-MM-DD HH:MM'.\n"); return
+        slots = self.next_available(speciality, count, start)
+        if not slots:
+            # nothing free for that speciality
+            print(f"No available slots for '{speciality}'.\n"); return
+        print(f"\n--- Next Available: {speciality} ---")
+        for date, time, doctor in slots:
+            # print each slot with the doctor who owns it
+            print(f"  • {date} {time}  Dr. {doctor.first_name} "
+                  f"{doctor.last_name} ({doctor.doctor_id})")
+        print()
+
+    def book_appointment(self, patient_id: str, doctor_id: str, date: str,
+                         time: str, duration: int = SLOT_MINUTES) -> None:
+        # Attempt to book and confirm an appointment given IDs and slot
+        try:
+            appt = self.make_booking(patient_id, doctor_id, date, time,
+                                     duration)
+        except BookingError as err:
+            # report why the booking was rejected
+            print(f"Error: {err}\n"); return
+
+        # Inform the user that booking succeeded
+        print(f"Appointment confirmed. ID: {appt.appointment_id}\n")
+
+    def make_booking(self, patient_id: str, doctor_id: str, date: str,
+                     time: str, duration: int = SLOT_MINUTES) -> "Appointment":
+        # book and confirm an appointment of duration minutes; raises
+        # BookingError on failure
+        check_duration(duration)
+
+        # Check that the patient ID exists in the system
+        if patient_id not in self.patients:
+            raise BookingError("Patient ID not found.")
+
+        # Check that the doctor ID exists in the system
+        if doctor_id not in self.doctors:
+            raise BookingError("Doctor ID not found.")
+
+        # Retrieve Patient and Doctor objects by their IDs
+        patient = self.patients[patient_id]
+        doctor = self.doctors[doctor_id]
+
+        # Verify the doctor is available at the requested date/time
+        if not doctor.is_available(date, time):
+            raise BookingError("Doctor not available at that slot.")
+        if not doctor.is_available(date, time, duration):
+            raise BookingError("Doctor not available for the whole "
+                               f"{duration} minutes.")
+
+        return self._commit_booking(patient, doctor, date, time, duration)
+
+    def _commit_booking(self, patient: Patient, doctor: Doctor, date: str,
+                        time: str, duration: int = SLOT_MINUTES
+                        ) -> "Appointment":
+        # apply a validated booking and record it in the journal
+        self._check_overlap(patient.patient_id, doctor.doctor_id, date, time,
+                            duration)
+        appt = self._apply_booking(patient, doctor, date, time, duration)
+        self._log("B", appt.appointment_id, patient.patient_id,
+                  doctor.doctor_id, date, time, appt.booked, duration)
+        return appt
+
+    def _check_overlap(self, patient_id: str, doctor_id: str, date: str,
+                       time: str, duration: int) -> None:
+        # reject a booking whose [start, start + duration) overlaps a
+        # confirmed appointment of the patient or the doctor, O(log n)
+        if not self.check_overlaps:
+            return
+        start = _minutes(parse_slot(date, time))
+        clash = self.overlapping(start, start + duration,
+                                 patient_id=patient_id)
+        if clash:
+            raise BookingError(f"Patient already has an appointment at that "
+                               f"time ({clash[0].appointment_id}).")
+        clash = self.overlapping(start, start + duration, doctor_id=doctor_id)
+        if clash:
+            raise BookingError(f"Doctor already has an appointment at that "
+                               f"time ({clash[0].appointment_id}).")
+
+    def overlapping(self, start: int, end: int, doctor_id: str = None,
+                    patient_id: str = None) -> list:
+        # confirmed appointments of one doctor or one patient overlapping
+        # the minutes [start, end) (see _minutes), ordered by start
+        return list(self.appointment_index.overlapping(start, end, doctor_id,
+                                                       patient_id))
+
+    def appointments_between(self, date_from: str, time_from: str,
+                             date_to: str, time_to: str,
+                             doctor_id: str = None,
+                             patient_id: str = None) -> list:
+        # the same for a window given as dates and times
+        if bool(doctor_id) == bool(patient_id):
+            raise ValueError("give either a doctor or a patient")
+        start = _minutes(parse_slot(date_from, time_from))
+        end = _minutes(parse_slot(date_to, time_to))
+        if end <= start:
+            raise ValueError("the window ends before it starts")
+        return self.overlapping(start, end, doctor_id, patient_id)
+
+    def _apply_booking(self, patient: Patient, doctor: Doctor, date: str,
+                       time: str, duration: int = SLOT_MINUTES
+                       ) -> "Appointment":
+        # create and link an already-validated appointment (not journaled)
+
+        # Generate a unique appointment ID
+        aid = self._generate_id("A")
+
+        # Create the Appointment object and mark it confirmed
+        appt = Appointment(aid, patient, doctor, date, time, duration)
+        appt.confirm()  # set status to "Confirmed"
+        appt.booked = _minutes(self.clock())
+
+        # Store and index the appointment, link it to the patient
+        try:
+            self._insert_appointment(appt)
+        except BaseException:
+            # nothing was registered; give the ID back
+            self._acounter -= 1
+            raise
+
+        # Remove the booked slot(s) from the doctor's schedule
+        if self._snapshots:
+            self._preserve_slots(doctor, date, time, duration)
+        doctor.book_slot(date, time, duration)
+        return appt
+
+    def _insert_appointment(self, appt: "Appointment") -> None:
+        # all or nothing: the columnar row is added first, and a failure
+        # further on takes back what was already registered
+        if self.columns is not None:
+            self.columns.add(appt)
+        try:
+            # Store the appointment in the system registry
+            self.appointments[appt.appointment_id] = appt
+            # Link this appointment to the patient's record
+            appt.patient.appointment_list.append(appt)
+            # keep the query indexes up to date
+            self.appointment_index.add(appt)
+        except BaseException:
+            self.appointments.pop(appt.appointment_id, None)
+            if appt in appt.patient.appointment_list:
+                appt.patient.appointment_list.remove(appt)
+            if self.columns is not None:
+                self.columns.remove(appt)
+            raise
+
+    def _undo_booking(self, appt: "Appointment") -> None:
+        # reverse the most recent _apply_booking (batch rollback)
+        self.appointment_index.remove(appt)
+        if self.columns is not None:
+            self.columns.remove(appt)
+        del self.appointments[appt.appointment_id]
+        appt.patient.appointment_list.remove(appt)
+        if self._snapshots:
+            self._preserve_slots(appt.doctor, appt.date, appt.time,
+                                 appt.duration)
+        appt.doctor.cancel_slot(appt.date, appt.time, appt.duration)
+        self._acounter -= 1
+
+    def slot_is_free(self, doctor_id: str, date: str, time: str,
+                     duration: int = SLOT_MINUTES) -> bool:
+        # True if the doctor exists and the slot (span) is free
+        doctor = self.doctors.get(doctor_id)
+        return doctor is not None and doctor.is_available(date, time, duration)
+
+    def book_batch(self, rows) -> "BatchReport":
+        # book many (patient_id, doctor_id, date, time[, duration]) rows
+        # all-or-nothing: every row is validated first (including clashes
+        # and overlaps inside the batch) and nothing is booked unless all
+        # of them pass
+        rows = [tuple(row) for row in rows]
+        report = BatchReport(len(rows))
+        taken = set()  # (doctor_id, slot) already claimed by the batch
+        spans = {}     # patient / doctor ID -> IntervalIndex of the batch's rows
+        patients = self.patients
+        doctors = self.doctors
+        for number, row in enumerate(rows, 1):
+            if len(row) not in (4, 5):
+                report.reject(number, "expected patient_id, doctor_id, date, "
+                                      "time[, duration]")
+                continue
+            pid, did, date, time = row[:4]
+            duration = row[4] if len(row) == 5 else SLOT_MINUTES
+            try:
+                check_duration(duration)
+            except BookingError as err:
+                report.reject(number, str(err))
+                continue
+            if pid not in patients:
+                report.reject(number, "Patient ID not found.")
+                continue
+            if did not in doctors:
+                report.reject(number, "Doctor ID not found.")
+                continue
+            if not self.slot_is_free(did, date, time, duration):
+                report.reject(number, "Doctor not available at that slot.")
+                continue
+            slots = [(did, dt)
+                     for dt in doctors[did].span(date, time, duration)]
+            start = _minutes(slots[0][1])
+            patient = spans.setdefault(pid, IntervalIndex())
+            doctor = spans.setdefault(did, IntervalIndex())
+            try:
+                if any(slot in taken for slot in slots):
+                    raise BookingError("Slot already booked earlier in this "
+                                       "batch.")
+                if self.check_overlaps and doctor.overlaps(start,
+                                                           start + duration):
+                    raise BookingError("Doctor already booked at that time "
+                                       "earlier in this batch.")
+                if self.check_overlaps and patient.overlaps(start,
+                                                            start + duration):
+                    raise BookingError("Patient already booked at that time "
+                                       "earlier in this batch.")
+                self._check_overlap(pid, did, date, time, duration)
+            except BookingError as err:
+                report.reject(number, str(err))
+                continue
+            taken.update(slots)
+            patient.add(start, start + duration, number)
+            doctor.add(start, start + duration, number)
+        if report.rejected:
+            # all-or-nothing: one bad row rejects the whole batch
+            return report
+        report.applied = True
+        report.appointment_ids = self._apply_batch(rows)
+        return report
+
+    def _apply_batch(self, rows: list) -> list:
+        # apply validated rows; the batch is journaled as one entry so a
+        # crash can never leave half of it on disk
+        applied = []
+        try:
+            for pid, did, date, time, *duration in rows:
+                duration = duration[0] if duration else SLOT_MINUTES
+                # re-checked as rows land (another thread may have booked
+                # the patient since validation)
+                self._check_overlap(pid, did, date, time, duration)
+                applied.append(self._apply_booking(
+                    self.patients[pid], self.doctors[did], date, time,
+                    duration))
+        except BaseException:
+            # roll back anything applied before the failure
+            for appt in reversed(applied):
+                self._undo_booking(appt)
+            raise
+        self._log("BB", [[appt.appointment_id, *row[:4], appt.booked,
+                          appt.duration]
+                         for appt, row in zip(applied, rows)])
+        return [appt.appointment_id for appt in applied]
+
+    def cancel_appointment(self, appointment_id: str) -> None:
+        # Cancel an appointment and restore the doctor's slot.
+        """Cancel an appointment and restore doctor's slot."""
+        try:
+            self.cancel_booking(appointment_id)
+        except BookingError as err:
+            # report why the cancellation was rejected
+            print(f"Error: {err}\n"); return
+
+        # Inform the user that cancellation succeeded.
+        print(f"Appointment {appointment_id} canceled.")
+        refill = self.refill_of(appointment_id)
+        if refill is not None:
+            # the slot went straight to a patient on the waiting list
+            print(f"Slot rebooked from the waiting list: {refill.appointment_id}"
+                  f" for patient {refill.patient.patient_id}.")
+        print()
+
+    def cancel_booking(self, appointment_id: str,
+                       refill: bool = True) -> "Appointment":
+        # cancel an appointment; raises BookingError on failure. With
+        # refill, a future slot goes straight to the best waiting patient
+
+        # If the appointment ID is not registered, reject.
+        if appointment_id not in self.appointments:
+            if self.archive and self.archive.get(appointment_id):
+                raise BookingError("Appointment is archived.")
+            raise BookingError("Appointment ID not found.")
+
+        # Retrieve the Appointment object from the system.
+        appt = self.appointments[appointment_id]
+
+        # If the appointment is already marked canceled, reject.
+        if appt.status == "Canceled":
+            raise BookingError("Already canceled.")
+
+        return self._commit_cancel(appt, refill)
+
+    def _commit_cancel(self, appt: "Appointment",
+                       refill: bool = True) -> "Appointment":
+        # cancel a validated appointment and record it in the journal
+
+        # Mark the appointment status as canceled.
+        if self._snapshots:
+            self._preserve(appt)
+            self._preserve_slots(appt.doctor, appt.date, appt.time,
+                                 appt.duration)
+        old_status = appt.status
+        appt.cancel()
+        self.appointment_index.status_changed(appt, old_status)
+        if self.columns is not None:
+            self.columns.status_changed(appt, old_status)
+
+        # Return the slot(s) back to the doctor's availability.
+        appt.doctor.cancel_slot(appt.date, appt.time, appt.duration)
+
+        entry = self._refill_candidate(appt) if refill else None
+        if entry is None:
+            # record the operation in the journal
+            self._log("C", appt.appointment_id)
+            return appt
+        # hand the slot straight to the best waiting patient; the cancel
+        # and the new booking are one journal entry, so a crash keeps both
+        # or neither
+        new = self._fill(entry, appt)
+        self._log("CF", appt.appointment_id, entry.entry_id,
+                  new.appointment_id, new.booked)
+        return appt
+
+    def _refill_candidate(self, appt: "Appointment"):
+        # waiting entry that should get appt's freed slot (None if nobody
+        # waits or the slot has already started)
+        if not self.waitlist or appt.at <= _minutes(self.clock()):
+            return None
+        # the refill is a standard SLOT_MINUTES appointment; patients
+        # already booked elsewhere at that time are passed over
+        index = self.appointment_index
+        end = appt.at + SLOT_MINUTES
+        return self.waitlist.best_for(
+            appt.doctor, appt.date,
+            lambda pid: any(index.overlapping(appt.at, end, patient_id=pid)))
+
+    def _fill(self, entry: WaitlistEntry, appt: "Appointment") -> "Appointment":
+        # book entry's patient into the (first SLOT_MINUTES of the) slot
+        # appt just freed (not journaled)
+        new = self._apply_booking(self.patients[entry.patient_id],
+                                  appt.doctor, appt.date, appt.time)
+        self.waitlist.fulfil(entry, new.appointment_id, appt.appointment_id)
+        return new
+
+    def refill_of(self, appointment_id: str):
+        # the appointment that took over a cancelled appointment's slot
+        # from the waiting list (None if the slot was not refilled)
+        entry = self.waitlist.filled.get(appointment_id)
+        return (None if entry is None
+                else self.find_appointment(entry.appointment_id))
+
+    def join_waitlist(self, patient_id: str, doctor_id: str = None,
+                      speciality: str = None, urgency: int = 1,
+                      earliest: str = None, latest: str = None,
+                      joined: int = None) -> str:
+        # put a patient on the waiting list for one doctor or any doctor
+        # of a speciality; returns the entry ID. joined (minutes, see
+        # _minutes) defaults to now
+        entry = self._waitlist_entry(patient_id, doctor_id, speciality,
+                                     urgency, earliest, latest, joined)
+        self.waitlist.add(entry)
+        self._log("W", *entry.record()[:8])
+        return entry.entry_id
+
+    def _waitlist_entry(self, patient_id: str, doctor_id: str,
+                        speciality: str, urgency: int, earliest: str,
+                        latest: str, joined: int) -> WaitlistEntry:
+        # validate a waiting-list request and build its entry
+        if patient_id not in self.patients:
+            raise BookingError("Patient ID not found.")
+        if bool(doctor_id) == bool(speciality and speciality.strip()):
+            raise ValueError("give either a doctor or a speciality")
+        if doctor_id and doctor_id not in self.doctors:
+            raise BookingError("Doctor ID not found.")
+        if urgency not in WAITLIST_URGENCIES:
+            raise ValueError(f"urgency must be {WAITLIST_URGENCIES[0]}-"
+                             f"{WAITLIST_URGENCIES[-1]}")
+        for date in (earliest, latest):
+            if date:
+                parse_dob(date)
+        if earliest and latest and earliest > latest:
+            raise ValueError("earliest date is after latest date")
+        return WaitlistEntry(self._generate_id("W"), patient_id,
+                             doctor_id or None,
+                             None if doctor_id else speciality.strip(),
+                             urgency,
+                             _minutes(self.clock()) if joined is None else joined,
+                             earliest or None, latest or None)
+
+    def leave_waitlist(self, entry_id: str) -> None:
+        # take a waiting patient off the list
+        entry = self.waitlist.entries.get(entry_id)
+        if entry is None:
+            raise BookingError("Waiting list entry not found.")
+        if entry.status != "Waiting":
+            raise BookingError(f"Entry is no longer waiting ({entry.status}).")
+        self.waitlist.remove(entry)
+        self._log("WX", entry_id)
+
+    def waitlist_queue(self, doctor_id: str = None,
+                       speciality: str = None) -> list:
+        # waiting entries for a doctor or a speciality, best first
+        return self.waitlist.queue(doctor_id, speciality)
+
+    def manage_waitlist(self) -> None:
+        # interactive: add, remove or list waiting patients
+        action = input("Waiting list (add/remove/list): ").strip().lower()
+        try:
+            if action == "add":
+                pid = input("Patient ID                         : ").strip()
+                target = input("Doctor ID or speciality            : ").strip()
+                urgency = get_int("Urgency (1 routine - 5 urgent)     : ")
+                earliest = input("Earliest date (YYYY-MM-DD, blank) : ").strip()
+                latest = input("Latest date (YYYY-MM-DD, blank)   : ").strip()
+                is_doctor = target in self.doctors
+                eid = self.join_waitlist(pid, target if is_doctor else None,
+                                         None if is_doctor else target,
+                                         urgency, earliest, latest)
+                print(f"Added to the waiting list. Entry ID: {eid}\n")
+            elif action == "remove":
+                self.leave_waitlist(input("Entry ID: ").strip())
+                print("Removed from the waiting list.\n")
+            elif action == "list":
+                target = input("Doctor ID or speciality: ").strip()
+                entries = (self.waitlist_queue(doctor_id=target)
+                           if target in self.doctors
+                           else self.waitlist_queue(speciality=target))
+                if not show_pages(render_pages(
+                        entries,
+                        lambda e: (f"  • {e.entry_id}  {e.patient_id}  urgency "
+                                   f"{e.urgency}  {e.earliest or '...'} to "
+                                   f"{e.latest or '...'}"),
+                        f"Waiting for {target} (best first):")):
+                    print("Nobody is waiting.\n")
+            else:
+                print("Invalid choice.\n")
+        except ValueError as err:
+            # BookingError is a ValueError
+            print(f"Error: {err}\n")
+
+    def query_appointments(self, **filters):
+        # yield appointments matching date_from/date_to (inclusive
+        # 'YYYY-MM-DD'), status, doctor_id and patient_id, ordered by
+        # date and time, using the appointment indexes (and the archive's
+        # date and patient indexes for archived ones)
+        hot = self.appointment_index.query(**filters)
+        if not self.archive:
+            return hot
+        return heapq.merge(self._archived(**filters), hot,
+                           key=lambda appt: (appt.at, appt.appointment_id))
+
+    def _archived(self, date_from: str = None, date_to: str = None,
+                  status: str = None, doctor_id: str = None,
+                  patient_id: str = None):
+        # archived appointments matching query_appointments' filters,
+        # ordered by date and time
+        rows = (self.archive.patient_rows(patient_id) if patient_id
+                else self.archive.rows(date_from, date_to))
+        for row in rows:
+            if ((date_from and row[3] < date_from)
+                    or (date_to and row[3] > date_to)
+                    or (status and row[5] != status)
+                    or (doctor_id and row[2] != doctor_id)):
+                continue
+            yield self._revive(row)
+
+    def _revive(self, row: list) -> "Appointment":
+        # a detached Appointment for an archived row (see Appointment.record)
+        aid, pid, did, date, time, status, booked, duration = row
+        appt = Appointment(aid, self.patients[pid], self.doctors[did],
+                           date, time, duration)
+        appt.status = status
+        appt.booked = booked
+        return appt
+
+    def find_appointment(self, appointment_id: str):
+        # the appointment with this ID, in memory or archived; None if
+        # there is none. Archived ones come back as detached copies
+        appt = self.appointments.get(appointment_id)
+        if appt is None and self.archive:
+            row = self.archive.get(appointment_id)
+            if row is not None:
+                appt = self._revive(row)
+        return appt
+
+    def patient_history(self, patient_id: str) -> list:
+        # all of a patient's appointments, archived or not, by date and time
+        if patient_id not in self.patients:
+            raise BookingError("Patient ID not found.")
+        return list(self.query_appointments(patient_id=patient_id))
+
+    def archive_appointments(self, before: str) -> int:
+        # move every appointment dated before 'before' (completed or
+        # cancelled, as that date has passed) out of memory into a new
+        # archive segment; returns how many moved. They stay readable
+        # through find_appointment, query_appointments, patient_history
+        # and the aggregates, but can no longer be cancelled
+        if self.archive is None:
+            raise ValueError("No archive directory; open the system with "
+                             "a data directory.")
+        parse_dob(before)
+        if before > self.clock().date().isoformat():
+            raise ValueError("Only appointments in the past can be archived.")
+        appts = self._archivable(before)
+        if not appts:
+            return 0
+        number = self.archive.write([appt.record() for appt in appts])
+        self.archive.register(number)
+        # the rows leave memory before the entry is logged: logging it can
+        # take a snapshot, which lists the segment and must not list its
+        # rows again. The segment counts from this entry on (until it is
+        # durable a restart keeps the rows in memory instead)
+        self._drop_archived(appts)
+        self._log("AR", number, before, len(appts))
+        if self.journal is not None:
+            self.journal.commit()
+        return len(appts)
+
+    def _archivable(self, before: str) -> list:
+        # in-memory appointments dated before 'before', by date and time
+        last = (datetime.date.fromisoformat(before)
+                - datetime.timedelta(days=1)).isoformat()
+        return list(self.appointment_index.query(date_to=last))
+
+    def _drop_archived(self, appts: list) -> None:
+        # forget archived appointments; the analytics columns keep their
+        # rows so the aggregates still cover them
+        if self._snapshots:
+            for appt in appts:
+                self._preserve(appt, detach=False)
+        for appt in appts:
+            del self.appointments[appt.appointment_id]
+            self.appointment_index.remove(appt)
+        dropped = {appt.appointment_id for appt in appts}
+        for patient in {appt.patient for appt in appts}:
+            patient._appointments = [
+                appt for appt in patient.appointment_list
+                if appt.appointment_id not in dropped] or None
+
+    def appointment_rows(self, **filters):
+        # yield (id, patient first/last, doctor first/last, date, time,
+        # status) for every appointment matching the optional filters,
+        # without building a list (booking order when unfiltered, after
+        # the archived ones)
+        if any(filters.values()):
+            appts = self.query_appointments(**filters)
+        elif self.archive:
+            appts = itertools.chain(self._archived(),
+                                    self.appointments.values())
+        else:
+            appts = self.appointments.values()
+        for appt in appts:
+            yield (appt.appointment_id,
+                   appt.patient.first_name, appt.patient.last_name,
+                   appt.doctor.first_name, appt.doctor.last_name,
+                   appt.date, appt.time, appt.status)
+
+    def export_rows(self, kind: str, **filters):
+        # yield EXPORT_COLUMNS[kind] tuples for export_records(), read
+        # from a ReadSnapshot: the rows are those of one moment, and
+        # bookings carry on while they are written
+        snapshot = self.read_snapshot()
+        try:
+            if kind == "appointments":
+                for appt in snapshot.appointments(**filters):
+                    yield _export_appointment(appt)
+            elif kind == "patients":
+                for patient in snapshot.patients():
+                    record = patient.record()
+                    yield (record[-1], *record[:-1])
+            else:
+                date_from = filters.get("date_from")
+                date_to = filters.get("date_to")
+                doctor_id = filters.get("doctor_id")
+                for invoice in snapshot.invoices():
+                    if ((date_from and invoice.date < date_from)
+                            or (date_to and invoice.date > date_to)
+                            or (doctor_id and invoice.doctor_id != doctor_id)):
+                        continue
+                    yield _export_invoice(invoice.invoice_id,
+                                          invoice.appointment_id,
+                                          invoice.doctor_id, invoice.date,
+                                          invoice.issued, invoice.total,
+                                          invoice.items)
+        finally:
+            snapshot.close()
+
+    def view_appointments(self, page_size: int = None,
+                          interactive: bool = None, **filters) -> None:
+        # List appointments with status, one page at a time.
+        pages = render_pages(
+            self.appointment_rows(**filters),
+            # Display appointment details: ID, patient name, doctor name,
+            # date, time, and current status.
+            lambda row: (f"{row[0]}: Patient {row[1]} {row[2]} | Doctor "
+                         f"{row[3]} {row[4]} | {row[5]} {row[6]} | {row[7]}"),
+            "\n--- All Appointments ---", page_size)
+        if not show_pages(pages, interactive):
+            # If no appointments matched, inform the user.
+            print("No appointments scheduled.\n")
+
+    def browse_appointments(self) -> None:
+        # interactive entry point: ask for optional filters, then list
+        text = input("Filter (e.g. doctor=D001 status=Confirmed "
+                     "from=2025-01-01 to=2025-01-31; blank = all): ")
+        try:
+            filters = parse_filters(text)
+        except ValueError as err:
+            print(f"Error: {err}\n"); return
+        self.view_appointments(**filters)
+
+    def generate_bill(self, appointment_id: str) -> None:
+        
+        #Print formatted receipt for confirmed appointment:
+           #Hospital header
+           #Consultation fee + additional services
+           #Dynamic column widths + thousands separators
+        
+        # an invoiced appointment just gets its stored receipt again
+        invoice = self.invoice_for(appointment_id)
+        if invoice is not None:
+            print(render_receipt(self.find_appointment(appointment_id),
+                                 invoice.items, invoice.invoice_id))
+            return
+        try:
+            self.billable(appointment_id)
+        except BookingError as err:
+            print(f"Error: {err}\n"); return
+
+        extras = []
+        while True:
+            svc = input("Enter extra service (blank to finish): ").strip()
+            if not svc:
+                break
+            # catalogue services are priced already
+            if self.fees.get(svc) is not None:
+                extras.append(svc)
+                continue
+            fee = get_int(f"Fee for '{svc}' (JMD$): ")
+            extras.append((svc, fee))
+
+        invoice = self.invoice(appointment_id, extras)
+        print(render_receipt(self.find_appointment(appointment_id),
+                             invoice.items, invoice.invoice_id))
+
+    def batch_invoice(self) -> None:
+        # interactive: invoice every uninvoiced confirmed appointment
+        date_from = input("From (YYYY-MM-DD, blank = start): ").strip() or None
+        date_to = input("To   (YYYY-MM-DD, blank = end)  : ").strip() or None
+        try:
+            invoices = self.invoice_range(date_from, date_to)
+        except ValueError as err:
+            print(f"Error: {err}\n"); return
+        total = sum(invoice.total for invoice in invoices)
+        print(f"Issued {len(invoices):,} invoices totalling JMD$ {total:,}.\n")
+
+    def revenue_report(self) -> None:
+        # interactive: revenue per doctor, day or service
+        by = input("Group by (doctor/day/service): ").strip().lower() or "doctor"
+        date_from = input("From (YYYY-MM-DD, blank = start): ").strip() or None
+        date_to = input("To   (YYYY-MM-DD, blank = end)  : ").strip() or None
+        try:
+            totals = self.revenue(by, date_from, date_to)
+        except ValueError as err:
+            print(f"Error: {err}\n"); return
+        if not show_pages(render_pages(
+                sorted(totals.items()),
+                lambda row: f"  • {row[0]:<24} {row[1]:>12,}",
+                f"Revenue by {by} (JMD$):")):
+            print("No invoices in that range.\n")
+
+    def manage_fees(self) -> None:
+        # interactive: list the catalogue, then add/re-price services
+        print("Fee Catalogue:")
+        for service, fee in self.fees:
+            print(f"  • {service:<24} {fee:>10,}")
+        while True:
+            service = input("Service to add/re-price (blank to finish): ").strip()
+            if not service:
+                break
+            self.set_fee(service, get_int(f"Fee for '{service}' (JMD$): "))
+        print()
+
+    def set_fee(self, service: str, fee: int) -> None:
+        # add or re-price a catalogue service (affects later invoices only)
+        self.fees.set(service, fee)
+        self._log("F", service, fee)
+
+    def invoice_for(self, appointment_id: str):
+        # the appointment's invoice, or None if it has not been billed
+        return self._invoice_of.get(appointment_id)
+
+    def invoice(self, appointment_id: str, extras=(),
+                issued: str = None) -> Invoice:
+        # issue and store the invoice for one confirmed appointment;
+        # extras are catalogue service names or (service, fee) pairs
+        appt = self.billable(appointment_id)
+        existing = self.invoice_for(appointment_id)
+        if existing is not None:
+            raise BookingError(f"Appointment already invoiced "
+                               f"({existing.invoice_id}).")
+        return self._commit_invoices([appt], self.fees.items(extras),
+                                     issued)[0]
+
+    def invoice_range(self, date_from: str = None, date_to: str = None,
+                      extras=(), issued: str = None) -> list:
+        # invoice every confirmed, not yet invoiced appointment with a
+        # date in [date_from, date_to], as one journal entry. The bounds
+        # are checked first: invoices cannot be taken back, and a
+        # mistyped date would compare as text against the wrong range
+        for bound in (date_from, date_to):
+            try:
+                if bound:
+                    parse_dob(bound)
+            except ValueError:
+                raise ValueError(f"Invalid date '{bound}'; "
+                                 f"use YYYY-MM-DD.") from None
+        items = self.fees.items(extras)
+        appts = self._uninvoiced(date_from, date_to)
+        return self._commit_invoices(appts, items, issued) if appts else []
+
+    def _uninvoiced(self, date_from: str, date_to: str) -> list:
+        # confirmed appointments in the date range without an invoice
+        return [appt for appt in self.query_appointments(
+                    date_from=date_from, date_to=date_to, status="Confirmed")
+                if appt.appointment_id not in self._invoice_of]
+
+    def _commit_invoices(self, appts: list, items: list,
+                         issued: str = None) -> list:
+        # issue one invoice per (already checked) appointment
+        issued = issued or datetime.date.today().isoformat()
+        invoices = [Invoice.for_appointment(self._generate_id("I"), appt,
+                                            issued, items)
+                    for appt in appts]
+        for invoice in invoices:
+            self._insert_invoice(invoice)
+        self._log("I", [[invoice.invoice_id, invoice.appointment_id]
+                        for invoice in invoices],
+                  issued, [list(item) for item in items])
+        return invoices
+
+    def _insert_invoice(self, invoice: Invoice) -> None:
+        # store the invoice and fold it into the roll-ups
+        self.invoices[invoice.invoice_id] = invoice
+        self._invoice_of[invoice.appointment_id] = invoice
+        self.ledger.add(invoice)
+        if self.columns is not None:
+            self.columns.set_billed(invoice.appointment_id, invoice.total)
+
+    def revenue(self, by: str = "doctor", date_from: str = None,
+                date_to: str = None) -> dict:
+        # {doctor_id | 'YYYY-MM-DD' | service: JMD$} from the roll-ups
+        return self.ledger.revenue(by, date_from, date_to)
+
+    def analytics(self) -> AppointmentColumns:
+        # the columnar appointment store; built from the current
+        # appointments on first use and kept in sync from then on
+        if self.columns is None:
+            self.columns = AppointmentColumns()
+            if self.archive:
+                for appt in self._archived():
+                    self.columns.add(appt)
+            for appt in self.appointments.values():
+                self.columns.add(appt)
+            for invoice in self.invoices.values():
+                self.columns.set_billed(invoice.appointment_id,
+                                        invoice.total)
+        return self.columns
+
+    def daily_counts(self, date_from: str = None, date_to: str = None,
+                     status: str = None) -> dict:
+        # {(doctor_id, 'YYYY-MM-DD'): appointments} per doctor per day
+        return self.analytics().daily_counts(date_from, date_to, status)
+
+    def cancellation_rates(self) -> dict:
+        # {doctor_id: share of appointments canceled}
+        return self.analytics().cancellation_rates()
+
+    def billed_totals(self) -> dict:
+        # {doctor_id: total invoiced}
+        return self.analytics().billed_totals()
+
+    def operations_report(self, date_from: str = None,
+                          date_to: str = None) -> OperationsReport:
+        # utilisation, cancellations, lead times and busiest hours over an
+        # inclusive date range (default: the span of the appointments)
+        columns = self._report_columns(date_from, date_to)
+        if date_from is None or date_to is None:
+            first, last = columns.span()
+            date_from = (date_from or first
+                         or datetime.date.today().isoformat())
+            date_to = date_to or last or date_from
+        # group doctors by speciality, spelt as first registered
+        spelling = {}
+        group_of = {did: spelling.setdefault(SpecialityIndex.normalise(sp), sp)
+                    for did, sp in self._doctor_specialities().items()}
+        stats = columns.operations(date_from, date_to, group_of)
+        return OperationsReport(date_from, date_to, group_of, stats,
+                                self._free_slot_counts(date_from, date_to))
+
+    def _report_columns(self, date_from: str, date_to: str):
+        # AppointmentColumns covering at least the date range
+        return self.analytics()
+
+    def _doctor_specialities(self) -> dict:
+        return {did: doctor.speciality for did, doctor in self.doctors.items()}
+
+    def _free_slot_counts(self, date_from: str, date_to: str) -> dict:
+        # {doctor_id: free slots on days date_from..date_to}
+        start = datetime.datetime.fromisoformat(date_from)
+        end = (datetime.datetime.fromisoformat(date_to)
+               + datetime.timedelta(days=1))
+        return {did: doctor.schedule.count_between(start, end)
+                for did, doctor in self.doctors.items()}
+
+    def show_operations_report(self) -> None:
+        # interactive: print the operations report for a date range
+        date_from = input("From (YYYY-MM-DD, blank = first appointment): ").strip()
+        date_to = input("To   (YYYY-MM-DD, blank = last appointment) : ").strip()
+        try:
+            report = self.operations_report(date_from or None, date_to or None)
+        except ValueError as err:
+            print(f"Error: {err}\n"); return
+        print(report.render())
+
+    def billable(self, appointment_id: str) -> "Appointment":
+        # return the appointment if it can be billed; raises BookingError
+        appt = self.find_appointment(appointment_id)
+        if appt is None:
+            raise BookingError("Appointment ID not found.")
+        if appt.status != "Confirmed":
+            raise BookingError("Only confirmed appointments can be billed.")
+        return appt
+
+
+# -----------------------------------------------------------------------------
+# Billing Helpers
+# -----------------------------------------------------------------------------
+def render_receipt(appt: Appointment, items: list,
+                   invoice_id: str = None) -> str:
+    # formatted receipt for a confirmed appointment:
+    #   hospital header
+    #   consultation fee + additional services
+    #   dynamic column widths + thousands separators
+    lines = []
+    out = lines.append
+
+    # Compute widths
+    hdr_svc = "Service"; hdr_amt = "Amount (JMD$)"
+    max_s = max(len(hdr_svc), *(len(s) for s, _ in items))
+    max_a = max(len(hdr_amt), *(len(f"{f:,}") for _, f in items))
+    total = sum(f for _, f in items)
+    width = max_s + max_a + 5
+
+    # Header
+    name = "Blake Memorial Hospital"
+    out("\n" + "=" * width)
+    out(name.center(width))
+    out("OFFICIAL RECEIPT".center(width))
+    out("=" * width + "\n")
+
+    # Details
+    if invoice_id:
+        out(f"Invoice No.    : {invoice_id}")
+    out(f"Appointment ID : {appt.appointment_id}")
+    out(f"Date/Time      : {appt.date}   {appt.time}")
+    out(f"Patient        : {appt.patient.first_name} {appt.patient.last_name} ({appt.patient.patient_id})")
+    out(f"Doctor         : Dr. {appt.doctor.first_name} {appt.doctor.last_name} ({appt.doctor.doctor_id})")
+    out("-" * width)
+
+    # Table
+    out(f"{hdr_svc:<{max_s}}   {hdr_amt:>{max_a}}")
+    out("-" * width)
+    for s, f in items:
+        out(f"{s:<{max_s}}   {f:>{max_a},}")
+    out("-" * width)
+    out(f"{'TOTAL':<{max_s}}   {total:>{max_a},}")
+    out("=" * width + "\n")
+    return "\n".join(lines)
+
+
+# -----------------------------------------------------------------------------
+# Consistent Reads: Point-in-Time Snapshots
+# -----------------------------------------------------------------------------
+class ReadSnapshot:
+    # read-only view of a HospitalSystem's patients, doctors (with their
+    # free slots), appointments and invoices as they were when it was
+    # taken, for long reports that run while bookings go on. Taking one
+    # is O(1): it records the ID counters and how many archive segments
+    # exist. From then on writers keep, once per snapshot, the previous
+    # state of what they change (a copy of an appointment before it is
+    # cancelled, an archived appointment, a slot's free/booked state), so
+    # memory grows with the changes made while it is open, not with the
+    # data. Records created later have higher IDs and are skipped.
+    # Readers take the live value first and then look for a kept one;
+    # writers keep before they change, so a change racing a read is
+    # always found kept. Patients, doctors and invoices never change once
+    # created (read a patient's appointments through appointments())
+    def __init__(self, system: HospitalSystem):
+        self.system = system
+        # when it was taken, by the system's clock
+        self.taken = system.clock()
+        self._patients = system._pcounter
+        self._doctors = system._dcounter
+        self._appointments = system._acounter
+        self._invoices = system._icounter
+        self._segments = len(system.archive.segments) if system.archive else 0
+        # appointment_id -> the Appointment as it was
+        self._kept = {}
+        # doctor_id -> {slot datetime: was free}
+        self._slots = {}
+
+    def __enter__(self) -> "ReadSnapshot":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        # stop keeping changes for this snapshot
+        self.system._release_snapshot(self)
+
+    @staticmethod
+    def _number(record_id: str) -> int:
+        # the counter value in an ID such as 'A017' (0 if malformed)
+        try:
+            return int(record_id[1:])
+        except (TypeError, ValueError):
+            return 0
+
+    # -- called by writers, before a change ------------------------------------
+    def _keep_appointment(self, appt: "Appointment", detach: bool) -> None:
+        aid = appt.appointment_id
+        if aid not in self._kept and self._number(aid) <= self._appointments:
+            self._kept[aid] = appt.copy() if detach else appt
+
+    def _keep_slots(self, doctor: Doctor, slots: list) -> None:
+        kept = self._slots.get(doctor.doctor_id)
+        if kept is None:
+            kept = self._slots[doctor.doctor_id] = {}
+        for dt in slots:
+            if dt not in kept:
+                kept[dt] = dt in doctor.schedule
+
+    # -- reads -----------------------------------------------------------------
+    def patient(self, patient_id: str):
+        # the patient, or None if not registered when the snapshot was taken
+        if not 0 < self._number(patient_id) <= self._patients:
+            return None
+        return self.system.patients.get(patient_id)
+
+    def patients(self):
+        # yield every patient, in registration order
+        patients = self.system.patients
+        for n in range(1, self._patients + 1):
+            yield patients[f"P{n:03}"]
+
+    def doctor(self, doctor_id: str):
+        # the doctor, or None if not registered when the snapshot was taken
+        if not 0 < self._number(doctor_id) <= self._doctors:
+            return None
+        return self.system.doctors.get(doctor_id)
+
+    def doctors(self):
+        # yield every doctor, in registration order
+        doctors = self.system.doctors
+        for n in range(1, self._doctors + 1):
+            yield doctors[f"D{n:03}"]
+
+    def invoices(self):
+        # yield every invoice, in issue order
+        invoices = self.system.invoices
+        for n in range(1, self._invoices + 1):
+            yield invoices[f"I{n:03}"]
+
+    def _archived_segments(self) -> list:
+        archive = self.system.archive
+        return archive.segments[:self._segments] if self._segments else []
+
+    def appointment(self, appointment_id: str):
+        # the appointment as it was (a detached copy), or None
+        if not 0 < self._number(appointment_id) <= self._appointments:
+            return None
+        live = self.system.appointments.get(appointment_id)
+        if live is not None:
+            live = live.copy()
+        appt = self._kept.get(appointment_id, live)
+        if appt is None:
+            # archived before the snapshot was taken
+            for segment in self._archived_segments():
+                row = segment.get(appointment_id)
+                if row is not None:
+                    return self.system._revive(row)
+        return appt
+
+    def appointments(self, date_from: str = None, date_to: str = None,
+                     status: str = None, doctor_id: str = None,
+                     patient_id: str = None):
+        # yield the appointments as they were (detached copies) that match
+        # the optional filters of HospitalSystem.query_appointments:
+        # archived ones first (by date), then the rest in booking order
+        for segment in self._archived_segments():
+            rows = (segment.patient_rows(patient_id) if patient_id
+                    else segment.rows(date_from, date_to))
+            for row in rows:
+                if ((date_from and row[3] < date_from)
+                        or (date_to and row[3] > date_to)
+                        or (status and row[5] != status)
+                        or (doctor_id and row[2] != doctor_id)):
+                    continue
+                yield self.system._revive(row)
+        # the date range as Appointment.at bounds
+        low = (0 if not date_from else
+               datetime.date.fromisoformat(date_from).toordinal() * 1440)
+        high = (None if not date_to else
+                (datetime.date.fromisoformat(date_to).toordinal() + 1) * 1440)
+        live, kept = self.system.appointments, self._kept
+        for n in range(1, self._appointments + 1):
+            aid = f"A{n:03}"
+            appt = live.get(aid)
+            if appt is not None:
+                appt = appt.copy()
+            appt = kept.get(aid, appt)
+            if (appt is None or appt.at < low
+                    or (high is not None and appt.at >= high)
+                    or (status and appt.status != status)
+                    or (doctor_id and appt.doctor.doctor_id != doctor_id)
+                    or (patient_id and appt.patient.patient_id != patient_id)):
+                continue
+            yield appt
+
+    def free_slots(self, doctor_id: str, start: datetime.datetime = None,
+                   end: datetime.datetime = None) -> list:
+        # the doctor's free (date, time) slots with start <= slot < end, in
+        # order (give an end for an open-ended rule schedule)
+        doctor = self.doctor(doctor_id)
+        if doctor is None:
+            raise BookingError("Doctor ID not found.")
+        # a slot list can be read twice while a restore shifts it
+        free = set(doctor.schedule.between(start, end))
+        kept = self._slots.get(doctor_id)
+        if kept:
+            for dt, was_free in kept.copy().items():
+                if (start is None or dt >= start) and (end is None or dt < end):
+                    if was_free:
+                        free.add(dt)
+                    else:
+                        free.discard(dt)
+        return [doctor.schedule.label(dt) for dt in sorted(free)]
+
+    def columns(self) -> AppointmentColumns:
+        # the snapshot's appointments (and bills) as AppointmentColumns,
+        # for the same aggregates HospitalSystem.analytics() answers
+        columns = AppointmentColumns(self.appointments())
+        for invoice in self.invoices():
+            if invoice.appointment_id in columns._rows:
+                columns.set_billed(invoice.appointment_id, invoice.total)
+        return columns
+
+    # the operations report, computed by HospitalSystem's code over the
+    # snapshot through the three hooks below
+    operations_report = HospitalSystem.operations_report
+
+    def _report_columns(self, date_from: str, date_to: str):
+        return self.columns()
+
+    def _doctor_specialities(self) -> dict:
+        return {doctor.doctor_id: doctor.speciality
+                for doctor in self.doctors()}
+
+    def _free_slot_counts(self, date_from: str, date_to: str) -> dict:
+        start = datetime.datetime.fromisoformat(date_from)
+        end = (datetime.datetime.fromisoformat(date_to)
+               + datetime.timedelta(days=1))
+        return {doctor.doctor_id: len(self.free_slots(doctor.doctor_id,
+                                                      start, end))
+                for doctor in self.doctors()}
+
+
+# -----------------------------------------------------------------------------
+# Persistence: Write-Ahead Journal + Snapshots
+# -----------------------------------------------------------------------------
+class JournalError(Exception):
+    # raised when the journal or snapshot on disk cannot be trusted
+    pass
+
+
+@contextlib.contextmanager
+def _gc_paused(freeze: bool = False):
+    # bulk loads create many long-lived objects; pausing the cyclic GC
+    # avoids repeated full collections while they are built. freeze then
+    # collects once and moves the survivors out of the collector's way,
+    # so a full collection never lands inside a timed benchmark query
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+    if freeze:
+        gc.collect()
+        gc.freeze()
+
+
+def _fsync_dir(path: str) -> None:
+    # persist a rename/creation inside a directory (POSIX only)
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Journal:
+    # append-only log of HospitalSystem operations in a data directory:
+    #   journal.log    : one "<crc32> <json>" line per operation, where the
+    #                    json is [seq, op, args...]; fsync'd in batches
+    #   snapshot.jsonl : compact dump of the whole state up to some seq,
+    #                    written to a temp file and atomically renamed
+    #   archive/       : the AppointmentArchive segments; the snapshot
+    #                    header and "AR" entries say which ones count
+    # startup loads the snapshot and replays only the journal tail; a torn
+    # last line (crash mid-write) is detected by its checksum and dropped
+    JOURNAL = "journal.log"
+    SNAPSHOT = "snapshot.jsonl"
+    # rows per snapshot line
+    SNAPSHOT_BLOCK = 1000
+
+    def __init__(self, directory: str, sync_every: int = 256,
+                 sync_interval: float = 0.2, snapshot_every: int = 100_000):
+        # data directory holding the journal and snapshot
+        self.directory = directory
+        # fsync after this many entries or this many seconds (whichever first)
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        # take a snapshot after this many entries (0 = only on request)
+        self.snapshot_every = snapshot_every
+        # sequence number of the last entry written or replayed
+        self.seq = 0
+        # entries since the last snapshot / since the last fsync
+        self._since_snapshot = 0
+        self._pending = 0
+        self._last_sync = _time.monotonic()
+        self._encode = json.JSONEncoder(separators=(",", ":"),
+                                        ensure_ascii=False).encode
+        self._file = None
+        self.system = None
+
+    def _path(self, name: str) -> str:
+        # absolute path of a file inside the data directory
+        return os.path.join(self.directory, name)
+
+    def attach(self, system: "HospitalSystem") -> "HospitalSystem":
+        # restore system from disk, then journal its future operations
+        os.makedirs(self.directory, exist_ok=True)
+        if system.archive is None:
+            system.archive = AppointmentArchive(self._path("archive"))
+        # replay re-applies what was accepted when it was logged, including
+        # overlaps from before the overlap check existed
+        check_overlaps = system.check_overlaps
+        system.check_overlaps = False
+        try:
+            with _gc_paused():
+                self.seq = self._load_snapshot(system)
+                self._since_snapshot = self._replay(system)
+        finally:
+            system.check_overlaps = check_overlaps
+        self._file = open(self._path(self.JOURNAL), "ab")
+        self.system = system
+        system.journal = self
+        return system
+
+    def append(self, op: str, args: tuple) -> None:
+        # write one operation; fsync when the batch is full or old enough
+        self.seq += 1
+        payload = self._encode([self.seq, op, *args]).encode("utf-8")
+        self._file.write(b"%08x %s\n" % (zlib.crc32(payload), payload))
+        self._pending += 1
+        self._since_snapshot += 1
+        if (self._pending >= self.sync_every or
+                _time.monotonic() - self._last_sync >= self.sync_interval):
+            self.commit()
+        if self.snapshot_every and self._since_snapshot >= self.snapshot_every:
+            self.snapshot()
+
+    def commit(self) -> None:
+        # make every entry written so far durable
+        if self._pending and self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._pending = 0
+        self._last_sync = _time.monotonic()
+
+    def close(self) -> None:
+        # commit outstanding entries and detach from the system
+        if self._file is not None:
+            self.commit()
+            self._file.close()
+            self._file = None
+        if self.system is not None:
+            self.system.journal = None
+            self.system = None
+
+    # -- snapshots ------------------------------------------------------------
+    def snapshot(self) -> None:
+        # dump the full state, then start an empty journal after it
+        self.commit()
+        hs = self.system
+        encode = self._encode
+        tmp = self._path(self.SNAPSHOT + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            # header: sequence number covered, the ID counters and the
+            # archive segments in use
+            f.write(encode({"seq": self.seq, "counters": [
+                hs._pcounter, hs._dcounter, hs._acounter,
+                hs._icounter, hs._wcounter],
+                "archive": hs.archive.numbers()}) + "\n")
+            # records are written in blocks of rows, one block per line,
+            # which keeps the per-line parsing overhead off the startup path
+            def write_rows(kind, rows):
+                block = []
+                for row in rows:
+                    block.append(row)
+                    if len(block) == self.SNAPSHOT_BLOCK:
+                        f.write(encode([kind, block]) + "\n")
+                        block = []
+                if block:
+                    f.write(encode([kind, block]) + "\n")
+
+            write_rows("P", (p.record() for p in hs.patients.values()))
+            write_rows("D", ([doc.doctor_id, doc.first_name, doc.last_name,
+                              doc.gender, doc.speciality,
+                              doc.schedule.record()]
+                             for doc in hs.doctors.values()))
+            write_rows("A", (appt.record()
+                             for appt in hs.appointments.values()))
+            write_rows("F", (list(line) for line in hs.fees))
+            write_rows("I", (invoice.record()
+                             for invoice in hs.invoices.values()))
+            write_rows("W", (entry.record()
+                             for entry in hs.waitlist.entries.values()))
+            # end marker proves the snapshot was written completely
+            f.write('["END"]\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path(self.SNAPSHOT))
+        _fsync_dir(self.directory)
+        # entries up to self.seq now live in the snapshot; a crash before
+        # the journal is reset is harmless because replay skips them
+        self._file.close()
+        tmp = self._path(self.JOURNAL + ".tmp")
+        with open(tmp, "wb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path(self.JOURNAL))
+        _fsync_dir(self.directory)
+        self._file = open(self._path(self.JOURNAL), "ab")
+        self._since_snapshot = 0
+
+    def _load_snapshot(self, hs: "HospitalSystem") -> int:
+        # rebuild state from the snapshot; returns the seq it covers
+        path = self._path(self.SNAPSHOT)
+        if not os.path.exists(path):
+            return 0
+        complete = False
+        with open(path, encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            # archived appointments are read from their segments on demand
+            for number in header.get("archive", ()):
+                hs.archive.register(number)
+            patients = hs.patients
+            doctors = hs.doctors
+            for line in f:
+                kind, *block = json.loads(line)
+                if kind == "A":
+                    # restore appointments without touching the slots
+                    # (the snapshot stores each doctor's free slots)
+                    for aid, pid, did, date, time, status, *extra in block[0]:
+                        # older snapshots lack the stamp and the duration
+                        appt = Appointment(aid, patients[pid], doctors[did],
+                                           date, time, *extra[1:2])
+                        appt.status = status
+                        appt.booked = extra[0] if extra else 0
+                        hs._insert_appointment(appt)
+                elif kind == "P":
+                    for row in block[0]:
+                        hs._insert_patient(Patient(*row))
+                elif kind == "D":
+                    for did, fn, ln, gender, speciality, slots in block[0]:
+                        hs._insert_doctor(Doctor(
+                            fn, ln, gender, did, speciality, slots))
+                elif kind == "F":
+                    for service, fee in block[0]:
+                        hs.fees.set(service, fee)
+                elif kind == "I":
+                    for iid, aid, issued, items in block[0]:
+                        hs._insert_invoice(Invoice.for_appointment(
+                            iid, hs.find_appointment(aid), issued, items))
+                elif kind == "W":
+                    for row in block[0]:
+                        entry = WaitlistEntry(*row[:8])
+                        entry.status, entry.appointment_id, entry.vacated = row[8:]
+                        hs.waitlist.add(entry)
+                elif kind == "END":
+                    complete = True
+        if not complete:
+            raise JournalError(f"Snapshot {path} is incomplete.")
+        # older snapshots lack the invoice and waiting-list counters
+        (hs._pcounter, hs._dcounter, hs._acounter, hs._icounter,
+         hs._wcounter) = (header["counters"] + [0, 0])[:5]
+        return header["seq"]
+
+    # -- replay ---------------------------------------------------------------
+    @staticmethod
+    def _decode(line: bytes):
+        # parse one journal line; None if it is torn or fails its checksum
+        if len(line) < 10 or not line.endswith(b"\n"):
+            return None
+        payload = line[9:-1]
+        try:
+            if int(line[:8], 16) != zlib.crc32(payload):
+                return None
+            return json.loads(payload)
+        except ValueError:
+            return None
+
+    def _replay(self, hs: "HospitalSystem") -> int:
+        # re-apply journal entries newer than the snapshot; returns count
+        path = self._path(self.JOURNAL)
+        if not os.path.exists(path):
+            return 0
+        applied = 0
+        good = 0  # byte offset just past the last intact entry
+        with open(path, "rb") as f:
+            while True:
+                line = f.readline()
+                if not line:
+                    break
+                rec = self._decode(line)
+                if rec is None:
+                    # only the final entry may be torn; anything after it
+                    # means the committed part of the journal is damaged
+                    if f.read().strip():
+                        raise JournalError(
+                            f"Corrupt journal entry at byte {good} of {path}.")
+                    break
+                good += len(line)
+                seq, op, *args = rec
+                if seq <= self.seq:
+                    # already contained in the snapshot
+                    continue
+                self._apply(hs, op, args)
+                self.seq = seq
+                applied += 1
+        if good < os.path.getsize(path):
+            # drop the torn tail so new entries start on a clean line
+            with open(path, "r+b") as f:
+                f.truncate(good)
+                os.fsync(f.fileno())
+        return applied
+
+    @staticmethod
+    def _apply(hs: "HospitalSystem", op: str, args: list) -> None:
+        # re-run one journaled operation and check it reproduces the same ID
+        try:
+            if op == "P":
+                new_id = hs.register_patient(*args[1:])
+            elif op == "D":
+                fn, ln, gender, speciality, slots = args[1:]
+                new_id = hs.register_doctor(fn, ln, gender, speciality, slots)
+            elif op == "B":
+                # entries before durations existed book one slot
+                appt = hs.make_booking(*args[1:5], *args[6:7])
+                # restore the original booking stamp (older entries have
+                # none); replay runs before any analytics are built
+                appt.booked = args[5] if len(args) > 5 else 0
+                new_id = appt.appointment_id
+            elif op == "C":
+                # refills are journaled as "CF"; a plain cancel never refills
+                new_id = hs.cancel_booking(args[0], refill=False).appointment_id
+            elif op == "CF":
+                # a cancel whose slot went to a waiting patient, as one entry
+                aid, eid, new_aid, booked = args
+                appt = hs.cancel_booking(aid, refill=False)
+                entry = hs.waitlist.entries.get(eid)
+                if entry is None or entry.status != "Waiting":
+                    raise JournalError(f"Journal replay diverged: {eid} is "
+                                       f"not waiting.")
+                new = hs._fill(entry, appt)
+                new.booked = booked
+                if new.appointment_id != new_aid:
+                    raise JournalError(f"Journal replay diverged: expected "
+                                       f"{new_aid}, got {new.appointment_id}.")
+                return
+            elif op == "W":
+                eid, pid, did, speciality, urgency, joined, earliest, latest = args
+                new_id = hs.join_waitlist(pid, did, speciality, urgency,
+                                          earliest, latest, joined)
+            elif op == "WX":
+                hs.leave_waitlist(args[0])
+                return
+            elif op == "BB":
+                # a batch is one entry: re-apply every row, all or nothing
+                report = hs.book_batch(row[1:5] + row[6:7] for row in args[0])
+                if not report.applied:
+                    raise BookingError(report.errors()[0][1])
+                expected = [row[0] for row in args[0]]
+                if report.appointment_ids != expected:
+                    raise JournalError("Journal replay diverged in batch "
+                                       f"starting at {expected[0]}.")
+                for row in args[0]:
+                    hs.appointments[row[0]].booked = (row[5] if len(row) > 5
+                                                      else 0)
+                return
+            elif op == "F":
+                hs.set_fee(*args)
+                return
+            elif op == "AR":
+                # an archive run; its segment was written before the entry
+                number, before, count = args
+                appts = hs._archivable(before)
+                segment = hs.archive.register(number)
+                if (len(appts) != count or segment.ids() != sorted(
+                        int(appt.appointment_id[1:]) for appt in appts)):
+                    raise JournalError(f"Journal replay diverged: archive "
+                                       f"segment {number} does not match.")
+                hs._drop_archived(appts)
+                return
+            elif op == "I":
+                # invoices issued together are one entry, like "BB"
+                pairs, issued, items = args
+                appts = []
+                for _, aid in pairs:
+                    if hs.invoice_for(aid) is not None:
+                        raise BookingError("Appointment already invoiced.")
+                    appts.append(hs.billable(aid))
+                invoices = hs._commit_invoices(
+                    appts, [tuple(item) for item in items], issued)
+                if [i.invoice_id for i in invoices] != [p[0] for p in pairs]:
+                    raise JournalError("Journal replay diverged in invoices "
+                                       f"starting at {pairs[0][0]}.")
+                return
+            else:
+                raise JournalError(f"Unknown journal operation '{op}'.")
+        except BookingError as err:
+            raise JournalError(f"Journal replay failed on {op} {args[0]}: {err}")
+        if new_id != args[0]:
+            raise JournalError(f"Journal replay diverged: expected {args[0]}, "
+                               f"got {new_id}.")
+
+
+# -----------------------------------------------------------------------------
+# Storage: Appointment Archive (cold tier)
+# -----------------------------------------------------------------------------
+class ArchiveSegment:
+    # one immutable archive file and its index (see AppointmentArchive).
+    # Rows are snapshot "A" rows sorted by date, time and ID; the index
+    # gives each row's byte offset by appointment number, by patient and
+    # for the first row of each date, so a lookup reads one line and a
+    # date range reads one contiguous stretch
+    def __init__(self, number: int, path: str, index: dict):
+        self.number = number
+        self.path = path
+        self.count = index["rows"]
+        # appointment numbers (sorted) and their row offsets
+        self._numbers = array.array("q", index["numbers"])
+        self._offsets = array.array("q", index["offsets"])
+        # patient_id -> row offsets in date order
+        self._patients = {pid: array.array("q", offsets)
+                          for pid, offsets in index["patients"].items()}
+        # distinct dates and the offset of the first row of each
+        self._dates = index["dates"]
+        self._date_offsets = index["date_offsets"]
+        self._file = open(path, "rb")
+        self._lock = threading.Lock()
+        # a bound decoder skips json.loads' per-call type and encoding checks
+        self._decode = json.JSONDecoder().decode
+
+    def close(self) -> None:
+        self._file.close()
+
+    def _read(self, offset: int) -> list:
+        # the row starting at offset (seek + read is one step)
+        with self._lock:
+            self._file.seek(offset)
+            line = self._file.readline()
+        return self._decode(line.decode("utf-8"))
+
+    def get(self, appointment_id: str):
+        # the row of one appointment, or None
+        try:
+            number = int(appointment_id[1:])
+        except ValueError:
+            return None
+        i = bisect.bisect_left(self._numbers, number)
+        if i == len(self._numbers) or self._numbers[i] != number:
+            return None
+        return self._read(self._offsets[i])
+
+    def ids(self) -> list:
+        # appointment numbers held, sorted
+        return list(self._numbers)
+
+    def patient_rows(self, patient_id: str) -> list:
+        return [self._read(offset)
+                for offset in self._patients.get(patient_id, ())]
+
+    def rows(self, date_from: str = None, date_to: str = None):
+        # yield rows with date_from <= date <= date_to (either optional)
+        i = 0 if not date_from else bisect.bisect_left(self._dates, date_from)
+        if i == len(self._dates):
+            return
+        decode = self._decode
+        with open(self.path, "rb") as f:
+            f.seek(self._date_offsets[i])
+            for line in f:
+                row = decode(line.decode("utf-8"))
+                if date_to and row[3] > date_to:
+                    return
+                yield row
+
+
+class AppointmentArchive:
+    # cold tier for past and cancelled appointments: a directory of
+    # append-only segments, one per archive run
+    #   archive-NNNNNN.jsonl : the rows, written once and never changed
+    #   archive-NNNNNN.idx   : its index (see ArchiveSegment)
+    # Both are written to temp files and renamed. A segment only counts
+    # once it is registered (by the journal entry or snapshot naming it),
+    # so files left by a crash before that are overwritten by the next run
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.segments = []
+
+    def __len__(self) -> int:
+        # appointments archived
+        return sum(segment.count for segment in self.segments)
+
+    def _path(self, number: int, ext: str) -> str:
+        return os.path.join(self.directory, f"archive-{number:06}.{ext}")
+
+    def numbers(self) -> list:
+        # registered segment numbers, for the snapshot header
+        return [segment.number for segment in self.segments]
+
+    def write(self, rows: list) -> int:
+        # write rows (snapshot "A" rows) as the next segment; returns its
+        # number (register it once the archive run is committed)
+        os.makedirs(self.directory, exist_ok=True)
+        number = max(self.numbers(), default=0) + 1
+        rows = sorted(rows, key=lambda row: (row[3], row[4], row[0]))
+        encode = json.JSONEncoder(separators=(",", ":"),
+                                  ensure_ascii=False).encode
+        by_number, patients, dates, date_offsets = [], {}, [], []
+        offset = 0
+        path = self._path(number, "jsonl")
+        with open(path + ".tmp", "wb") as f:
+            for row in rows:
+                line = (encode(row) + "\n").encode("utf-8")
+                by_number.append((int(row[0][1:]), offset))
+                patients.setdefault(row[1], []).append(offset)
+                if not dates or dates[-1] != row[3]:
+                    dates.append(row[3])
+                    date_offsets.append(offset)
+                f.write(line)
+                offset += len(line)
+            f.flush()
+            os.fsync(f.fileno())
+        by_number.sort()
+        index = {"rows": len(rows),
+                 "numbers": [n for n, _ in by_number],
+                 "offsets": [o for _, o in by_number],
+                 "patients": patients, "dates": dates,
+                 "date_offsets": date_offsets}
+        with open(self._path(number, "idx") + ".tmp", "w",
+                  encoding="utf-8") as f:
+            f.write(encode(index))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        os.replace(self._path(number, "idx") + ".tmp", self._path(number, "idx"))
+        _fsync_dir(self.directory)
+        return number
+
+    def register(self, number: int) -> ArchiveSegment:
+        # open a committed segment and add it to the lookups
+        try:
+            with open(self._path(number, "idx"), encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            raise JournalError(f"Archive segment {number} is missing or "
+                               f"damaged in {self.directory}.") from None
+        segment = ArchiveSegment(number, self._path(number, "jsonl"), index)
+        self.segments.append(segment)
+        return segment
+
+    def close(self) -> None:
+        for segment in self.segments:
+            segment.close()
+
+    def get(self, appointment_id: str):
+        # the archived row of one appointment, or None
+        for segment in self.segments:
+            row = segment.get(appointment_id)
+            if row is not None:
+                return row
+        return None
+
+    def patient_rows(self, patient_id: str) -> list:
+        # a patient's archived rows, by date and time
+        rows = [row for segment in self.segments
+                for row in segment.patient_rows(patient_id)]
+        if len(self.segments) > 1:
+            rows.sort(key=lambda row: (row[3], row[4], row[0]))
+        return rows
+
+    def rows(self, date_from: str = None, date_to: str = None):
+        # yield archived rows in a date range, by date and time (segments
+        # can overlap in time, so they are merged)
+        streams = [segment.rows(date_from, date_to)
+                   for segment in self.segments]
+        if len(streams) == 1:
+            return streams[0]
+        return heapq.merge(*streams, key=lambda row: (row[3], row[4], row[0]))
+
+
+# -----------------------------------------------------------------------------
+# Storage: SQLite Backend
+# -----------------------------------------------------------------------------
+class _SQLiteTable(collections.abc.Mapping):
+    # read-only dict-like view (id -> object) over one SQLite table, so
+    # code written against HospitalSystem's dicts keeps working
+    def __init__(self, db, table: str, key: str, load):
+        self._db = db
+        self._table = table
+        self._key = key
+        # loader: id -> object, or None if the row does not exist
+        self._load = load
+
+    def __getitem__(self, item):
+        obj = self._load(item)
+        if obj is None:
+            raise KeyError(item)
+        return obj
+
+    def __contains__(self, item) -> bool:
+        # primary-key probe without building the object
+        return self._db.execute(
+            f"SELECT 1 FROM {self._table} WHERE {self._key} = ?",
+            (item,)).fetchone() is not None
+
+    def __iter__(self):
+        # stream keys from a cursor
+        for (key,) in self._db.execute(
+                f"SELECT {self._key} FROM {self._table} ORDER BY rowid"):
+            yield key
+
+    def __len__(self) -> int:
+        return self._db.execute(
+            f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+
+
+class SQLiteHospitalSystem(HospitalSystem):
+    # HospitalSystem backed by a local SQLite database instead of dicts.
+    # patients/doctors/appointments are dict-like views that load objects
+    # on demand; objects handed out are detached copies of the rows, and
+    # every change goes through the methods below
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS patients (
+            patient_id TEXT PRIMARY KEY,
+            first_name TEXT, middle_name TEXT, last_name TEXT,
+            dob TEXT, age INTEGER, gender TEXT,
+            address TEXT, telephone TEXT, place_of_birth TEXT,
+            occupation TEXT, employer TEXT,
+            father_fn TEXT, father_ln TEXT, mother_fn TEXT, mother_ln TEXT,
+            ward TEXT, union_status TEXT, religion TEXT,
+            nok_fn TEXT, nok_ln TEXT, nok_address TEXT, nok_relation TEXT,
+            nok_phone TEXT);
+        CREATE INDEX IF NOT EXISTS idx_patients_first
+            ON patients (first_name COLLATE NOCASE);
+        CREATE INDEX IF NOT EXISTS idx_patients_last
+            ON patients (last_name COLLATE NOCASE);
+        CREATE INDEX IF NOT EXISTS idx_patients_phone ON patients (telephone);
+        CREATE INDEX IF NOT EXISTS idx_patients_nok_phone ON patients (nok_phone);
+        CREATE INDEX IF NOT EXISTS idx_patients_dob ON patients (dob);
+        -- name trigrams (PatientIndex.name_grams), as the memory index
+        CREATE TABLE IF NOT EXISTS patient_grams (
+            gram TEXT NOT NULL,
+            patient_id TEXT NOT NULL,
+            PRIMARY KEY (gram, patient_id)) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS doctors (
+            doctor_id TEXT PRIMARY KEY,
+            first_name TEXT, last_name TEXT, gender TEXT, speciality TEXT);
+        -- free slots only; booking deletes the row, cancelling restores it
+        CREATE TABLE IF NOT EXISTS slots (
+            doctor_id TEXT NOT NULL,
+            slot TEXT NOT NULL,            -- 'YYYY-MM-DD HH:MM' (sorts by time)
+            speciality_key TEXT NOT NULL,  -- SpecialityIndex.normalise()
+            PRIMARY KEY (doctor_id, slot)) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_slots_speciality
+            ON slots (speciality_key, slot);
+        CREATE TABLE IF NOT EXISTS appointments (
+            appointment_id TEXT PRIMARY KEY,
+            patient_id TEXT NOT NULL,
+            doctor_id TEXT NOT NULL,
+            date TEXT NOT NULL,
+            time TEXT NOT NULL,
+            status TEXT NOT NULL,
+            booked INTEGER NOT NULL DEFAULT 0,   -- Appointment.booked
+            duration INTEGER NOT NULL DEFAULT 15);  -- minutes
+        CREATE INDEX IF NOT EXISTS idx_appt_doctor_slot
+            ON appointments (doctor_id, date, time);
+        CREATE INDEX IF NOT EXISTS idx_appt_patient ON appointments (patient_id);
+        CREATE INDEX IF NOT EXISTS idx_appt_status ON appointments (status);
+        CREATE INDEX IF NOT EXISTS idx_appt_date ON appointments (date);
+        CREATE TABLE IF NOT EXISTS fees (
+            key TEXT PRIMARY KEY,          -- FeeCatalogue.normalise()
+            service TEXT NOT NULL,
+            fee INTEGER NOT NULL);
+        CREATE TABLE IF NOT EXISTS invoices (
+            invoice_id TEXT PRIMARY KEY,
+            appointment_id TEXT NOT NULL UNIQUE,
+            doctor_id TEXT NOT NULL,
+            date TEXT NOT NULL,            -- service (appointment) date
+            issued TEXT NOT NULL,
+            total INTEGER NOT NULL);
+        CREATE INDEX IF NOT EXISTS idx_invoices_date ON invoices (date);
+        CREATE TABLE IF NOT EXISTS invoice_items (
+            invoice_id TEXT NOT NULL,
+            line INTEGER NOT NULL,
+            service TEXT NOT NULL,
+            fee INTEGER NOT NULL,
+            PRIMARY KEY (invoice_id, line)) WITHOUT ROWID;
+        -- waiting list; the queue index finds the best waiting entry of
+        -- a doctor or speciality with one probe
+        CREATE TABLE IF NOT EXISTS waitlist (
+            entry_id TEXT PRIMARY KEY,
+            patient_id TEXT NOT NULL,
+            doctor_id TEXT,
+            speciality TEXT,
+            scope TEXT NOT NULL,           -- 'D <doctor_id>' / 'S <speciality key>'
+            urgency INTEGER NOT NULL,
+            joined INTEGER NOT NULL,
+            seq INTEGER NOT NULL,          -- entry number (last tie-break)
+            earliest TEXT,
+            latest TEXT,
+            status TEXT NOT NULL,
+            appointment_id TEXT,
+            vacated TEXT);
+        CREATE INDEX IF NOT EXISTS idx_waitlist_queue
+            ON waitlist (scope, status, urgency DESC, joined, seq);
+        CREATE INDEX IF NOT EXISTS idx_waitlist_vacated ON waitlist (vacated);
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        # autocommit mode; multi-statement changes use _transaction()
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self.db.executescript(self.SCHEMA)
+        # databases created before booking stamps / durations lack the
+        # columns (added in this order, so positional inserts still fit)
+        columns = {row[1] for row in self.db.execute(
+            "PRAGMA table_info(appointments)")}
+        if "booked" not in columns:
+            self.db.execute("ALTER TABLE appointments ADD COLUMN "
+                            "booked INTEGER NOT NULL DEFAULT 0")
+        if "duration" not in columns:
+            self.db.execute("ALTER TABLE appointments ADD COLUMN duration "
+                            f"INTEGER NOT NULL DEFAULT {SLOT_MINUTES}")
+        # dict-like views replacing the in-memory dictionaries
+        self.patients = _SQLiteTable(self.db, "patients", "patient_id",
+                                     self._load_patient)
+        self.doctors = _SQLiteTable(self.db, "doctors", "doctor_id",
+                                    self._load_doctor)
+        self.appointments = _SQLiteTable(self.db, "appointments",
+                                         "appointment_id",
+                                         self._load_appointment)
+        self.invoices = _SQLiteTable(self.db, "invoices", "invoice_id",
+                                     self._load_invoice)
+        # the (small) fee catalogue is cached in memory
+        for service, fee in self.db.execute("SELECT service, fee FROM fees"):
+            self.fees.set(service, fee)
+        # resume the ID counters from the highest IDs stored
+        for attr, table, key in (("_pcounter", "patients", "patient_id"),
+                                 ("_dcounter", "doctors", "doctor_id"),
+                                 ("_acounter", "appointments", "appointment_id"),
+                                 ("_icounter", "invoices", "invoice_id"),
+                                 ("_wcounter", "waitlist", "entry_id")):
+            setattr(self, attr, self.db.execute(
+                f"SELECT COALESCE(MAX(CAST(substr({key}, 2) AS INTEGER)), 0) "
+                f"FROM {table}").fetchone()[0])
+        # databases created before names were trigram-indexed
+        if not self.db.execute("SELECT 1 FROM patient_grams LIMIT 1").fetchone():
+            with self._transaction() as db:
+                for pid, *name in db.execute(
+                        "SELECT patient_id, first_name, middle_name, "
+                        "last_name FROM patients").fetchall():
+                    self._index_names(pid, *name)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # run a block as one write transaction (rolled back on error);
+        # nested blocks join the enclosing transaction
+        if self.db.in_transaction:
+            yield self.db
+            return
+        # IDs issued inside a rolled-back block are issued again, as the
+        # memory backend does
+        counters = (self._pcounter, self._dcounter, self._acounter,
+                    self._icounter, self._wcounter)
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.db
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            (self._pcounter, self._dcounter, self._acounter,
+             self._icounter, self._wcounter) = counters
+            raise
+        self.db.execute("COMMIT")
+
+    def close(self) -> None:
+        # close the database connection
+        self.db.close()
+
+    def archive_appointments(self, before: str) -> int:
+        # appointments already live on disk here, read by index
+        raise ValueError("The SQLite backend does not archive appointments.")
+
+    def read_snapshot(self):
+        # its reads are not versioned: a report sees the tables as they are
+        raise ValueError("The SQLite backend does not support read snapshots.")
+
+    def bulk(self):
+        # group many operations into a single transaction
+        return self._transaction()
+
+    # -- loaders --------------------------------------------------------------
+    def _load_patient(self, patient_id: str, history: bool = True):
+        # build a Patient from its row (plus appointment history)
+        row = self.db.execute(
+            f"SELECT {', '.join(PATIENT_FIELDS[:-1])} FROM patients "
+            f"WHERE patient_id = ?", (patient_id,)).fetchone()
+        if row is None:
+            return None
+        patient = Patient(*row, patient_id)
+        if history:
+            doctors = {}
+            for (aid, did, fn, ln, date, time, status,
+                 duration) in self.db.execute(
+                    "SELECT a.appointment_id, a.doctor_id, d.first_name, "
+                    "d.last_name, a.date, a.time, a.status, a.duration "
+                    "FROM appointments a JOIN doctors d USING (doctor_id) "
+                    "WHERE a.patient_id = ? ORDER BY a.rowid", (patient_id,)):
+                if did not in doctors:
+                    doctors[did] = Doctor(fn, ln, "", did, "", ())
+                appt = Appointment(aid, patient, doctors[did], date, time,
+                                   duration)
+                appt.status = status
+                patient.appointment_list.append(appt)
+        return patient
+
+    def _load_doctor(self, doctor_id: str, schedule: bool = True):
+        # build a Doctor from its row (plus free slots)
+        row = self.db.execute(
+            "SELECT first_name, last_name, gender, speciality FROM doctors "
+            "WHERE doctor_id = ?", (doctor_id,)).fetchone()
+        if row is None:
+            return None
+        fn, ln, gender, speciality = row
+        slots = ()
+        if schedule:
+            slots = [tuple(slot.split()) for (slot,) in self.db.execute(
+                "SELECT slot FROM slots WHERE doctor_id = ? ORDER BY slot",
+                (doctor_id,))]
+        return Doctor(fn, ln, gender, doctor_id, speciality, slots)
+
+    def _load_appointment(self, appointment_id: str):
+        # build an Appointment (with patient/doctor rows, no history/slots)
+        row = self.db.execute(
+            "SELECT patient_id, doctor_id, date, time, status, booked, "
+            "duration FROM appointments WHERE appointment_id = ?",
+            (appointment_id,)).fetchone()
+        if row is None:
+            return None
+        pid, did, date, time, status, booked, duration = row
+        appt = Appointment(appointment_id,
+                           self._load_patient(pid, history=False),
+                           self._load_doctor(did, schedule=False), date, time,
+                           duration)
+        appt.status = status
+        appt.booked = booked
+        return appt
+
+    def _load_invoice(self, invoice_id: str):
+        # build an Invoice from its row and item lines
+        row = self.db.execute(
+            "SELECT appointment_id, doctor_id, date, issued FROM invoices "
+            "WHERE invoice_id = ?", (invoice_id,)).fetchone()
+        if row is None:
+            return None
+        items = self.db.execute(
+            "SELECT service, fee FROM invoice_items WHERE invoice_id = ? "
+            "ORDER BY line", (invoice_id,))
+        return Invoice(invoice_id, *row, items)
+
+    # -- operations -----------------------------------------------------------
+    def register_patient(self, *fields) -> str:
+        # insert a patient row; returns the new patient ID
+        with self._transaction() as db:
+            pid = self._generate_id("P")
+            db.execute(f"INSERT INTO patients (patient_id, "
+                       f"{', '.join(PATIENT_FIELDS[:-1])}) VALUES "
+                       f"({', '.join('?' * len(PATIENT_FIELDS))})",
+                       (pid, *fields))
+            self._index_names(pid, *fields[:3])
+        return pid
+
+    def _index_names(self, patient_id: str, first: str, middle: str,
+                     last: str) -> None:
+        # add a patient's name trigrams for search_patients()
+        self.db.executemany("INSERT OR IGNORE INTO patient_grams VALUES (?, ?)",
+                            ((gram, patient_id) for gram in
+                             PatientIndex.name_grams(first, middle, last)))
+
+    def register_doctor(self, fn: str, ln: str, gender: str,
+                        speciality: str, schedule) -> str:
+        # insert a doctor row and its free slots; returns the doctor ID
+        self.check_schedule(schedule)
+        key = SpecialityIndex.normalise(speciality)
+        slots = SlotIndex(schedule)
+        with self._transaction() as db:
+            did = self._generate_id("D")
+            db.execute("INSERT INTO doctors VALUES (?, ?, ?, ?, ?)",
+                       (did, fn, ln, gender, speciality))
+            db.executemany("INSERT INTO slots VALUES (?, ?, ?)",
+                           ((did, f"{date} {time}", key)
+                            for date, time in slots))
+        return did
+
+    def check_schedule(self, schedule) -> None:
+        if isinstance(schedule, (dict, RuleSchedule)):
+            # the slots table holds explicit slots only
+            raise ValueError("Recurring availability rules need the memory "
+                             "backend; list the slots instead.")
+
+    def make_booking(self, patient_id: str, doctor_id: str, date: str,
+                     time: str, duration: int = SLOT_MINUTES) -> Appointment:
+        # check and consume the slot(s) atomically in one transaction
+        check_duration(duration)
+        with self._transaction() as db:
+            if db.execute("SELECT 1 FROM patients WHERE patient_id = ?",
+                          (patient_id,)).fetchone() is None:
+                raise BookingError("Patient ID not found.")
+            if db.execute("SELECT 1 FROM doctors WHERE doctor_id = ?",
+                          (doctor_id,)).fetchone() is None:
+                raise BookingError("Doctor ID not found.")
+            # deleting the free-slot rows is the availability check itself
+            if db.execute("DELETE FROM slots WHERE doctor_id = ? AND slot = ?",
+                          (doctor_id, f"{date} {time}")).rowcount != 1:
+                raise BookingError("Doctor not available at that slot.")
+            rest = self._span_keys(date, time, duration)[1:]
+            if rest and db.execute(
+                    f"DELETE FROM slots WHERE doctor_id = ? AND slot IN "
+                    f"({', '.join('?' * len(rest))})",
+                    (doctor_id, *rest)).rowcount != len(rest):
+                raise BookingError("Doctor not available for the whole "
+                                   f"{duration} minutes.")
+            self._check_overlap(patient_id, doctor_id, date, time, duration)
+            aid = self._generate_id("A")
+            booked = _minutes(self.clock())
+            db.execute("INSERT INTO appointments VALUES "
+                       "(?, ?, ?, ?, ?, ?, ?, ?)",
+                       (aid, patient_id, doctor_id, date, time, "Confirmed",
+                        booked, duration))
+        appt = Appointment(aid, self._load_patient(patient_id, history=False),
+                           self._load_doctor(doctor_id, schedule=False),
+                           date, time, duration)
+        appt.confirm()
+        appt.booked = booked
+        return appt
+
+    def cancel_booking(self, appointment_id: str,
+                       refill: bool = True) -> Appointment:
+        # mark the appointment canceled and either restore the slot or
+        # book the best waiting patient into it, atomically
+        with self._transaction() as db:
+            row = db.execute("SELECT doctor_id, date, time, status, duration "
+                             "FROM appointments WHERE appointment_id = ?",
+                             (appointment_id,)).fetchone()
+            if row is None:
+                raise BookingError("Appointment ID not found.")
+            did, date, time, status, duration = row
+            if status == "Canceled":
+                raise BookingError("Already canceled.")
+            db.execute("UPDATE appointments SET status = 'Canceled' "
+                       "WHERE appointment_id = ?", (appointment_id,))
+            (speciality,) = db.execute(
+                "SELECT speciality FROM doctors WHERE doctor_id = ?",
+                (did,)).fetchone()
+            key = SpecialityIndex.normalise(speciality)
+            waiting = None
+            if refill and parse_slot(date, time) > self.clock():
+                waiting = self._best_waiting(did, key, date, time)
+            slots = self._span_keys(date, time, duration)
+            # the first slot never becomes free if it goes to the entry
+            db.executemany("INSERT OR IGNORE INTO slots VALUES (?, ?, ?)",
+                           ((did, slot, key)
+                            for slot in slots[waiting is not None:]))
+            if waiting is not None:
+                aid = self._generate_id("A")
+                db.execute("INSERT INTO appointments VALUES "
+                           "(?, ?, ?, ?, ?, ?, ?, ?)",
+                           (aid, waiting[0], did, date, time, "Confirmed",
+                            _minutes(self.clock()), SLOT_MINUTES))
+                db.execute("UPDATE waitlist SET status = 'Booked', "
+                           "appointment_id = ?, vacated = ? "
+                           "WHERE entry_id = ?",
+                           (aid, appointment_id, waiting[1]))
+        return self._load_appointment(appointment_id)
+
+    @staticmethod
+    def _scope_key(doctor_id: str = None, speciality: str = None) -> str:
+        # the waitlist.scope value for WaitingList.scope()
+        return " ".join(WaitingList.scope(doctor_id, speciality))
+
+    def _best_waiting(self, doctor_id: str, speciality_key: str, date: str,
+                      time: str):
+        # (patient_id, entry_id) of the best entry accepting date in the
+        # doctor's or the speciality's queue whose patient is free for a
+        # SLOT_MINUTES appointment at time, or None
+        start = _minutes(parse_slot(date, time))
+        best = None
+        for scope in (f"D {doctor_id}", f"S {speciality_key}"):
+            for row in self.db.execute(
+                    "SELECT -urgency, joined, seq, patient_id, entry_id "
+                    "FROM waitlist WHERE scope = ? AND status = 'Waiting' "
+                    "AND (earliest IS NULL OR earliest <= ?) "
+                    "AND (latest IS NULL OR latest >= ?) "
+                    "ORDER BY urgency DESC, joined, seq",
+                    (scope, date, date)):
+                if not self.overlapping(start, start + SLOT_MINUTES,
+                                        patient_id=row[3]):
+                    if best is None or row < best:
+                        best = row
+                    break
+        return None if best is None else best[3:]
+
+    @staticmethod
+    def _span_keys(date: str, time: str, duration: int) -> list:
+        # slots-table keys of the SLOT_MINUTES slots a booking spans
+        # (SQLite schedules are slot lists, never rules)
+        start = parse_slot(date, time)
+        return [f"{start + k * _SLOT_STEP:%Y-%m-%d %H:%M}"
+                for k in range(-(-duration // SLOT_MINUTES))]
+
+    def overlapping(self, start: int, end: int, doctor_id: str = None,
+                    patient_id: str = None) -> list:
+        # indexed scan of the days that can hold an overlapping appointment
+        # (none is longer than MAX_DURATION), exact test in Python
+        column, key = (("doctor_id", doctor_id) if doctor_id
+                       else ("patient_id", patient_id))
+        found = []
+        for aid, date, time, duration in self.db.execute(
+                f"SELECT appointment_id, date, time, duration "
+                f"FROM appointments WHERE {column} = ? AND date BETWEEN ? "
+                f"AND ? AND status = 'Confirmed'",
+                (key, _day_text((start - MAX_DURATION) // 1440),
+                 _day_text((end - 1) // 1440))):
+            at = _minutes(parse_slot(date, time))
+            if at < end and at + duration > start:
+                found.append((at, aid))
+        return [self._load_appointment(aid) for _, aid in sorted(found)]
+
+    def refill_of(self, appointment_id: str):
+        row = self.db.execute("SELECT appointment_id FROM waitlist "
+                              "WHERE vacated = ?", (appointment_id,)).fetchone()
+        return None if row is None else self._load_appointment(row[0])
+
+    def join_waitlist(self, patient_id: str, doctor_id: str = None,
+                      speciality: str = None, urgency: int = 1,
+                      earliest: str = None, latest: str = None,
+                      joined: int = None) -> str:
+        entry = self._waitlist_entry(patient_id, doctor_id, speciality,
+                                     urgency, earliest, latest, joined)
+        with self._transaction() as db:
+            db.execute("INSERT INTO waitlist VALUES "
+                       "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULL, NULL)",
+                       (entry.entry_id, entry.patient_id, entry.doctor_id,
+                        entry.speciality,
+                        self._scope_key(entry.doctor_id, entry.speciality),
+                        entry.urgency, entry.joined, int(entry.entry_id[1:]),
+                        entry.earliest, entry.latest, entry.status))
+        return entry.entry_id
+
+    def leave_waitlist(self, entry_id: str) -> None:
+        with self._transaction() as db:
+            row = db.execute("SELECT status FROM waitlist WHERE entry_id = ?",
+                             (entry_id,)).fetchone()
+            if row is None:
+                raise BookingError("Waiting list entry not found.")
+            if row[0] != "Waiting":
+                raise BookingError(f"Entry is no longer waiting ({row[0]}).")
+            db.execute("UPDATE waitlist SET status = 'Removed' "
+                       "WHERE entry_id = ?", (entry_id,))
+
+    def waitlist_queue(self, doctor_id: str = None,
+                       speciality: str = None) -> list:
+        entries = []
+        for row in self.db.execute(
+                "SELECT entry_id, patient_id, doctor_id, speciality, urgency, "
+                "joined, earliest, latest FROM waitlist "
+                "WHERE scope = ? AND status = 'Waiting' "
+                "ORDER BY urgency DESC, joined, seq",
+                (self._scope_key(doctor_id, speciality),)):
+            entries.append(WaitlistEntry(*row))
+        return entries
+
+    def search_patients(self, text: str, limit: int = 20) -> list:
+        # the memory backend's search on indexed lookups: name trigrams
+        # (patient_grams), phone/DOB equality or ranges; ties go to the
+        # earlier registration, so both backends return the same list
+        criteria = parse_patient_query(text)
+        names = [token for token in criteria["names"] if token]
+        where, params = [], []
+        grams = set()
+        for token in names:
+            grams |= PatientIndex.query_grams(token)
+        if grams:
+            where.append("patient_id IN (" + " INTERSECT ".join(
+                ["SELECT patient_id FROM patient_grams WHERE gram = ?"]
+                * len(grams)) + ")")
+            params += sorted(grams)
+        if criteria.get("phone"):
+            where.append("(telephone = ? OR nok_phone = ?)")
+            params += [criteria["phone"]] * 2
+        if criteria.get("dob_from"):
+            where.append("dob BETWEEN ? AND ?")
+            params += [criteria["dob_from"], criteria["dob_to"]]
+        if not where:
+            return []
+        # rank on the name columns; only the results are loaded
+        scored = []
+        for rowid, pid, *name in self.db.execute(
+                "SELECT rowid, patient_id, first_name, middle_name, last_name "
+                "FROM patients WHERE " + " AND ".join(where), params):
+            points = PatientIndex.score_name(*name, names) if names else 1
+            if points:
+                scored.append((points, -rowid, pid))
+        best = heapq.nlargest(limit, scored, key=lambda item: item[:2])
+        return [(points, self._load_patient(pid, history=False))
+                for points, _, pid in best]
+
+    def slot_is_free(self, doctor_id: str, date: str, time: str,
+                     duration: int = SLOT_MINUTES) -> bool:
+        # primary-key probes of the free-slot table
+        try:
+            slots = self._span_keys(date, time, duration)
+        except ValueError:
+            return False
+        return self.db.execute(
+            f"SELECT COUNT(*) FROM slots WHERE doctor_id = ? AND slot IN "
+            f"({', '.join('?' * len(slots))})",
+            (doctor_id, *slots)).fetchone()[0] == len(slots)
+
+    def _apply_batch(self, rows: list) -> list:
+        # one transaction for the whole batch: any failure rolls it all back
+        with self._transaction():
+            return [self.make_booking(*row).appointment_id for row in rows]
+
+    def next_available(self, speciality: str, count: int = 5,
+                       after: datetime.datetime = None) -> list:
+        # earliest free slots for a speciality via idx_slots_speciality
+        start = "" if after is None else f"{after:%Y-%m-%d %H:%M}"
+        doctors = {}
+        result = []
+        for slot, did in self.db.execute(
+                "SELECT slot, doctor_id FROM slots WHERE speciality_key = ? "
+                "AND slot >= ? ORDER BY slot, doctor_id LIMIT ?",
+                (SpecialityIndex.normalise(speciality), start, count)):
+            if did not in doctors:
+                doctors[did] = self._load_doctor(did, schedule=False)
+            date, time = slot.split()
+            result.append((date, time, doctors[did]))
+        return result
+
+    @staticmethod
+    def _where(date_from: str = None, date_to: str = None, status: str = None,
+               doctor_id: str = None, patient_id: str = None) -> tuple:
+        # WHERE clause for appointment filters; each maps onto an index
+        where, params = [], []
+        for clause, value in (("a.date >= ?", date_from),
+                              ("a.date <= ?", date_to),
+                              ("a.status = ?", status),
+                              ("a.doctor_id = ?", doctor_id),
+                              ("a.patient_id = ?", patient_id)):
+            if value:
+                where.append(clause)
+                params.append(value)
+        return ("WHERE " + " AND ".join(where) + " " if where else ""), params
+
+    def query_appointments(self, **filters):
+        # matching appointments ordered by date and time
+        where, params = self._where(**filters)
+        for (aid,) in self.db.execute(
+                "SELECT a.appointment_id FROM appointments a " + where +
+                "ORDER BY a.date, a.time, a.appointment_id", params):
+            yield self._load_appointment(aid)
+
+    def appointment_rows(self, **filters):
+        # stream matching appointment rows straight from a cursor
+        where, params = self._where(**filters)
+        yield from self.db.execute(
+            "SELECT a.appointment_id, p.first_name, p.last_name, "
+            "d.first_name, d.last_name, a.date, a.time, a.status "
+            "FROM appointments a "
+            "JOIN patients p USING (patient_id) "
+            "JOIN doctors d USING (doctor_id) " + where +
+            ("ORDER BY a.date, a.time, a.appointment_id" if where
+             else "ORDER BY a.rowid"), params)
+
+    def export_rows(self, kind: str, **filters):
+        # stream export rows from one SELECT; a cursor reads a single
+        # version of the database (WAL), so no snapshot is needed
+        if kind == "appointments":
+            where, params = self._where(**filters)
+            for (aid, pid, did, date, time, duration, status,
+                 booked) in self.db.execute(
+                    "SELECT a.appointment_id, a.patient_id, a.doctor_id, "
+                    "a.date, a.time, a.duration, a.status, a.booked "
+                    "FROM appointments a " + where + "ORDER BY a.rowid",
+                    params):
+                yield (aid, pid, did, date, time, duration, status,
+                       _export_stamp(booked))
+        elif kind == "patients":
+            yield from self.db.execute(
+                f"SELECT patient_id, {', '.join(PATIENT_COLUMNS)} "
+                f"FROM patients ORDER BY rowid")
+        else:
+            where, params = self._where(filters.get("date_from"),
+                                        filters.get("date_to"),
+                                        doctor_id=filters.get("doctor_id"))
+            # one row per invoice line, grouped back into invoices
+            # (invoices are aliased 'a' so the _where() clauses apply)
+            lines = self.db.execute(
+                "SELECT a.invoice_id, a.appointment_id, a.doctor_id, a.date, "
+                "a.issued, a.total, l.service, l.fee FROM invoices a "
+                "LEFT JOIN invoice_items l USING (invoice_id) " + where +
+                "ORDER BY a.rowid, l.line", params)
+            for head, group in itertools.groupby(
+                    lines, key=lambda line: line[:6]):
+                yield _export_invoice(*head, [line[6:] for line in group
+                                              if line[6] is not None])
+
+    def daily_counts(self, date_from: str = None, date_to: str = None,
+                     status: str = None) -> dict:
+        # aggregate in SQL instead of keeping a columnar copy
+        where, params = self._where(date_from, date_to, status)
+        return {(did, date): n for did, date, n in self.db.execute(
+            "SELECT a.doctor_id, a.date, COUNT(*) FROM appointments a " +
+            where + "GROUP BY a.doctor_id, a.date", params)}
+
+    def cancellation_rates(self) -> dict:
+        return dict(self.db.execute(
+            "SELECT doctor_id, AVG(status = 'Canceled') FROM appointments "
+            "GROUP BY doctor_id"))
+
+    def billed_totals(self) -> dict:
+        return self.revenue("doctor")
+
+    # -- billing --------------------------------------------------------------
+    def set_fee(self, service: str, fee: int) -> None:
+        self.fees.set(service, fee)
+        service, fee = self.fees.get(service)
+        self.db.execute("INSERT OR REPLACE INTO fees VALUES (?, ?, ?)",
+                        (FeeCatalogue.normalise(service), service, fee))
+
+    def invoice_for(self, appointment_id: str):
+        row = self.db.execute(
+            "SELECT invoice_id FROM invoices WHERE appointment_id = ?",
+            (appointment_id,)).fetchone()
+        return None if row is None else self._load_invoice(row[0])
+
+    def _uninvoiced(self, date_from: str, date_to: str) -> list:
+        where, params = self._where(date_from, date_to, "Confirmed")
+        return [self._load_appointment(aid) for (aid,) in self.db.execute(
+            "SELECT a.appointment_id FROM appointments a " + where +
+            ("AND " if where else "WHERE ") +
+            "NOT EXISTS (SELECT 1 FROM invoices i "
+            "WHERE i.appointment_id = a.appointment_id) "
+            "ORDER BY a.date, a.time, a.appointment_id", params)]
+
+    def _commit_invoices(self, appts: list, items: list,
+                         issued: str = None) -> list:
+        # insert the invoices and their lines in one transaction
+        issued = issued or datetime.date.today().isoformat()
+        with self._transaction() as db:
+            invoices = [Invoice.for_appointment(self._generate_id("I"), appt,
+                                                issued, items)
+                        for appt in appts]
+            db.executemany(
+                "INSERT INTO invoices VALUES (?, ?, ?, ?, ?, ?)",
+                ((i.invoice_id, i.appointment_id, i.doctor_id, i.date,
+                  i.issued, i.total) for i in invoices))
+            db.executemany(
+                "INSERT INTO invoice_items VALUES (?, ?, ?, ?)",
+                ((i.invoice_id, line, service, fee) for i in invoices
+                 for line, (service, fee) in enumerate(i.items)))
+        return invoices
+
+    def revenue(self, by: str = "doctor", date_from: str = None,
+                date_to: str = None) -> dict:
+        # GROUP BY over the invoices (date-range filters use the index)
+        column = {"doctor": "i.doctor_id", "day": "i.date",
+                  "service": "l.service"}.get(by)
+        if column is None:
+            raise ValueError(f"by: one of {', '.join(RevenueLedger.DIMENSIONS)}")
+        where, params = self._where(date_from, date_to)
+        where = where.replace("a.date", "i.date")
+        if by == "service":
+            sql = ("SELECT l.service, SUM(l.fee) FROM invoices i JOIN "
+                   "invoice_items l USING (invoice_id) ")
+        else:
+            sql = f"SELECT {column}, SUM(i.total) FROM invoices i "
+        return dict(self.db.execute(sql + where + f"GROUP BY {column}",
+                                    params))
+
+    def analytics(self) -> AppointmentColumns:
+        # the aggregates above run as SQL, so no columnar copy is kept;
+        # callers get a throwaway one of every appointment (and its bill)
+        columns = self._report_columns(None, None)
+        for aid, total in self.db.execute(
+                "SELECT appointment_id, total FROM invoices"):
+            columns.set_billed(aid, total)
+        return columns
+
+    def _report_columns(self, date_from: str, date_to: str):
+        # load just the date range into a throwaway columnar copy
+        columns = AppointmentColumns()
+        where, params = self._where(date_from, date_to)
+        for aid, pid, did, date, time, status, booked in self.db.execute(
+                "SELECT a.appointment_id, a.patient_id, a.doctor_id, a.date, "
+                "a.time, a.status, a.booked FROM appointments a " + where,
+                params):
+            columns.add_row(aid, pid, did, _minutes(parse_slot(date, time)),
+                            status, booked)
+        return columns
+
+    def _doctor_specialities(self) -> dict:
+        return dict(self.db.execute(
+            "SELECT doctor_id, speciality FROM doctors"))
+
+    def _free_slot_counts(self, date_from: str, date_to: str) -> dict:
+        # slots sort as text, so the range is a primary-key scan
+        end = (datetime.date.fromisoformat(date_to)
+               + datetime.timedelta(days=1)).isoformat()
+        return dict(self.db.execute(
+            "SELECT doctor_id, COUNT(*) FROM slots WHERE slot >= ? "
+            "AND slot < ? GROUP BY doctor_id", (date_from, end)))
+
+
+# -----------------------------------------------------------------------------
+# Concurrency: Thread-Safe System
+# -----------------------------------------------------------------------------
+class ThreadSafeHospitalSystem(HospitalSystem):
+    # in-memory HospitalSystem shared by several threads (e.g. one per
+    # front-desk terminal):
+    #   - each doctor maps to one of `stripes` locks; a booking or
+    #     cancellation holds its doctor's stripe from the availability
+    #     check to the slot update, so two terminals can never book the
+    #     same slot, while bookings on other stripes are not held up
+    #   - the shared registries, indexes, ID counters and the journal are
+    #     updated under one short re-entrant lock (`lock`), so IDs are
+    #     unique and journaled in the order they were issued
+    # bookings check the patient's overlaps under `lock`. Batches lock
+    # every doctor they touch (in stripe order, so two batches cannot
+    # deadlock) and re-check overlaps as they are applied. Invoicing and
+    # fee changes run under `lock` from the already-invoiced check to the
+    # commit. The aggregates and the operations report run under `lock`
+    # too (they read the columnar store bookings append to); reports that
+    # should not hold up bookings read a ReadSnapshot instead. Listings
+    # iterate the shared registries and should run while holding `lock`
+    STRIPES = 64
+
+    def __init__(self, stripes: int = STRIPES):
+        super().__init__()
+        self._stripes = [threading.Lock() for _ in range(stripes)]
+        self.lock = threading.RLock()
+
+    def _stripe_number(self, doctor_id: str) -> int:
+        return hash(doctor_id) % len(self._stripes)
+
+    def _stripe(self, doctor_id: str) -> threading.Lock:
+        # the lock guarding one doctor's schedule
+        return self._stripes[self._stripe_number(doctor_id)]
+
+    def _generate_id(self, prefix: str) -> str:
+        # counters are only advanced under the shared lock
+        with self.lock:
+            return super()._generate_id(prefix)
+
+    def register_patient(self, *fields) -> str:
+        with self.lock:
+            return super().register_patient(*fields)
+
+    def register_doctor(self, fn: str, ln: str, gender: str,
+                        speciality: str, schedule) -> str:
+        with self.lock:
+            return super().register_doctor(fn, ln, gender, speciality,
+                                           schedule)
+
+    def set_fee(self, service: str, fee: int) -> None:
+        with self.lock:
+            super().set_fee(service, fee)
+
+    def invoice(self, appointment_id: str, extras=(),
+                issued: str = None) -> Invoice:
+        with self.lock:
+            return super().invoice(appointment_id, extras, issued)
+
+    def invoice_range(self, date_from: str = None, date_to: str = None,
+                      extras=(), issued: str = None) -> list:
+        with self.lock:
+            return super().invoice_range(date_from, date_to, extras, issued)
+
+    def make_booking(self, patient_id: str, doctor_id: str, date: str,
+                     time: str, duration: int = SLOT_MINUTES) -> Appointment:
+        # check-then-book runs under the doctor's stripe
+        with self._stripe(doctor_id):
+            return super().make_booking(patient_id, doctor_id, date, time,
+                                        duration)
+
+    def _commit_booking(self, patient: Patient, doctor: Doctor, date: str,
+                        time: str, duration: int = SLOT_MINUTES) -> Appointment:
+        # the patient's overlap check and the booking are atomic under
+        # the shared lock (the patient may be booked with any doctor)
+        with self.lock:
+            return super()._commit_booking(patient, doctor, date, time,
+                                           duration)
+
+    def overlapping(self, start: int, end: int, doctor_id: str = None,
+                    patient_id: str = None) -> list:
+        with self.lock:
+            return super().overlapping(start, end, doctor_id, patient_id)
+
+    def analytics(self) -> AppointmentColumns:
+        # building the store and keeping it in step are one section
+        with self.lock:
+            return super().analytics()
+
+    def daily_counts(self, date_from: str = None, date_to: str = None,
+                     status: str = None) -> dict:
+        with self.lock:
+            return super().daily_counts(date_from, date_to, status)
+
+    def cancellation_rates(self) -> dict:
+        with self.lock:
+            return super().cancellation_rates()
+
+    def billed_totals(self) -> dict:
+        with self.lock:
+            return super().billed_totals()
+
+    def revenue(self, by: str = "doctor", date_from: str = None,
+                date_to: str = None) -> dict:
+        with self.lock:
+            return super().revenue(by, date_from, date_to)
+
+    def operations_report(self, date_from: str = None,
+                          date_to: str = None) -> OperationsReport:
+        with self.lock:
+            return super().operations_report(date_from, date_to)
+
+    def read_snapshot(self) -> "ReadSnapshot":
+        # every change runs under `lock`, so the counters read there and
+        # the changes kept from then on line up; reads need no lock
+        with self.lock:
+            return super().read_snapshot()
+
+    def _release_snapshot(self, snapshot: "ReadSnapshot") -> None:
+        with self.lock:
+            super()._release_snapshot(snapshot)
+
+    def archive_appointments(self, before: str) -> int:
+        # every stripe, then the shared lock: no booking or cancellation
+        # can touch an appointment while it moves
+        with contextlib.ExitStack() as stack:
+            for stripe in self._stripes:
+                stack.enter_context(stripe)
+            with self.lock:
+                return super().archive_appointments(before)
+
+    def cancel_booking(self, appointment_id: str,
+                       refill: bool = True) -> Appointment:
+        appt = self.appointments.get(appointment_id)
+        if appt is None:
+            # unknown or archived; the base class says which
+            return super().cancel_booking(appointment_id, refill)
+        # the status check, the slot restore and any refill of the same
+        # slot run under the stripe
+        with self._stripe(appt.doctor.doctor_id):
+            return super().cancel_booking(appointment_id, refill)
+
+    def _commit_cancel(self, appt: Appointment,
+                       refill: bool = True) -> Appointment:
+        # the waiting list is shared across doctors: pick and book under
+        # the shared lock
+        with self.lock:
+            return super()._commit_cancel(appt, refill)
+
+    def join_waitlist(self, patient_id: str, doctor_id: str = None,
+                      speciality: str = None, urgency: int = 1,
+                      earliest: str = None, latest: str = None,
+                      joined: int = None) -> str:
+        with self.lock:
+            return super().join_waitlist(patient_id, doctor_id, speciality,
+                                         urgency, earliest, latest, joined)
+
+    def leave_waitlist(self, entry_id: str) -> None:
+        with self.lock:
+            super().leave_waitlist(entry_id)
+
+    def waitlist_queue(self, doctor_id: str = None,
+                       speciality: str = None) -> list:
+        with self.lock:
+            return super().waitlist_queue(doctor_id, speciality)
+
+    def book_batch(self, rows) -> BatchReport:
+        rows = [tuple(row) for row in rows]
+        numbers = sorted({self._stripe_number(str(row[1]))
+                          for row in rows if len(row) > 1})
+        with contextlib.ExitStack() as stack:
+            for number in numbers:
+                stack.enter_context(self._stripes[number])
+            return super().book_batch(rows)
+
+    def _apply_batch(self, rows: list) -> list:
+        # the whole batch (and any rollback) is one shared-lock section, so
+        # a rollback never hands back IDs another thread has since issued
+        with self.lock:
+            return super()._apply_batch(rows)
+
+
+# -----------------------------------------------------------------------------
+# Instrumentation: Operation Metrics & Profiling
+# -----------------------------------------------------------------------------
+# HospitalSystem operations instrument() can wrap (the non-interactive
+# layer, so the menus, the command protocol and imports are all counted)
+METRIC_OPERATIONS = (
+    "register_patient", "register_doctor", "search_patients",
+    "next_available", "make_booking", "book_batch", "cancel_booking",
+    "join_waitlist", "leave_waitlist",
+    "view_appointments", "generate_bill", "invoice", "invoice_range",
+    "revenue", "operations_report",
+)
+
+
+def error_reason(err: Exception) -> str:
+    # short, low-cardinality label for a failed operation: the words of a
+    # BookingError message without its IDs, otherwise the exception type
+    # (e.g. "doctor not available at that slot", "KeyError")
+    if not isinstance(err, BookingError):
+        return type(err).__name__
+    words = (word.strip(".,:;()'\"").lower() for word in str(err).split())
+    return " ".join(word for word in words if word.isalpha()) or "BookingError"
+
+
+class OperationMetrics:
+    # call counts, error counts per reason and latency histograms per
+    # operation, exportable as Prometheus text or a JSON snapshot.
+    # observe() may be called from several threads
+    # histogram bucket upper bounds in seconds (Prometheus 'le' labels)
+    BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+               0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    def __init__(self):
+        # operation -> [calls, seconds, bucket counts (+Inf last), errors]
+        self._ops = {}
+        self._lock = threading.Lock()
+        self.started = _time.time()
+
+    def observe(self, operation: str, seconds: float,
+                error: str = None) -> None:
+        # record one call of operation (error: its error_reason, if failed)
+        with self._lock:
+            stats = self._ops.get(operation)
+            if stats is None:
+                stats = self._ops[operation] = [
+                    0, 0.0, [0] * (len(self.BUCKETS) + 1), {}]
+            stats[0] += 1
+            stats[1] += seconds
+            # buckets are inclusive upper bounds, as in Prometheus
+            stats[2][bisect.bisect_left(self.BUCKETS, seconds)] += 1
+            if error is not None:
+                stats[3][error] = stats[3].get(error, 0) + 1
+
+    def _quantile(self, counts: list, calls: int, q: float):
+        # upper bound of the bucket holding the q-quantile (None = +Inf)
+        seen = 0
+        for bound, count in zip(self.BUCKETS, counts):
+            seen += count
+            if seen >= q * calls:
+                return bound
+        return None
+
+    def snapshot(self) -> dict:
+        # JSON-ready copy of every counter (bucket counts are cumulative)
+        with self._lock:
+            ops = {name: (calls, seconds, list(counts), dict(errors))
+                   for name, (calls, seconds, counts, errors)
+                   in self._ops.items()}
+        result = {}
+        for name, (calls, seconds, counts, errors) in sorted(ops.items()):
+            cumulative = list(itertools.accumulate(counts))
+            result[name] = {
+                "calls": calls,
+                "errors": sum(errors.values()),
+                "error_reasons": errors,
+                "seconds_total": round(seconds, 6),
+                "mean_seconds": round(seconds / calls, 6),
+                # quantiles are bucket upper bounds
+                "p50_le": self._quantile(counts, calls, 0.5),
+                "p95_le": self._quantile(counts, calls, 0.95),
+                "p99_le": self._quantile(counts, calls, 0.99),
+                "buckets": dict(zip([str(b) for b in self.BUCKETS] + ["+Inf"],
+                                    cumulative)),
+            }
+        return {"started": self.started, "taken": _time.time(),
+                "operations": result}
+
+    def prometheus(self) -> str:
+        # Prometheus text exposition format
+        ops = self.snapshot()["operations"]
+        lines = ["# HELP hms_operation_calls_total Operations called.",
+                 "# TYPE hms_operation_calls_total counter"]
+        lines += [f'hms_operation_calls_total{{op="{name}"}} {stats["calls"]}'
+                  for name, stats in ops.items()]
+        lines += ["# HELP hms_operation_errors_total Operations that failed, "
+                  "by reason.",
+                  "# TYPE hms_operation_errors_total counter"]
+        for name, stats in ops.items():
+            for reason, count in sorted(stats["error_reasons"].items()):
+                label = reason.replace("\\", "\\\\").replace('"', '\\"')
+                lines.append(f'hms_operation_errors_total{{op="{name}",'
+                             f'reason="{label}"}} {count}')
+        lines += ["# HELP hms_operation_seconds Operation latency.",
+                  "# TYPE hms_operation_seconds histogram"]
+        for name, stats in ops.items():
+            for bound, count in stats["buckets"].items():
+                lines.append(f'hms_operation_seconds_bucket{{op="{name}",'
+                             f'le="{bound}"}} {count}')
+            lines.append(f'hms_operation_seconds_sum{{op="{name}"}} '
+                         f'{stats["seconds_total"]}')
+            lines.append(f'hms_operation_seconds_count{{op="{name}"}} '
+                         f'{stats["calls"]}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        # write a JSON snapshot (*.json) or Prometheus text (anything else,
+        # e.g. for node_exporter's textfile collector); replaced atomically
+        text = (json.dumps(self.snapshot(), indent=2) + "\n"
+                if path.lower().endswith(".json") else self.prometheus())
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+
+class OperationProfiler:
+    # opt-in cProfile + tracemalloc capture around every call of one
+    # operation. tracemalloc traces the whole process while the profiler
+    # exists (that is the cost of opting in); cProfile only runs inside
+    # the chosen operation, on the calling thread
+    def __init__(self, operation: str, prefix: str = "hms-profile"):
+        self.operation = operation
+        self.prefix = prefix
+        self.profile = cProfile.Profile()
+        self.calls = 0
+        self.allocated = 0    # bytes still held after the calls, summed
+        self.peak = 0         # largest transient allocation in one call
+        self._depth = 0
+        self._traced = not tracemalloc.is_tracing()
+        if self._traced:
+            tracemalloc.start()
+        # live allocations when the first profiled call began
+        self._baseline = None
+
+    def begin(self) -> None:
+        self._depth += 1
+        if self._depth > 1:
+            # a nested call is already being profiled
+            return
+        if self._baseline is None:
+            self._baseline = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        self._before = tracemalloc.get_traced_memory()[0]
+        self.profile.enable()
+
+    def end(self) -> None:
+        self._depth -= 1
+        if self._depth:
+            return
+        self.profile.disable()
+        current, peak = tracemalloc.get_traced_memory()
+        self.calls += 1
+        self.allocated += current - self._before
+        self.peak = max(self.peak, peak - self._before)
+
+    def write(self, top: int = 25) -> list:
+        # write <prefix>.prof (pstats, e.g. for snakeviz) and <prefix>.txt
+        # (hot functions plus the largest allocation sites); returns paths
+        paths = [f"{self.prefix}.prof", f"{self.prefix}.txt"]
+        self.profile.dump_stats(paths[0])
+        snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        if self._traced:
+            tracemalloc.stop()
+        with open(paths[1], "w", encoding="utf-8") as f:
+            f.write(f"Operation : {self.operation}\n"
+                    f"Calls     : {self.calls:,}\n"
+                    f"Retained  : {self.allocated / 2 ** 20:,.2f} MiB "
+                    f"(net allocations left by the calls)\n"
+                    f"Peak      : {self.peak / 2 ** 20:,.2f} MiB "
+                    f"(largest in one call)\n\n")
+            if self.calls:
+                stats = pstats.Stats(self.profile, stream=f)
+                stats.sort_stats("cumulative").print_stats(top)
+            if snapshot is not None and self._baseline is not None:
+                f.write("Allocation growth since the first call "
+                        "(whole process):\n")
+                # leave out the profiler's own bookkeeping
+                hidden = [tracemalloc.Filter(False, module.__file__)
+                          for module in (cProfile, pstats, tracemalloc)]
+                for stat in snapshot.filter_traces(hidden).compare_to(
+                        self._baseline.filter_traces(hidden), "lineno")[:top]:
+                    f.write(f"  {stat}\n")
+        return paths
+
+
+def _instrumented(fn, name: str, metrics: OperationMetrics,
+                  profiler: OperationProfiler):
+    # wrap one bound method with timing, error counting and/or profiling
+    clock = _time.perf_counter
+
+    def wrapper(*args, **kwargs):
+        if profiler is not None:
+            profiler.begin()
+        error = None
+        start = clock()
+        try:
+            return fn(*args, **kwargs)
+        except Exception as err:
+            error = err
+            raise
+        finally:
+            elapsed = clock() - start
+            if profiler is not None:
+                profiler.end()
+            if metrics is not None:
+                metrics.observe(name, elapsed, None if error is None
+                                else error_reason(error))
+
+    wrapper.__wrapped__ = fn
+    return wrapper
+
+
+def instrument(hs: HospitalSystem, metrics: OperationMetrics = None,
+               profiler: OperationProfiler = None,
+               metrics_path: str = None) -> HospitalSystem:
+    # record metrics for every METRIC_OPERATIONS call on hs and/or profile
+    # profiler.operation. The wrappers are instance attributes shadowing
+    # the methods, so any backend can be instrumented, and nothing at all
+    # is wrapped (no overhead) when both are None. hs.close() then also
+    # writes metrics_path and the profiler's files
+    if profiler is not None and profiler.operation not in METRIC_OPERATIONS:
+        raise ValueError(f"cannot profile {profiler.operation!r}; choose one "
+                         f"of {', '.join(METRIC_OPERATIONS)}")
+    for name in METRIC_OPERATIONS:
+        profiled = profiler if (profiler is not None
+                                and profiler.operation == name) else None
+        if metrics is not None or profiled is not None:
+            setattr(hs, name, _instrumented(getattr(hs, name), name,
+                                            metrics, profiled))
+    hs.metrics = metrics
+    if metrics_path is not None or profiler is not None:
+        close = hs.close
+
+        def close_and_write() -> None:
+            close()
+            if metrics is not None and metrics_path is not None:
+                metrics.write(metrics_path)
+            if profiler is not None:
+                profiler.write()
+
+        hs.close = close_and_write
+    return hs
+
+
+# -----------------------------------------------------------------------------
+# Utility Validators
+# -----------------------------------------------------------------------------
+
+def get_int(prompt: str) -> int:
+    # repeatedly prompt until user enters a valid integer
+    while True:
+        val = input(prompt).strip()
+        # read input and remove surrounding whitespace
+        if val.isdigit():
+            # if input contains only digits
+            return int(val)
+            # convert to integer and return
+        print("Invalid input; enter a number.")
+        # inform user and repeat on invalid input
+
+
+def get_digits(prompt: str) -> str:
+    # repeatedly prompt until user enters digits only
+    while True:
+        val = input(prompt).strip()
+        # read input and trim whitespace
+        if val.isdigit():
+            # if all characters are digits
+            return val
+        print("Invalid input; only digits allowed.")
+        # reject any non-digit input
+
+
+def get_phone(prompt: str) -> str:
+    # prompt until user enters at least 10 digits for a phone number
+    while True:
+        tel = input(prompt).strip()
+        # read and strip whitespace
+        if is_phone(tel):
+            # ensure numeric and minimum length
+            return tel
+        print("Invalid telephone number; must be at least 10 digits.")
+        # reject input not meeting criteria
+
+
+def get_alpha(prompt: str) -> str:
+    # prompt until user enters letters, spaces, or hyphens only
+    while True:
+        val = input(prompt).strip()
+        # trim whitespace
+        if is_alpha(val):
+            # ensure remaining characters are alphabetic
+            return val
+        print("Invalid input; please enter letters only.")
+        # reject any numeric or symbolic characters
+
+
+def get_dob(prompt: str) -> datetime.date:
+    # prompt until user enters a date in YYYY-MM-DD format
+    while True:
+        val = input(prompt).strip()
+        # trim whitespace
+        try:
+            # parse string into date object
+            return parse_dob(val)
+        except ValueError:
+            # catch parsing errors
+            print("Invalid date format; please use YYYY-MM-DD.")
+            # inform user of correct format
+
+
+def is_phone(tel: str) -> bool:
+    # a telephone number is at least 10 digits
+    return tel.isdigit() and len(tel) >= 10
+
+
+def is_alpha(val: str) -> bool:
+    # letters, spaces and hyphens only (at least one letter)
+    # remove spaces and hyphens for validation
+    return val.replace(" ", "").replace("-", "").isalpha()
+
+
+def parse_dob(val: str) -> datetime.date:
+    # parse a YYYY-MM-DD date of birth (raises ValueError); the length
+    # check keeps fromisoformat (much faster than strptime) to that format
+    if len(val) != 10:
+        raise ValueError(f"Invalid date '{val}'; use YYYY-MM-DD.")
+    return datetime.date.fromisoformat(val)
+
+
+def compute_age(dob: datetime.date, today: datetime.date = None) -> int:
+    # calculate age in full years from date of birth
+    if today is None:
+        # get today's date (bulk callers pass it in once per batch)
+        today = datetime.date.today()
+    years = today.year - dob.year
+    # initial year difference
+    if (today.month, today.day) < (dob.month, dob.day):
+        # subtract one if birthday hasn't occurred yet this year
+        years -= 1
+    return years
+    # return computed age
+
+
+# -----------------------------------------------------------------------------
+# Bulk Import (CSV / JSONL)
+# -----------------------------------------------------------------------------
+# patient columns expected in import files (age may be left blank)
+PATIENT_COLUMNS = PATIENT_FIELDS[:-1]
+# doctor columns; slots and rules (AvailabilityRule text) are ';'-separated
+# in CSV or a list in JSONL
+DOCTOR_COLUMNS = ("first_name", "last_name", "gender", "speciality", "slots",
+                  "rules")
+# patient columns checked with the get_alpha rule
+_ALPHA_COLUMNS = ("first_name", "middle_name", "last_name",
+                  "father_fn", "father_ln", "mother_fn", "mother_ln",
+                  "nok_fn", "nok_ln")
+# patient columns checked with the get_phone rule
+_PHONE_COLUMNS = ("telephone", "nok_phone")
+
+
+def _text(row: dict, column: str) -> str:
+    # fetch a column as stripped text ('' when missing)
+    val = row.get(column)
+    return "" if val is None else str(val).strip()
+
+
+def validate_patient_row(row: dict, today: datetime.date) -> list:
+    # apply the interactive validation rules to one import row;
+    # returns register_patient() arguments or raises ValueError
+    # stripped text for every column ('' when missing; a blank age is
+    # computed from the DOB)
+    fields = [str(row.get(column) or "").strip() for column in PATIENT_COLUMNS]
+    clean = dict(zip(PATIENT_COLUMNS, fields))
+    for column in _ALPHA_COLUMNS:
+        if not is_alpha(clean[column]):
+            raise ValueError(f"{column}: letters only")
+    for column in _PHONE_COLUMNS:
+        if not is_phone(clean[column]):
+            raise ValueError(f"{column}: must be at least 10 digits")
+    try:
+        dob = parse_dob(clean["dob"])
+    except ValueError:
+        raise ValueError("dob: use YYYY-MM-DD") from None
+    age = compute_age(dob, today)
+    given = clean["age"]
+    if given and (not given.isdigit() or int(given) != age):
+        raise ValueError(f"age: calculated age is {age} based on DOB")
+    fields[4] = age
+    return fields
+
+
+def validate_doctor_row(row: dict, today: datetime.date = None) -> list:
+    # check one doctor import row; returns register_doctor() arguments
+    for column in ("first_name", "last_name", "speciality"):
+        if not _text(row, column):
+            raise ValueError(f"{column}: required")
+    slots = row.get("slots") or []
+    if isinstance(slots, str):
+        slots = [slot for slot in slots.split(";") if slot.strip()]
+    schedule = []
+    for slot in slots:
+        try:
+            date, time = slot.split() if isinstance(slot, str) else slot
+            parse_slot(date, time)
+        except (TypeError, ValueError):
+            raise ValueError(f"slots: bad slot {slot!r}; use "
+                             f"'YYYY-MM-DD HH:MM'") from None
+        schedule.append((date, time))
+    rules = row.get("rules") or []
+    if isinstance(rules, str):
+        rules = rules.split(";")
+    try:
+        # canonical text, so a journal replay expands the same slots
+        rules = [AvailabilityRule.parse(rule, today).text()
+                 for rule in rules if rule.strip()]
+    except (AttributeError, ValueError) as err:
+        raise ValueError(f"rules: {err}") from None
+    if rules:
+        schedule = {"rules": rules, "slots": schedule}
+    return [_text(row, "first_name"), _text(row, "last_name"),
+            _text(row, "gender"), _text(row, "speciality"), schedule]
+
+
+def _read_rows(path: str, fmt: str):
+    # stream (line number, row dict or parse error) from a CSV/JSONL file
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as err:
+                    row = err
+                if not isinstance(row, (dict, ValueError)):
+                    row = ValueError("expected a JSON object")
+                yield number, row
+
+
+class ImportReport:
+    # outcome of one bulk import
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.accepted = 0
+        self.rejected = 0
+        self.seconds = 0.0
+
+    def summary(self) -> str:
+        # one-line summary with throughput
+        total = self.accepted + self.rejected
+        rate = total / self.seconds if self.seconds else 0.0
+        return (f"Imported {self.accepted:,} {self.kind} "
+                f"({self.rejected:,} rejected) in {self.seconds:.2f} s "
+                f"- {rate:,.0f} rows/sec")
+
+
+def bulk_import(hs: HospitalSystem, kind: str, path: str, fmt: str = None,
+                errors_path: str = None, batch_size: int = 1000) -> ImportReport:
+    # stream patients or doctors from a CSV/JSONL file into hs. Rows are
+    # validated and registered a batch at a time, so memory stays constant;
+    # rejected rows are written to errors_path (JSONL, with the reason)
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    if kind == "patients":
+        validate = validate_patient_row
+    else:
+        def validate(row: dict, today: datetime.date) -> list:
+            # rows the backend cannot store (rules on SQLite) are rejected
+            # here, not when their batch is registered
+            fields = validate_doctor_row(row, today)
+            try:
+                hs.check_schedule(fields[4])
+            except ValueError as err:
+                raise ValueError(f"rules: {err}") from None
+            return fields
+    register = hs.register_patient if kind == "patients" else hs.register_doctor
+    report = ImportReport(kind)
+    errors = open(errors_path, "w", encoding="utf-8") if errors_path else None
+    start = _time.perf_counter()
+
+    def flush(batch):
+        # register a validated batch in one storage transaction
+        with hs.bulk():
+            for fields in batch:
+                register(*fields)
+        report.accepted += len(batch)
+        batch.clear()
+
+    try:
+        with _gc_paused():
+            batch = []
+            today = datetime.date.today()
+            for number, row in _read_rows(path, fmt):
+                try:
+                    if isinstance(row, ValueError):
+                        raise ValueError(f"unreadable row: {row}")
+                    batch.append(validate(row, today))
+                except ValueError as err:
+                    report.rejected += 1
+                    if errors is not None:
+                        errors.write(json.dumps(
+                            {"line": number, "error": str(err),
+                             "row": row if isinstance(row, dict) else None})
+                            + "\n")
+                    continue
+                if len(batch) >= batch_size:
+                    flush(batch)
+            if batch:
+                flush(batch)
+    finally:
+        if errors is not None:
+            errors.close()
+    report.seconds = _time.perf_counter() - start
+    return report
+
+
+def read_booking_rows(path: str, fmt: str = None):
+    # stream (patient_id, doctor_id, date, time[, duration]) tuples from
+    # CSV/JSONL (duration is an optional column, in minutes); unreadable
+    # rows become () so book_batch reports them
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    for _, row in _read_rows(path, fmt):
+        if isinstance(row, dict):
+            values = tuple(str(row.get(column) or "").strip() for column in
+                           ("patient_id", "doctor_id", "date", "time"))
+            duration = str(row.get("duration") or "").strip()
+            if duration:
+                # non-numbers are passed on for book_batch to reject
+                values += (int(duration) if duration.isdigit() else duration,)
+            yield values
+        else:
+            yield ()
+
+
+# -----------------------------------------------------------------------------
+# Export (CSV / JSONL / columnar)
+# -----------------------------------------------------------------------------
+# columns of each kind of export; booked is 'YYYY-MM-DD HH:MM' ('' when
+# not recorded) and an invoice's items a JSON list of [service, fee]
+EXPORT_COLUMNS = {
+    "appointments": ("appointment_id", "patient_id", "doctor_id", "date",
+                     "time", "duration", "status", "booked"),
+    "patients": ("patient_id",) + PATIENT_COLUMNS,
+    "invoices": ("invoice_id", "appointment_id", "doctor_id", "date",
+                 "issued", "total", "items"),
+}
+# integer columns (stored as int64 in the columnar format)
+_EXPORT_INTS = {"duration", "age", "total"}
+# filters each kind accepts (HospitalSystem.query_appointments names)
+EXPORT_FILTERS = {
+    "appointments": ("date_from", "date_to", "status", "doctor_id",
+                     "patient_id"),
+    "patients": (),
+    "invoices": ("date_from", "date_to", "doctor_id"),
+}
+EXPORT_FORMATS = ("csv", "jsonl", "columnar")
+# format guessed from the output file's extension
+_EXPORT_EXTENSIONS = {".csv": "csv", ".jsonl": "jsonl", ".hcol": "columnar"}
+# rows per columnar block: bounds the writer's (and reader's) memory
+COLUMNAR_BLOCK = 16_384
+COLUMNAR_MAGIC = b"HMSCOL1\n"
+# the columnar format is little-endian; arrays are native
+_BIG_ENDIAN = sys.byteorder == "big"
+
+
+# 'HH:MM' for every minute of the day
+_EXPORT_TIMES = tuple(f"{minute // 60:02}:{minute % 60:02}"
+                      for minute in range(1440))
+
+
+@functools.lru_cache(maxsize=1 << 14)
+def _export_day(day: int) -> str:
+    # day ordinal as 'YYYY-MM-DD'; exports repeat the same few dates, so
+    # they are formatted once (Appointment.date would redo it per row)
+    return datetime.date.fromordinal(day).isoformat()
+
+
+def _export_stamp(minutes: int) -> str:
+    # Appointment.booked as 'YYYY-MM-DD HH:MM' ('' = not recorded)
+    if not minutes:
+        return ""
+    return f"{_export_day(minutes // 1440)} {_EXPORT_TIMES[minutes % 1440]}"
+
+
+def _export_appointment(appt: Appointment) -> tuple:
+    day, minute = divmod(appt.at, 1440)
+    return (appt.appointment_id, appt.patient.patient_id,
+            appt.doctor.doctor_id, _export_day(day), _EXPORT_TIMES[minute],
+            appt.duration, appt._status, _export_stamp(appt.booked))
+
+
+@functools.lru_cache(maxsize=1024)
+def _export_items(items: tuple) -> str:
+    # an invoice's ((service, fee), ...) as compact JSON; most invoices
+    # share a few item lists, so each is encoded once
+    return json.dumps([list(item) for item in items], separators=(",", ":"))
+
+
+def _export_invoice(invoice_id: str, appointment_id: str, doctor_id: str,
+                    date: str, issued: str, total: int, items) -> tuple:
+    return (invoice_id, appointment_id, doctor_id, date, issued, total,
+            _export_items(tuple(map(tuple, items))))
+
+
+def _write_csv(path: str, columns: tuple, rows) -> None:
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(rows)
+
+
+def _write_jsonl(path: str, columns: tuple, rows) -> None:
+    # one object per line, as bulk_import reads them
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(encode(dict(zip(columns, row))) + "\n" for row in rows)
+
+
+def _write_columnar(path: str, columns: tuple, rows) -> None:
+    # COLUMNAR_MAGIC, a JSON header line ({"columns", "ints"}), then
+    # blocks of up to COLUMNAR_BLOCK rows: '<II' (rows, payload bytes) and
+    # a zlib payload holding each column in turn, length-prefixed ('<I').
+    # Integer columns are int64 arrays; text columns are dictionary
+    # encoded (a '<I'-prefixed JSON list of the block's distinct values,
+    # then one uint32 code per row), which suits IDs, dates, times and
+    # statuses that repeat. A (0, 0) block ends the file
+    ints = [column in _EXPORT_INTS for column in columns]
+    rows = iter(rows)
+    with open(path, "wb") as f:
+        f.write(COLUMNAR_MAGIC)
+        f.write(json.dumps({"columns": list(columns),
+                            "ints": [c for c in columns if c in _EXPORT_INTS]})
+                .encode() + b"\n")
+        while True:
+            block = list(itertools.islice(rows, COLUMNAR_BLOCK))
+            if not block:
+                break
+            chunks = []
+            for values, is_int in zip(zip(*block), ints):
+                if is_int:
+                    data = array.array("q", values)
+                    dictionary = b""
+                else:
+                    codes = {}
+                    # codes in first-seen order
+                    data = array.array("I", [codes.setdefault(v, len(codes))
+                                             for v in values])
+                    dictionary = json.dumps(list(codes)).encode()
+                    dictionary = struct.pack("<I", len(dictionary)) + dictionary
+                if _BIG_ENDIAN:
+                    data.byteswap()
+                chunk = dictionary + data.tobytes()
+                chunks.append(struct.pack("<I", len(chunk)))
+                chunks.append(chunk)
+            # level 1: the codes are already compact, speed matters more
+            payload = zlib.compress(b"".join(chunks), 1)
+            f.write(struct.pack("<II", len(block), len(payload)))
+            f.write(payload)
+        f.write(struct.pack("<II", 0, 0))
+
+
+def read_columnar(path: str):
+    # yield the column names, then every row as a tuple (like csv.reader),
+    # one block in memory at a time
+    with open(path, "rb") as f:
+        if f.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+            raise ValueError(f"{path}: not a columnar export")
+        header = json.loads(f.readline())
+        columns, ints = header["columns"], set(header["ints"])
+        yield tuple(columns)
+        while True:
+            head = f.read(8)
+            if len(head) < 8:
+                raise ValueError(f"{path}: truncated columnar export")
+            count, size = struct.unpack("<II", head)
+            if not count:
+                return
+            payload = zlib.decompress(f.read(size))
+            values, offset = [], 0
+            for column in columns:
+                (length,) = struct.unpack_from("<I", payload, offset)
+                chunk = payload[offset + 4:offset + 4 + length]
+                offset += 4 + length
+                if column in ints:
+                    data = array.array("q")
+                    dictionary = None
+                else:
+                    (n,) = struct.unpack_from("<I", chunk)
+                    dictionary = json.loads(chunk[4:4 + n])
+                    chunk = chunk[4 + n:]
+                    data = array.array("I")
+                data.frombytes(chunk)
+                if _BIG_ENDIAN:
+                    data.byteswap()
+                values.append(data if dictionary is None else
+                              [dictionary[code] for code in data])
+            yield from zip(*values)
+
+
+_EXPORT_WRITERS = {"csv": _write_csv, "jsonl": _write_jsonl,
+                   "columnar": _write_columnar}
+
+
+class ExportState:
+    # what an incremental export ('changed since the last one') has
+    # already written, kept in a small JSON file:
+    #   last     : highest record number exported (IDs are never reused)
+    #   canceled : bitmap, by appointment number, of the appointments
+    #              exported with status Canceled
+    # Patients and invoices never change once created, so only new ones
+    # are exported again. An appointment's one change is being
+    # cancelled: it is exported again once, with that status. The kind
+    # and filters are part of the state, since rows they left out were
+    # never exported
+    def __init__(self, kind: str, filters: dict):
+        self.kind = kind
+        self.filters = filters
+        self.last = 0
+        self.canceled = bytearray()
+
+    @classmethod
+    def load(cls, path: str, kind: str, filters: dict) -> "ExportState":
+        # the saved state, or a fresh one (export everything) if none
+        state = cls(kind, filters)
+        if not os.path.exists(path):
+            return state
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data["kind"] != kind or data["filters"] != filters:
+            raise ValueError(f"{path} tracks a different export "
+                             f"({data['kind']} {data['filters']})")
+        state.last = data["last"]
+        state.canceled = bytearray(zlib.decompress(
+            base64.b64decode(data["canceled"])))
+        return state
+
+    def select(self, rows):
+        # pass on the rows that are new or newly cancelled, and note them
+        last, top, bits = self.last, self.last, self.canceled
+        canceled = self.kind == "appointments"
+        for row in rows:
+            number = int(row[0][1:])
+            if number > top:
+                top = number
+            if canceled and row[6] == "Canceled":
+                byte, bit = divmod(number, 8)
+                if byte >= len(bits):
+                    bits.extend(bytes(byte + 1 - len(bits)))
+                if bits[byte] >> bit & 1:
+                    continue
+                bits[byte] |= 1 << bit
+            elif number <= last:
+                continue
+            yield row
+        self.last = top
+
+    def save(self, path: str) -> None:
+        # replace the file atomically
+        data = {"kind": self.kind, "filters": self.filters, "last": self.last,
+                "canceled": base64.b64encode(
+                    zlib.compress(bytes(self.canceled))).decode("ascii")}
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(path + ".tmp", path)
+
+
+class ExportReport:
+    # outcome of one export
+    def __init__(self, kind: str, path: str, fmt: str):
+        self.kind, self.path, self.fmt = kind, path, fmt
+        self.rows = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def summary(self) -> str:
+        # one-line summary with throughput
+        rate = self.rows / self.seconds if self.seconds else 0.0
+        return (f"Exported {self.rows:,} {self.kind} to {self.path} "
+                f"({self.fmt}, {self.bytes:,} bytes) in {self.seconds:.2f} s "
+                f"- {rate:,.0f} rows/sec")
+
+
+def export_records(hs: HospitalSystem, kind: str, path: str, fmt: str = None,
+                   since: str = None, **filters) -> ExportReport:
+    # stream appointments, patients or invoices matching the filters
+    # (EXPORT_FILTERS) to path as CSV, JSONL or the columnar format,
+    # holding at most one columnar block of rows. With since (a state
+    # file) only what changed since the last export with that file is
+    # written. The file appears complete or not at all, and the state is
+    # saved only once it has: a crash in between exports those rows again
+    if kind not in EXPORT_COLUMNS:
+        raise ValueError(f"Unknown export {kind!r}; use "
+                         f"{', '.join(EXPORT_COLUMNS)}.")
+    filters = {name: value for name, value in filters.items() if value}
+    for name in filters:
+        if name not in EXPORT_FILTERS[kind]:
+            raise ValueError(f"{kind} cannot be filtered by {name}.")
+    fmt = fmt or _EXPORT_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if fmt not in _EXPORT_WRITERS:
+        raise ValueError(f"Unknown export format for {path}; use one of "
+                         f"{', '.join(EXPORT_FORMATS)}.")
+    report = ExportReport(kind, path, fmt)
+    state = ExportState.load(since, kind, filters) if since else None
+    start = _time.perf_counter()
+
+    def counted(rows):
+        for row in rows:
+            report.rows += 1
+            yield row
+
+    rows = hs.export_rows(kind, **filters)
+    if state is not None:
+        rows = state.select(rows)
+    try:
+        _EXPORT_WRITERS[fmt](path + ".tmp", EXPORT_COLUMNS[kind],
+                             counted(rows))
+        os.replace(path + ".tmp", path)
+    finally:
+        rows.close()
+        if os.path.exists(path + ".tmp"):
+            os.remove(path + ".tmp")
+    if state is not None:
+        state.save(since)
+    report.bytes = os.path.getsize(path)
+    report.seconds = _time.perf_counter() - start
+    return report
+
+
+# -----------------------------------------------------------------------------
+# Waiting List Optimiser
+# -----------------------------------------------------------------------------
+# referral columns; doctors (preferred, optional) are ';'-separated in CSV or
+# a list in JSONL; earliest/latest are inclusive dates (blank = no bound)
+REFERRAL_COLUMNS = ("patient_id", "speciality", "doctors", "earliest", "latest")
+# open-ended (rule-based) schedules are expanded this many days past their
+# first free slot when some referral has no latest date
+WAITLIST_HORIZON_DAYS = 90
+
+
+def validate_referral_row(row: dict) -> tuple:
+    # check one referral row; returns (patient_id, speciality, doctors,
+    # earliest, latest) or raises ValueError
+    for column in ("patient_id", "speciality"):
+        if not _text(row, column):
+            raise ValueError(f"{column}: required")
+    doctors = row.get("doctors") or []
+    if isinstance(doctors, str):
+        doctors = doctors.split(";")
+    doctors = tuple(str(d).strip() for d in doctors if str(d).strip())
+    bounds = []
+    for column in ("earliest", "latest"):
+        value = _text(row, column)
+        if value:
+            try:
+                if len(value) != 10:
+                    raise ValueError
+                datetime.date.fromisoformat(value)
+            except ValueError:
+                raise ValueError(f"{column}: use YYYY-MM-DD") from None
+        bounds.append(value)
+    if bounds[0] and bounds[1] and bounds[0] > bounds[1]:
+        raise ValueError("earliest: after latest")
+    return (_text(row, "patient_id"), _text(row, "speciality"), doctors,
+            *bounds)
+
+
+def read_referrals(path: str, fmt: str = None):
+    # stream (line number, referral tuple or ValueError) from CSV/JSONL
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    for number, row in _read_rows(path, fmt):
+        if isinstance(row, dict):
+            try:
+                row = validate_referral_row(row)
+            except ValueError as err:
+                row = err
+        yield number, row
+
+
+def _solve_partition(job: tuple, augment: bool = True) -> list:
+    # maximum assignment of one speciality's referrals to doctor-days.
+    # job = (referrals, days): referrals are (preferred doctor IDs,
+    # earliest, latest) and days maps doctor_id -> [(date, free slots)]
+    # sorted by date. Returns (doctor_id, date) or None per referral.
+    #
+    # every free slot of a doctor on one day is interchangeable for a
+    # referral (windows are whole dates), so each doctor-day is a single
+    # node with a capacity; this keeps the graph small enough to solve
+    # exactly with Hopcroft-Karp (capacitated):
+    #   1. greedy pass in list order: preferred doctors first, then the
+    #      earliest day with room
+    #   2. augmenting-path phases until no more referrals can be placed;
+    #      an augmenting path only moves placed referrals to other days,
+    #      never unplaces them, so earlier referrals keep their places
+    # augment=False stops after the greedy pass (one-by-one booking)
+    referrals, days = job
+    nodes, capacity = [], []        # node -> (doctor_id, date), free slots
+    dates = {}                      # doctor_id -> sorted dates
+    first_node = {}                 # doctor_id -> node of its first date
+    for did, entries in days.items():
+        first_node[did] = len(nodes)
+        dates[did] = [date for date, _ in entries]
+        for date, free in entries:
+            nodes.append((did, date))
+            capacity.append(free)
+    adj = []
+    for preferred, earliest, latest in referrals:
+        edges = []
+        preferred = [did for did in dict.fromkeys(preferred) if did in days]
+        others = [did for did in days if did not in preferred]
+        for group in (preferred, others):
+            found = []
+            for did in group:
+                lo = bisect.bisect_left(dates[did], earliest) if earliest else 0
+                hi = (bisect.bisect_right(dates[did], latest) if latest
+                      else len(dates[did]))
+                found.extend((dates[did][k], first_node[did] + k)
+                             for k in range(lo, hi))
+            found.sort()
+            edges.extend(node for _, node in found)
+        adj.append(edges)
+
+    n = len(referrals)
+    assign = [-1] * n
+    holders = [[] for _ in nodes]
+    for u in range(n):
+        for v in adj[u]:
+            if len(holders[v]) < capacity[v]:
+                assign[u] = v
+                holders[v].append(u)
+                break
+
+    unreached = n + 1
+    while augment:
+        # BFS: layer referrals by alternating paths from the unplaced ones
+        dist = [unreached] * n
+        queue = [u for u in range(n) if assign[u] == -1 and adj[u]]
+        for u in queue:
+            dist[u] = 0
+        found = False
+        for u in queue:
+            for v in adj[u]:
+                if len(holders[v]) < capacity[v]:
+                    found = True
+                    continue
+                for w in holders[v]:
+                    if dist[w] == unreached:
+                        dist[w] = dist[u] + 1
+                        queue.append(w)
+        if not found:
+            break
+        # DFS (iterative) from each unplaced referral along the layers
+        cursor = [0] * n
+        augmented = False
+        for start in range(n):
+            if assign[start] != -1 or dist[start] != 0:
+                continue
+            path_u, path_v = [start], []
+            while path_u:
+                u = path_u[-1]
+                edges = adj[u]
+                step = None
+                while cursor[u] < len(edges):
+                    v = edges[cursor[u]]
+                    if len(holders[v]) < capacity[v]:
+                        step = (v, None)
+                        break
+                    nxt = next((w for w in holders[v]
+                                if dist[w] == dist[u] + 1), None)
+                    if nxt is not None:
+                        step = (v, nxt)
+                        break
+                    cursor[u] += 1
+                if step is None:
+                    # dead end: never revisit u in this phase
+                    dist[u] = unreached
+                    path_u.pop()
+                    if path_v:
+                        path_v.pop()
+                    continue
+                path_v.append(step[0])
+                if step[1] is not None:
+                    path_u.append(step[1])
+                    continue
+                # free capacity reached: shift every referral on the path
+                # one node along, last first
+                for u, v in zip(reversed(path_u), reversed(path_v)):
+                    if assign[u] != -1:
+                        holders[assign[u]].remove(u)
+                    holders[v].append(u)
+                    assign[u] = v
+                augmented = True
+                break
+        if not augmented:
+            break
+    return [nodes[v] if v != -1 else None for v in assign]
+
+
+class WaitlistPlan:
+    # result of plan_waitlist: one slot or one reason per referral
+    def __init__(self, total: int):
+        self.total = total
+        # referral number -> (patient_id, doctor_id, date, time)
+        self.assignments = {}
+        # referral number -> reason it could not be placed
+        self.unplaced = {}
+
+    def rows(self) -> list:
+        # book_batch rows, in referral order
+        return [self.assignments[n] for n in sorted(self.assignments)]
+
+    def outcomes(self):
+        # yield one dict per referral
+        for number in range(1, self.total + 1):
+            if number in self.assignments:
+                pid, did, date, time = self.assignments[number]
+                yield {"referral": number, "status": "placed",
+                       "patient_id": pid, "doctor_id": did,
+                       "date": date, "time": time}
+            else:
+                yield {"referral": number, "status": "unplaced",
+                       "error": self.unplaced.get(number, "not read")}
+
+    def summary(self) -> str:
+        return (f"Placed {len(self.assignments):,} of {self.total:,} "
+                f"referrals ({len(self.unplaced):,} unplaced).")
+
+
+def plan_waitlist(hs: HospitalSystem, referrals, workers: int = 1,
+                  greedy: bool = False) -> WaitlistPlan:
+    # assign referrals (patient_id, speciality, preferred doctors, earliest,
+    # latest), in waiting-list order, to the doctors' free slots. Each
+    # speciality is solved independently (see _solve_partition); with
+    # workers > 1 the specialities are solved in a process pool.
+    # greedy=True places referrals one by one instead (for comparison)
+    referrals = list(referrals)
+    plan = WaitlistPlan(len(referrals))
+    # the dates any referral accepts, to bound rule-based schedules
+    valid = [r for r in referrals if not isinstance(r, Exception)]
+    lo = hi = None
+    if valid and all(r[3] for r in valid):
+        lo = datetime.datetime.fromisoformat(min(r[3] for r in valid))
+    if valid and all(r[4] for r in valid):
+        hi = (datetime.datetime.fromisoformat(max(r[4] for r in valid))
+              + datetime.timedelta(days=1))
+    # free slots per speciality -> doctor_id -> date -> [times]
+    free = {}
+    for did, doctor in hs.doctors.items():
+        slots = doctor.schedule
+        if not slots.bounded:
+            first = slots.first_after(lo)
+            end = hi or (first and first + datetime.timedelta(
+                days=WAITLIST_HORIZON_DAYS))
+            slots = ([] if first is None else
+                     [slots.label(dt) for dt in slots.between(first, end)])
+        by_date = {}
+        for date, time in slots:
+            by_date.setdefault(date, []).append(time)
+        free.setdefault(SpecialityIndex.normalise(doctor.speciality),
+                        {})[did] = by_date
+    # partition the referrals by speciality
+    partitions = {}
+    for number, referral in enumerate(referrals, 1):
+        if isinstance(referral, Exception):
+            plan.unplaced[number] = str(referral)
+            continue
+        pid, speciality, preferred, earliest, latest = referral
+        key = SpecialityIndex.normalise(speciality)
+        if pid not in hs.patients:
+            plan.unplaced[number] = "Patient ID not found."
+        elif key not in free:
+            plan.unplaced[number] = f"No doctors for speciality '{speciality}'."
+        else:
+            partitions.setdefault(key, []).append(
+                (number, pid, (preferred, earliest, latest)))
+    keys = list(partitions)
+    jobs = [([r for _, _, r in partitions[key]],
+             {did: [(date, len(times)) for date, times in by_date.items()]
+              for did, by_date in free[key].items()})
+            for key in keys]
+    solve = functools.partial(_solve_partition, augment=not greedy)
+    if workers > 1 and len(jobs) > 1:
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(solve, jobs))
+    else:
+        results = [solve(job) for job in jobs]
+    for key, result in zip(keys, results):
+        # hand out each doctor-day's times in referral order
+        taken = {}
+        for (number, pid, _), node in zip(partitions[key], result):
+            if node is None:
+                plan.unplaced[number] = "No free slot within the window."
+                continue
+            did, date = node
+            k = taken.get(node, 0)
+            taken[node] = k + 1
+            plan.assignments[number] = (pid, did, date, free[key][did][date][k])
+    return plan
+
+
+# -----------------------------------------------------------------------------
+# Command Protocol (non-interactive / scripted mode)
+# -----------------------------------------------------------------------------
+class CommandProcessor:
+    # executes JSON commands {"op": ..., ...} against a HospitalSystem and
+    # returns JSON-ready replies {"ok": true, ...} / {"ok": false, "error"};
+    # an optional "ref" in a command is echoed back for correlation.
+    # Handlers return only what a success adds and raise on failure
+    # fields that must be text when given (null = not given)
+    TEXT_FIELDS = frozenset((
+        "patient_id", "doctor_id", "appointment_id", "entry_id", "date",
+        "time", "from", "to", "before", "after", "earliest", "latest",
+        "status", "query", "speciality", "service", "by"))
+    # numeric fields; integers must fit the storage's 64 bits
+    NUMBER_FIELDS = frozenset(("duration", "count", "limit", "offset",
+                               "urgency", "fee"))
+
+    def __init__(self, hs: HospitalSystem):
+        self.hs = hs
+        # op name -> handler(command dict) -> result dict
+        self.handlers = {
+            "register_patient": self._register_patient,
+            "register_doctor": self._register_doctor,
+            "book": self._book,
+            "book_batch": self._book_batch,
+            "cancel": self._cancel,
+            "appointments": self._appointments,
+            "patient": self._patient,
+            "doctor": self._doctor,
+            "next_available": self._next_available,
+            "search_patients": self._search_patients,
+            "bill": self._bill,
+            "invoice_range": self._invoice_range,
+            "set_fee": self._set_fee,
+            "fees": self._fees,
+            "revenue": self._revenue,
+            "metrics": self._metrics,
+            "waitlist_join": self._waitlist_join,
+            "waitlist_leave": self._waitlist_leave,
+            "waitlist": self._waitlist,
+            "overlapping": self._overlapping,
+            "archive": self._archive,
+        }
+        # date used for age checks (refreshed per run)
+        self._today = datetime.date.today()
+
+    def execute(self, cmd) -> dict:
+        # run one command; every failure becomes an error reply
+        if not isinstance(cmd, dict):
+            return {"ok": False, "error": "command must be a JSON object"}
+        # protocol-level latency ("cmd:<op>") when the system is instrumented
+        metrics = self.hs.metrics
+        if metrics is not None:
+            start = _time.perf_counter()
+        handler = error = None
+        try:
+            op = cmd.get("op")
+            handler = (self.handlers.get(op)
+                       if isinstance(op, str) else None)
+            if handler is None:
+                raise ValueError(f"unknown op {op!r}")
+            self._check_fields(cmd)
+            reply = {"ok": True, **handler(cmd)}
+        except KeyError as err:
+            error = err
+            reply = {"ok": False, "error": f"missing field {err}"}
+        except (ValueError, TypeError, AttributeError) as err:
+            # BookingError is a ValueError; AttributeError is a field of
+            # an unexpected type that slipped past _check_fields
+            error = err
+            reply = {"ok": False, "error": str(err)}
+            if isinstance(err, BatchRejected):
+                reply["rejections"] = [{"row": n, "error": e}
+                                       for n, e in err.report.errors()]
+        if metrics is not None and handler is not None:
+            metrics.observe(f"cmd:{cmd['op']}", _time.perf_counter() - start,
+                            None if error is None else error_reason(error))
+        if "ref" in cmd:
+            reply["ref"] = cmd["ref"]
+        return reply
+
+    @classmethod
+    def _check_fields(cls, cmd: dict) -> None:
+        # reject wrong-typed fields before they reach the system (where
+        # e.g. a list would fail inside the SQLite driver)
+        for name, value in cmd.items():
+            if value is None:
+                continue
+            if name in cls.TEXT_FIELDS and not isinstance(value, str):
+                raise ValueError(f"{name} must be a string")
+            if (name in cls.NUMBER_FIELDS and isinstance(value, int)
+                    and not -2 ** 63 <= value < 2 ** 63):
+                raise ValueError(f"{name} is out of range")
+
+    @staticmethod
+    def _slot(cmd: dict, name: str) -> tuple:
+        # a 'YYYY-MM-DD HH:MM' field as a checked (date, time) pair
+        try:
+            return format_slot(parse_slot(*cmd[name].split(" ")))
+        except (TypeError, ValueError):
+            raise ValueError(f"{name}: use 'YYYY-MM-DD HH:MM'") from None
+
+    @staticmethod
+    def _fields(cmd: dict) -> dict:
+        # the "fields" object of a register command
+        fields = cmd["fields"]
+        if not isinstance(fields, dict):
+            raise ValueError("fields must be an object")
+        return fields
+
+    # -- handlers -------------------------------------------------------------
+    def _register_patient(self, cmd: dict) -> dict:
+        fields = validate_patient_row(self._fields(cmd), self._today)
+        return {"patient_id": self.hs.register_patient(*fields)}
+
+    def _register_doctor(self, cmd: dict) -> dict:
+        fields = validate_doctor_row(self._fields(cmd))
+        return {"doctor_id": self.hs.register_doctor(*fields)}
+
+    def _book(self, cmd: dict) -> dict:
+        appt = self.hs.make_booking(cmd["patient_id"], cmd["doctor_id"],
+                                    cmd["date"], cmd["time"],
+                                    cmd.get("duration", SLOT_MINUTES))
+        return {"appointment_id": appt.appointment_id}
+
+    def _book_batch(self, cmd: dict) -> dict:
+        if not isinstance(cmd["rows"], list):
+            raise ValueError("rows must be a list")
+        for number, row in enumerate(cmd["rows"], 1):
+            if isinstance(row, dict):
+                self._check_fields(row)
+            elif not (isinstance(row, list)
+                      and all(isinstance(value, str) for value in row[:4])):
+                raise ValueError(f"row {number}: use an object or a list of "
+                                 f"patient_id, doctor_id, date, time")
+        report = self.hs.book_batch(
+            (row["patient_id"], row["doctor_id"], row["date"], row["time"],
+             *([row["duration"]] if "duration" in row else []))
+            if isinstance(row, dict) else row for row in cmd["rows"])
+        if not report.applied:
+            raise BatchRejected(report)
+        return {"appointment_ids": report.appointment_ids}
+
+    def _cancel(self, cmd: dict) -> dict:
+        appt = self.hs.cancel_booking(cmd["appointment_id"])
+        reply = {"appointment_id": appt.appointment_id, "status": appt.status}
+        refill = self.hs.refill_of(appt.appointment_id)
+        if refill is not None:
+            # the slot went straight to a patient on the waiting list
+            reply["refilled"] = {"appointment_id": refill.appointment_id,
+                                 "patient_id": refill.patient.patient_id}
+        return reply
+
+    def _waitlist_join(self, cmd: dict) -> dict:
+        urgency = cmd.get("urgency", 1)
+        if not isinstance(urgency, int):
+            raise ValueError("urgency must be an integer")
+        return {"entry_id": self.hs.join_waitlist(
+            cmd["patient_id"], cmd.get("doctor_id"), cmd.get("speciality"),
+            urgency, cmd.get("earliest"), cmd.get("latest"))}
+
+    def _waitlist_leave(self, cmd: dict) -> dict:
+        self.hs.leave_waitlist(cmd["entry_id"])
+        return {"entry_id": cmd["entry_id"]}
+
+    def _waitlist(self, cmd: dict) -> dict:
+        # waiting entries for a doctor or speciality, best first
+        entries = self.hs.waitlist_queue(cmd.get("doctor_id"),
+                                         cmd.get("speciality") or "")
+        return {"entries": [dict(zip(("entry_id", "patient_id", "urgency",
+                                      "earliest", "latest"),
+                                     (e.entry_id, e.patient_id, e.urgency,
+                                      e.earliest, e.latest)))
+                            for e in entries]}
+
+    def _overlapping(self, cmd: dict) -> dict:
+        # confirmed appointments of a doctor or a patient overlapping the
+        # window "from" - "to" ('YYYY-MM-DD HH:MM')
+        appts = self.hs.appointments_between(
+            *self._slot(cmd, "from"), *self._slot(cmd, "to"),
+            doctor_id=cmd.get("doctor_id"), patient_id=cmd.get("patient_id"))
+        return {"appointments": [
+            {"appointment_id": a.appointment_id,
+             "patient_id": a.patient.patient_id,
+             "doctor_id": a.doctor.doctor_id, "date": a.date,
+             "time": a.time, "duration": a.duration} for a in appts]}
+
+    def _archive(self, cmd: dict) -> dict:
+        # move appointments dated before "before" to the archive
+        return {"archived": self.hs.archive_appointments(cmd["before"])}
+
+    def _appointments(self, cmd: dict) -> dict:
+        # optional filters plus offset/limit paging
+        limit = cmd.get("limit")
+        offset = int(cmd.get("offset", 0))
+        rows = []
+        matches = self.hs.appointment_rows(
+            date_from=cmd.get("from"), date_to=cmd.get("to"),
+            status=cmd.get("status"), doctor_id=cmd.get("doctor_id"),
+            patient_id=cmd.get("patient_id"))
+        for row in itertools.islice(matches, offset, None):
+            if limit is not None and len(rows) >= limit:
+                break
+            aid, p_first, p_last, d_first, d_last, date, time, status = row
+            rows.append({"appointment_id": aid,
+                         "patient": f"{p_first} {p_last}",
+                         "doctor": f"{d_first} {d_last}",
+                         "date": date, "time": time, "status": status})
+        return {"appointments": rows}
+
+    def _patient(self, cmd: dict) -> dict:
+        pid = cmd["patient_id"]
+        if pid not in self.hs.patients:
+            raise BookingError("Patient ID not found.")
+        patient = self.hs.patients[pid]
+        profile = dict(zip(PATIENT_FIELDS, patient.record()))
+        profile["appointments"] = [
+            {"appointment_id": a.appointment_id,
+             "doctor_id": a.doctor.doctor_id,
+             "date": a.date, "time": a.time, "duration": a.duration,
+             "status": a.status}
+            for a in self.hs.patient_history(pid)]
+        return {"patient": profile}
+
+    def _doctor(self, cmd: dict) -> dict:
+        did = cmd["doctor_id"]
+        if did not in self.hs.doctors:
+            raise BookingError("Doctor ID not found.")
+        doc = self.hs.doctors[did]
+        # open-ended schedules list RULE_HORIZON_DAYS unless limited
+        limit = cmd.get("limit")
+        days = (None if limit is not None or doc.schedule.bounded
+                else RULE_HORIZON_DAYS)
+        slots = [f"{date} {time}" for date, time in
+                 itertools.islice(doc.upcoming(days), limit)]
+        profile = {"doctor_id": did, "first_name": doc.first_name,
+                   "last_name": doc.last_name, "gender": doc.gender,
+                   "speciality": doc.speciality, "slots": slots}
+        if isinstance(doc.schedule, RuleSchedule):
+            profile["rules"] = [rule.text() for rule in doc.schedule.rules]
+        return {"doctor": profile}
+
+    def _search_patients(self, cmd: dict) -> dict:
+        results = self.hs.search_patients(cmd["query"], int(cmd.get("limit", 20)))
+        return {"patients": [
+            {"patient_id": p.patient_id, "score": score,
+             "name": f"{p.first_name} {p.middle_name} {p.last_name}",
+             "dob": p.dob, "telephone": p.telephone}
+            for score, p in results]}
+
+    def _next_available(self, cmd: dict) -> dict:
+        after = cmd.get("after")
+        if after:
+            after = parse_slot(*self._slot(cmd, "after"))
+        slots = self.hs.next_available(cmd["speciality"],
+                                       int(cmd.get("count", 5)), after)
+        return {"slots": [{"date": date, "time": time,
+                           "doctor_id": doc.doctor_id}
+                          for date, time, doc in slots]}
+
+    @staticmethod
+    def _extras(cmd: dict) -> list:
+        # catalogue service names, or [service, fee] pairs
+        extras = cmd.get("extras", [])
+        if not isinstance(extras, list):
+            raise ValueError("extras must be a list")
+        return [extra if isinstance(extra, str) else tuple(extra)
+                for extra in extras]
+
+    @staticmethod
+    def _invoice_reply(invoice: Invoice) -> dict:
+        return {"invoice_id": invoice.invoice_id,
+                "appointment_id": invoice.appointment_id,
+                "issued": invoice.issued,
+                "items": [[svc, fee] for svc, fee in invoice.items],
+                "total": invoice.total}
+
+    def _bill(self, cmd: dict) -> dict:
+        return self._invoice_reply(
+            self.hs.invoice(cmd["appointment_id"], self._extras(cmd)))
+
+    def _invoice_range(self, cmd: dict) -> dict:
+        invoices = self.hs.invoice_range(cmd.get("from"), cmd.get("to"),
+                                         self._extras(cmd))
+        return {"invoices": [self._invoice_reply(i) for i in invoices],
+                "total": sum(invoice.total for invoice in invoices)}
+
+    def _set_fee(self, cmd: dict) -> dict:
+        self.hs.set_fee(cmd["service"], cmd["fee"])
+        return {}
+
+    def _fees(self, cmd: dict) -> dict:
+        return {"fees": [[service, fee] for service, fee in self.hs.fees]}
+
+    def _revenue(self, cmd: dict) -> dict:
+        return {"revenue": self.hs.revenue(cmd.get("by", "doctor"),
+                                           cmd.get("from"), cmd.get("to"))}
+
+    def _metrics(self, cmd: dict) -> dict:
+        # live counters of an instrumented system (serve/exec --metrics)
+        if self.hs.metrics is None:
+            raise ValueError("metrics are off; start with --metrics FILE")
+        return {"metrics": self.hs.metrics.snapshot()}
+
+
+def run_commands(hs: HospitalSystem, infile, outfile,
+                 flush_each: bool = False) -> int:
+    # read JSON-lines commands from infile (binary), write one JSON reply
+    # line per command to the buffered binary outfile; returns the count
+    processor = CommandProcessor(hs)
+    encode = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+    write = outfile.write
+    count = 0
+    for line in infile:
+        if not line.strip():
+            continue
+        try:
+            cmd = json.loads(line)
+        except ValueError as err:
+            reply = {"ok": False, "error": f"invalid JSON: {err}"}
+        else:
+            reply = processor.execute(cmd)
+        write(encode(reply).encode("utf-8") + b"\n")
+        count += 1
+        if flush_each:
+            # interactive drivers need each reply as soon as it is ready
+            outfile.flush()
+    outfile.flush()
+    return count
+
+
+# -----------------------------------------------------------------------------
+# Network Service
+# -----------------------------------------------------------------------------
+def percentile(ordered: list, q: float) -> float:
+    # nearest-rank percentile (0-100) of an already sorted list
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+
+class CommandServer:
+    # asyncio JSON-over-TCP front end for one HospitalSystem: clients send
+    # the exec protocol (one JSON command per line) and get one reply line
+    # per command, in order; commands may be pipelined without waiting.
+    #   - commands run one at a time on the event loop thread, so the
+    #     plain HospitalSystem is used without locks
+    #   - with a journal, replies are only sent once their entries are
+    #     fsync'd; clients served in the same loop turn share one commit
+    #   - at most max_clients connections are served at once (others wait
+    #     to be admitted) and each connection runs at most `window`
+    #     commands before its replies are flushed with writer.drain()
+    #   - {"op": "stats"} returns per-op counts and latency percentiles
+    #     (receipt of a command to its reply being written)
+    SAMPLES = 10_000     # latencies kept per op
+    MAX_LINE = 1 << 20   # longest accepted command line
+
+    def __init__(self, hs: HospitalSystem, max_clients: int = 256,
+                 window: int = 256):
+        self.hs = hs
+        self.processor = CommandProcessor(hs)
+        self.max_clients = max_clients
+        self.window = window
+        self.clients = 0
+        # op -> number served, and op -> recent latencies in seconds
+        self._counts = collections.Counter()
+        self._latency = {}
+        # future for the journal commit shared by the current loop turn
+        self._commit = None
+        self._encode = json.JSONEncoder(separators=(",", ":"),
+                                        ensure_ascii=False).encode
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765,
+                    ready=None) -> None:
+        # accept clients until SIGTERM (or cancellation); ready(server) is
+        # called once the socket is listening
+        self._admit = asyncio.Semaphore(self.max_clients)
+        stop = asyncio.Event()
+        with contextlib.suppress(NotImplementedError, AttributeError):
+            # POSIX only: a plain `kill` shuts the service down cleanly
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM,
+                                                          stop.set)
+        server = await asyncio.start_server(self._client, host, port)
+        async with server:
+            if ready is not None:
+                ready(server)
+            await stop.wait()
+
+    async def _client(self, reader, writer) -> None:
+        # serve one connection: read whatever has arrived, run the complete
+        # lines in windows, keep any partial line for the next read
+        async with self._admit:
+            self.clients += 1
+            pending = b""
+            try:
+                while True:
+                    data = await reader.read(1 << 16)
+                    if not data:
+                        break
+                    received = _time.perf_counter()
+                    lines = (pending + data).split(b"\n")
+                    pending = lines.pop()
+                    if len(pending) > self.MAX_LINE:
+                        writer.write(b'{"ok":false,"error":"line too long"}\n')
+                        break
+                    for start in range(0, len(lines), self.window):
+                        await self._run(lines[start:start + self.window],
+                                        received, writer)
+            except (ConnectionError, asyncio.CancelledError):
+                # client went away, or shutdown cancelled the connection
+                pass
+            finally:
+                self.clients -= 1
+                writer.close()
+
+    async def _run(self, lines: list, received: float, writer) -> None:
+        # execute a window of command lines and send their replies
+        replies, ops = [], []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                cmd = json.loads(line)
+            except ValueError as err:
+                reply, op = {"ok": False, "error": f"invalid JSON: {err}"}, None
+            else:
+                op = cmd.get("op") if isinstance(cmd, dict) else None
+                if op == "stats":
+                    reply = {"ok": True, "stats": self.stats()}
+                    if "ref" in cmd:
+                        reply["ref"] = cmd["ref"]
+                else:
+                    reply = self.processor.execute(cmd)
+            replies.append(self._encode(reply).encode("utf-8") + b"\n")
+            ops.append(op if op in self.processor.handlers or op == "stats"
+                       else "invalid")
+        await self._durable()
+        writer.write(b"".join(replies))
+        elapsed = _time.perf_counter() - received
+        for op in ops:
+            self._counts[op] += 1
+            samples = self._latency.get(op)
+            if samples is None:
+                samples = self._latency[op] = collections.deque(
+                    maxlen=self.SAMPLES)
+            samples.append(elapsed)
+        await writer.drain()
+
+    async def _durable(self) -> None:
+        # wait for one journal commit covering everything executed so far;
+        # the commit runs after the clients already ready in this loop
+        # turn have executed their commands, so they share its fsync
+        if self.hs.journal is None:
+            return
+        if self._commit is None:
+            self._commit = asyncio.get_running_loop().create_future()
+            asyncio.get_running_loop().call_soon(self._do_commit)
+        await asyncio.shield(self._commit)
+
+    def _do_commit(self) -> None:
+        commit, self._commit = self._commit, None
+        try:
+            self.hs.journal.commit()
+        except OSError as err:
+            commit.set_exception(err)
+        else:
+            commit.set_result(None)
+
+    def stats(self) -> dict:
+        # per-op counts and latency percentiles (ms) over recent requests
+        ops = {}
+        for op, samples in sorted(self._latency.items()):
+            ordered = sorted(samples)
+            ops[op] = {"count": self._counts[op],
+                       "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+                       "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+                       "max_ms": round(ordered[-1] * 1000, 3)}
+        return {"clients": self.clients, "ops": ops}
+
+
+async def load_test(host: str = "127.0.0.1", port: int = 8765,
+                    clients: int = 16, requests: int = 20_000,
+                    pipeline: int = 8, seed: int = 1) -> dict:
+    # drive a running server from `clients` connections, each sending
+    # `pipeline` commands at a time, and measure every request's latency
+    # (send to reply); registers its own patients and doctors first
+    encode = json.JSONEncoder(separators=(",", ":")).encode
+
+    async def call(reader, writer, commands: list) -> list:
+        # send commands in one write; returns (reply, seconds) per command
+        start = _time.perf_counter()
+        writer.write(b"".join(encode(cmd).encode("utf-8") + b"\n"
+                              for cmd in commands))
+        await writer.drain()
+        replies = []
+        for _ in commands:
+            reply = json.loads(await reader.readline())
+            replies.append((reply, _time.perf_counter() - start))
+        return replies
+
+    async def connect():
+        return await asyncio.open_connection(host, port, limit=1 << 22)
+
+    n_patients, n_doctors = 200, 20
+    per_doctor = max(20, requests // n_doctors)
+    base = datetime.datetime(2030, 1, 1, 8, 0)
+    slot_times = [format_slot(base + datetime.timedelta(minutes=15 * k))
+                  for k in range(per_doctor)]
+    reader, writer = await connect()
+    setup = [{"op": "register_patient", "fields": {
+                 **dict(zip(PATIENT_COLUMNS, _bench_patient_fields(i))),
+                 "first_name": "Load", "middle_name": "Gen",
+                 "last_name": "Test", "age": ""}}
+             for i in range(n_patients)]
+    setup += [{"op": "register_doctor", "fields": {
+                  "first_name": "Load", "last_name": "Doctor", "gender": "F",
+                  "speciality": f"Load{d % 4}",
+                  "slots": [f"{date} {time}" for date, time in slot_times]}}
+              for d in range(n_doctors)]
+    replies = [reply for reply, _ in await call(reader, writer, setup)]
+    failed = [r for r in replies if not r["ok"]]
+    if failed:
+        raise RuntimeError(f"load test setup failed: {failed[0]['error']}")
+    patient_ids = [r["patient_id"] for r in replies[:n_patients]]
+    doctor_ids = [r["doctor_id"] for r in replies[n_patients:]]
+
+    latencies = collections.defaultdict(list)
+    outcomes = collections.Counter()
+
+    async def client(number: int, count: int) -> None:
+        rng = random.Random(seed * 1000 + number)
+        booked = []
+        reader, writer = await connect()
+        sent = 0
+        while sent < count:
+            commands = []
+            for _ in range(min(pipeline, count - sent)):
+                roll = rng.random()
+                if roll < 0.15 and booked:
+                    cmd = {"op": "cancel", "appointment_id":
+                           booked.pop(rng.randrange(len(booked)))}
+                elif roll < 0.55:
+                    date, time = rng.choice(slot_times)
+                    cmd = {"op": "book", "patient_id": rng.choice(patient_ids),
+                           "doctor_id": rng.choice(doctor_ids),
+                           "date": date, "time": time}
+                elif roll < 0.8:
+                    cmd = {"op": "patient",
+                           "patient_id": rng.choice(patient_ids)}
+                elif roll < 0.9:
+                    cmd = {"op": "appointments", "limit": 20,
+                           "doctor_id": rng.choice(doctor_ids)}
+                else:
+                    cmd = {"op": "next_available",
+                           "speciality": f"Load{rng.randrange(4)}"}
+                commands.append(cmd)
+            for cmd, (reply, elapsed) in zip(
+                    commands, await call(reader, writer, commands)):
+                latencies[cmd["op"]].append(elapsed)
+                outcomes["ok" if reply["ok"] else "rejected"] += 1
+                if cmd["op"] == "book" and reply["ok"]:
+                    booked.append(reply["appointment_id"])
+            sent += len(commands)
+        writer.close()
+
+    start = _time.perf_counter()
+    await asyncio.gather(*(client(n, requests // clients + (n < requests % clients))
+                           for n in range(clients)))
+    elapsed = _time.perf_counter() - start
+    # the server's own view (command receipt to reply written)
+    [(server, _)] = await call(reader, writer, [{"op": "stats"}])
+    writer.close()
+    every = sorted(itertools.chain.from_iterable(latencies.values()))
+    per_op = {}
+    for op, values in sorted(latencies.items()):
+        values.sort()
+        per_op[op] = {"count": len(values),
+                      "p50_ms": percentile(values, 50) * 1000,
+                      "p99_ms": percentile(values, 99) * 1000}
+    return {"requests": len(every), "seconds": elapsed,
+            "per_second": len(every) / elapsed,
+            "p50_ms": percentile(every, 50) * 1000,
+            "p99_ms": percentile(every, 99) * 1000,
+            "ok": outcomes["ok"], "rejected": outcomes["rejected"],
+            "ops": per_op, "server": server.get("stats", {})}
+
+
+def print_load_report(report: dict) -> None:
+    # human-readable load test summary
+    print(f"{report['requests']:,} requests in {report['seconds']:.2f} s "
+          f"= {report['per_second']:,.0f} req/s  ({report['rejected']:,} "
+          f"rejected by the system, e.g. slot already taken)")
+    server = report["server"].get("ops", {})
+    print(f"{'Op':<16}{'count':>8}{'p50 (ms)':>10}{'p99 (ms)':>10}"
+          f"{'server p50':>12}{'server p99':>12}")
+    for op, row in report["ops"].items():
+        seen = server.get(op, {})
+        print(f"{op:<16}{row['count']:>8,}{row['p50_ms']:>10.2f}"
+              f"{row['p99_ms']:>10.2f}{seen.get('p50_ms', 0):>12.2f}"
+              f"{seen.get('p99_ms', 0):>12.2f}")
+    print(f"{'all':<16}{report['requests']:>8,}{report['p50_ms']:>10.2f}"
+          f"{report['p99_ms']:>10.2f}")
+
+
+# -----------------------------------------------------------------------------
+# Synthetic Workloads
+# -----------------------------------------------------------------------------
+# name/place pools for generated patients and doctors
+SYNTH_FIRST_NAMES = ("Andre", "Keisha", "Omar", "Tanya", "Dwayne", "Latoya",
+                     "Ricardo", "Simone", "Kemar", "Shanice", "Marlon",
+                     "Natalie", "Jermaine", "Monique", "Damion", "Kerry-Ann")
+SYNTH_LAST_NAMES = ("Brown", "Williams", "Campbell", "Smith", "Johnson",
+                    "Thomas", "Reid", "Clarke", "Henry", "Morgan", "Grant",
+                    "Francis", "Lewis", "Stewart", "McKenzie", "Bailey")
+SYNTH_PLACES = ("Kingston", "Spanish Town", "Montego Bay", "Mandeville",
+                "May Pen", "Ocho Rios", "Savanna-la-Mar", "Port Antonio")
+SYNTH_SPECIALITIES = ("General Practice", "Cardiology", "Paediatrics",
+                      "Dermatology", "Orthopaedics", "Obstetrics",
+                      "Neurology", "Ophthalmology")
+
+
+class SyntheticWorkload:
+    # reproducible hospital data for benchmarks and demos: the same size
+    # and seed always give the same patients, doctors and booking/cancel
+    # mix. size is the number of bookings; patients and doctors scale
+    # with it. Doctors work weekday hours in 15-minute slots, with half
+    # as many slots again as they get bookings; rule_share of them use a
+    # weekly AvailabilityRule, the rest an explicit slot list
+    def __init__(self, size: int, seed: int = 1, cancel_share: float = 0.1,
+                 rule_share: float = 0.5,
+                 start: datetime.date = datetime.date(2025, 1, 6)):
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        self.size, self.seed = size, seed
+        self.cancel_share, self.rule_share = cancel_share, rule_share
+        self.n_patients = max(1, size // 10)
+        self.n_doctors = max(2, size // 500)
+        # 8 working hours = 32 slots a day, 5 days a week
+        per_doctor = -(-size // self.n_doctors) * 3 // 2
+        self.first = start
+        self.last = start + datetime.timedelta(
+            days=-(-per_doctor // 32) * 7 // 5 + 7)
+
+    def _rng(self, stream: int) -> random.Random:
+        # independent, reproducible random stream per kind of data
+        return random.Random(self.seed * 1_000 + stream)
+
+    def rule(self, index: int) -> str:
+        # weekly rule for doctor index (shifts start at 07:00, 08:00 or 09:00)
+        hour = 7 + index % 3
+        return (f"Mon-Fri {hour:02}:00-{hour + 8:02}:00 every {SLOT_MINUTES} "
+                f"from {self.first} until {self.last}")
+
+    def patients(self):
+        # yield register_patient() arguments for every patient
+        rng = self._rng(1)
+        first, last = SYNTH_FIRST_NAMES, SYNTH_LAST_NAMES
+        for i in range(self.n_patients):
+            surname = rng.choice(last)
+            dob = datetime.date.fromordinal(
+                rng.randrange(datetime.date(1940, 1, 1).toordinal(),
+                              datetime.date(2020, 1, 1).toordinal()))
+            yield [rng.choice(first), rng.choice(first), surname,
+                   dob.isoformat(),
+                   compute_age(dob), rng.choice("MF"),
+                   f"{rng.randrange(1, 200)} Main St", f"876{i:07}",
+                   rng.choice(SYNTH_PLACES), "Clerk", "Acme",
+                   rng.choice(first), surname, rng.choice(first),
+                   rng.choice(last), rng.choice("ABCD"), "Single", "None",
+                   rng.choice(first), surname, "1 Main St", "Sibling",
+                   f"876{rng.randrange(10 ** 7):07}"]
+
+    def doctors(self):
+        # yield register_doctor() arguments for every doctor
+        rng = self._rng(2)
+        for d in range(self.n_doctors):
+            rule = self.rule(d)
+            if rng.random() < self.rule_share:
+                schedule = {"rules": [rule]}
+            else:
+                schedule = [format_slot(dt)
+                            for dt in AvailabilityRule.parse(rule).between()]
+            yield [rng.choice(SYNTH_FIRST_NAMES), rng.choice(SYNTH_LAST_NAMES),
+                   rng.choice("MF"), SYNTH_SPECIALITIES[d % len(SYNTH_SPECIALITIES)],
+                   schedule]
+
+    def operations(self):
+        # yield ("book", patient, doctor, date, time) and ("cancel", booking)
+        # steps; patient/doctor are 0-based registration order and booking
+        # is the 0-based index of an earlier, still confirmed "book" step.
+        # A patient is never booked twice at the same time (not even after
+        # a cancel, so the booking file without cancels stays valid)
+        rng = self._rng(3)
+        slots = [format_slot(dt) for dt in
+                 AvailabilityRule.parse(self.rule(0)).between()]
+        # every doctor's rule has the same shape, shifted by whole hours
+        shifts = [datetime.timedelta(hours=d % 3)
+                  for d in range(self.n_doctors)]
+        picks = rng.sample(range(self.n_doctors * len(slots)), self.size)
+        confirmed = []
+        busy = set()   # (patient, datetime) of every booking so far
+        for booking, pick in enumerate(picks):
+            doctor, k = divmod(pick, len(slots))
+            dt = parse_slot(*slots[k]) + shifts[doctor]
+            patient = rng.randrange(self.n_patients)
+            while (patient, dt) in busy:
+                patient = rng.randrange(self.n_patients)
+            busy.add((patient, dt))
+            yield ("book", patient, doctor, *format_slot(dt))
+            confirmed.append(booking)
+            if rng.random() < self.cancel_share:
+                # cancel a random confirmed booking (swap-remove)
+                i = rng.randrange(len(confirmed))
+                confirmed[i], confirmed[-1] = confirmed[-1], confirmed[i]
+                yield ("cancel", confirmed.pop())
+
+    def populate(self, hs: HospitalSystem) -> list:
+        # register everything in hs and replay the operations; returns the
+        # IDs of the appointments left confirmed
+        patients = [hs.register_patient(*fields) for fields in self.patients()]
+        doctors = [hs.register_doctor(*fields) for fields in self.doctors()]
+        booked, canceled = [], set()
+        for step in self.operations():
+            if step[0] == "book":
+                booked.append(hs.make_booking(patients[step[1]],
+                                              doctors[step[2]],
+                                              step[3], step[4]).appointment_id)
+            else:
+                hs.cancel_booking(booked[step[1]])
+                canceled.add(step[1])
+        return [aid for i, aid in enumerate(booked) if i not in canceled]
+
+    def write_files(self, directory: str) -> dict:
+        # write patients.csv, doctors.jsonl and bookings.csv for the
+        # import/book-batch commands (cancellations are left out). Booking
+        # IDs assume the files are loaded into an empty system
+        os.makedirs(directory, exist_ok=True)
+        paths = {kind: os.path.join(directory, name) for kind, name in
+                 (("patients", "patients.csv"), ("doctors", "doctors.jsonl"),
+                  ("bookings", "bookings.csv"))}
+        with open(paths["patients"], "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(PATIENT_COLUMNS)
+            # age is left blank: import computes it on the day
+            writer.writerows([*row[:4], "", *row[5:]]
+                             for row in self.patients())
+        with open(paths["doctors"], "w", encoding="utf-8") as f:
+            for fn, ln, gender, speciality, schedule in self.doctors():
+                row = {"first_name": fn, "last_name": ln, "gender": gender,
+                       "speciality": speciality}
+                if isinstance(schedule, dict):
+                    row["rules"] = schedule["rules"]
+                else:
+                    row["slots"] = [f"{d} {t}" for d, t in schedule]
+                f.write(json.dumps(row) + "\n")
+        with open(paths["bookings"], "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(("patient_id", "doctor_id", "date", "time"))
+            for step in self.operations():
+                if step[0] == "book":
+                    writer.writerow((f"P{step[1] + 1:03}", f"D{step[2] + 1:03}",
+                                     step[3], step[4]))
+        return paths
+
+
+# -----------------------------------------------------------------------------
+# Benchmarks
+# -----------------------------------------------------------------------------
+def _timed(fn, *args) -> float:
+    # run fn(*args) once and return elapsed seconds
+    start = _time.perf_counter()
+    fn(*args)
+    return _time.perf_counter() - start
+
+
+def _make_slots(n: int, seed: int = 1) -> list:
+    # build n distinct 15-minute (date, time) slots in shuffled order
+    base = datetime.datetime(2025, 1, 1, 8, 0)
+    slots = [format_slot(base + datetime.timedelta(minutes=15 * i))
+             for i in range(n)]
+    random.Random(seed).shuffle(slots)
+    return slots
+
+
+def bench_slots(size: int) -> None:
+    # compare the legacy list-of-tuples schedule with SlotIndex
+    slots = _make_slots(size)
+    # probe with fresh string objects, as typed at the front desk
+    probes = [(d.encode().decode(), t.encode().decode())
+              for d, t in random.Random(2).sample(slots, min(size, 2000))]
+
+    def legacy_book(schedule):
+        # is_available + book_slot + cancel_slot, as the old Doctor did it
+        for slot in probes:
+            if slot in schedule:
+                schedule.remove(slot)
+        for slot in probes:
+            schedule.append(slot)
+
+    def indexed_book(doctor):
+        # the same workload through the indexed Doctor API
+        for date, time in probes:
+            if doctor.is_available(date, time):
+                doctor.book_slot(date, time)
+        for date, time in probes:
+            doctor.cancel_slot(date, time)
+
+    legacy_schedule = list(slots)
+    doctor = Doctor("Bench", "Mark", "X", "D000", "General", slots)
+    rows = [("available/book/cancel", _timed(legacy_book, legacy_schedule),
+             _timed(indexed_book, doctor)),
+            # view_schedule: sort + format every slot vs pre-sorted iteration
+            ("sorted listing",
+             _timed(lambda: [f"{d} {t}" for d, t in sorted(legacy_schedule)]),
+             _timed(lambda: [f"{d} {t}" for d, t in doctor.schedule]))]
+    # range query: one day of slots from the middle of the schedule
+    start = parse_slot(*sorted(slots)[size // 2])
+    end = start + datetime.timedelta(days=1)
+    rows.append(("slots in one day",
+                 _timed(lambda: sorted(s for s in legacy_schedule
+                                       if start <= parse_slot(*s) < end)),
+                 _timed(doctor.slots_between, start, end)))
+
+    print(f"Slots per doctor : {size:,}  (probes: {len(probes):,})")
+    print(f"{'Operation':<24}{'list (s)':>12}{'index (s)':>12}{'speed-up':>10}")
+    for label, old, new in rows:
+        print(f"{label:<24}{old:>12.4f}{new:>12.4f}{old / max(new, 1e-9):>9.1f}x")
+
+
+def _bench_patient_fields(i: int) -> list:
+    # Patient constructor arguments (without ID) for synthetic patient i
+    return [f"First{i}", "", f"Last{i}", "1980-01-01", 45, "F",
+            "1 Main St", f"876{i:07}", "Kingston", "Clerk", "Acme",
+            "Father", "Last", "Mother", "Last", "A", "Single", "None",
+            "Kin", "Last", "1 Main St", "Sibling", f"876{i:07}"]
+
+
+def _populate(hs: HospitalSystem, size: int) -> float:
+    # register patients/doctors and book size appointments; returns seconds
+    n_doctors = max(1, size // 2000)
+    n_patients = max(1, size // 10)
+    base = datetime.datetime(2025, 1, 1, 8, 0)
+    per_doctor = -(-size // n_doctors)
+    slot_times = [format_slot(base + datetime.timedelta(minutes=15 * k))
+                  for k in range(per_doctor)]
+    start = _time.perf_counter()
+    for i in range(n_patients):
+        hs.register_patient(*_bench_patient_fields(i))
+    doctor_ids = [hs.register_doctor(f"Doc{d}", "Bench", "M", f"Spec{d % 10}",
+                                     slot_times)
+                  for d in range(n_doctors)]
+    for i in range(size):
+        date, time = slot_times[i // n_doctors]
+        hs.make_booking(f"P{i % n_patients + 1:03}",
+                        doctor_ids[i % n_doctors], date, time)
+    return _time.perf_counter() - start
+
+
+def bench_journal(size: int) -> None:
+    # journal write throughput and startup time for size appointments
+    with tempfile.TemporaryDirectory() as directory:
+        hs = Journal(directory, snapshot_every=0).attach(HospitalSystem())
+        write = _populate(hs, size)
+        ops = len(hs.patients) + len(hs.doctors) + size
+        hs.close()
+        log_mb = os.path.getsize(os.path.join(directory, Journal.JOURNAL)) / 1e6
+
+        # startup by replaying the full journal
+        replay = _timed(lambda: Journal(directory).attach(HospitalSystem()).close())
+        # compact, then start up from the snapshot alone
+        hs = Journal(directory).attach(HospitalSystem())
+        snap = _timed(hs.journal.snapshot)
+        hs.close()
+        snap_mb = os.path.getsize(os.path.join(directory, Journal.SNAPSHOT)) / 1e6
+        restored = HospitalSystem()
+        load = _timed(lambda: Journal(directory).attach(restored).close())
+        assert len(restored.appointments) == size
+
+    print(f"Appointments: {size:,}  patients: {len(restored.patients):,}  "
+          f"doctors: {len(restored.doctors):,}")
+    print(f"Journal write      : {write:8.2f} s  ({ops / write:,.0f} ops/s, {log_mb:.1f} MB)")
+    print(f"Startup (replay)   : {replay:8.2f} s")
+    print(f"Snapshot write     : {snap:8.2f} s  ({snap_mb:.1f} MB)")
+    print(f"Startup (snapshot) : {load:8.2f} s")
+
+
+def bench_storage(size: int) -> None:
+    # compare the in-memory and SQLite backends at size appointments
+    with tempfile.TemporaryDirectory() as directory:
+        backends = (("memory", HospitalSystem()),
+                    ("sqlite", SQLiteHospitalSystem(
+                        os.path.join(directory, "bench.sqlite3"))))
+        results = {}
+        for name, hs in backends:
+            row = results[name] = {}
+            row["book all"] = _populate(hs, size)
+            ids = random.Random(3).sample(range(1, size + 1), min(size, 1000))
+            row["1k lookups"] = _timed(lambda: [hs.appointments[f"A{i:03}"]
+                                                for i in ids])
+            row["1k cancels"] = _timed(lambda: [hs.cancel_booking(f"A{i:03}")
+                                                for i in ids])
+            row["list all"] = _timed(lambda: sum(1 for _ in hs.appointment_rows()))
+            row["next free"] = _timed(hs.next_available, "Spec3", 10)
+            hs.close()
+    print(f"Appointments: {size:,}")
+    print(f"{'Operation':<14}{'memory (s)':>12}{'sqlite (s)':>12}")
+    for op in results["memory"]:
+        print(f"{op:<14}{results['memory'][op]:>12.4f}{results['sqlite'][op]:>12.4f}")
+
+
+def bench_search(size: int) -> None:
+    # patient search latency over a size-patient registry
+    rng = random.Random(4)
+    first = ["Ann", "Mark", "Kemar", "Shanice", "Andre", "Tanya", "Omar",
+             "Keisha", "Damion", "Rushane", "Sasha", "Jermaine"]
+    last = ["Brown", "Williams", "Campbell", "Smith", "Johnson", "Thompson",
+            "Clarke", "Reid", "Wright", "Stewart", "Graham", "Morgan"]
+    hs = HospitalSystem()
+    with _gc_paused(freeze=True):
+        start = _time.perf_counter()
+        for i in range(size):
+            fields = _bench_patient_fields(i)
+            fields[0] = rng.choice(first)
+            fields[2] = f"{rng.choice(last)}{i % 5000}"
+            fields[3] = (datetime.date(1940, 1, 1) + datetime.timedelta(
+                days=rng.randrange(30000))).isoformat()
+            hs.register_patient(*fields)
+        build = _time.perf_counter() - start
+    queries = {"surname prefix": "Campbell12",
+               "first + surname": "ann smith4",
+               "partial name": "ampbell99",
+               "phone": f"876{size // 2:07}",
+               "date of birth": "1975-06-15",
+               "name + DOB range": "brown 1980-01-01..1985-12-31"}
+    print(f"Patients: {size:,}  (registration + indexing {build:.2f} s)")
+    print(f"{'Query':<18}{'index (ms)':>12}{'scan (ms)':>12}{'hits':>7}")
+    for label, text in queries.items():
+        indexed = _timed(hs.search_patients, text) * 1000
+        hits = len(hs.search_patients(text))
+        criteria = parse_patient_query(text)
+
+        def scan():
+            # full-scan baseline over every patient
+            found = []
+            for p in hs.patients.values():
+                if criteria.get("phone") and criteria["phone"] not in (
+                        p.telephone, p.nok_phone):
+                    continue
+                if criteria.get("dob_from") and not (
+                        criteria["dob_from"] <= p.dob <= criteria["dob_to"]):
+                    continue
+                if criteria["names"] and not PatientIndex.score(
+                        p, criteria["names"]):
+                    continue
+                found.append(p)
+            return found
+
+        print(f"{label:<18}{indexed:>12.2f}{_timed(scan) * 1000:>12.1f}{hits:>7}")
+
+
+def bench_appointments(size: int) -> None:
+    # indexed appointment queries against a full scan of the dict
+    hs = HospitalSystem()
+    with _gc_paused(freeze=True):
+        _populate(hs, size)
+        rng = random.Random(5)
+        for i in rng.sample(range(1, size + 1), size // 10):
+            hs.cancel_booking(f"A{i:03}")
+    first = min(hs.appointment_index._dates)
+    week_end = (datetime.date.fromisoformat(first) +
+                datetime.timedelta(days=6)).isoformat()
+    queries = {
+        "doctor, confirmed, 1 week": dict(doctor_id="D004", status="Confirmed",
+                                         date_from=first, date_to=week_end),
+        "one day": dict(date_from=first, date_to=first),
+        "patient history": dict(patient_id="P007"),
+        "canceled, 1 week": dict(status="Canceled", date_from=first,
+                                 date_to=week_end),
+    }
+
+    def scan(date_from=None, date_to=None, status=None, doctor_id=None,
+             patient_id=None):
+        # full-scan baseline with the same ordering
+        found = [a for a in hs.appointments.values()
+                 if (not date_from or a.date >= date_from)
+                 and (not date_to or a.date <= date_to)
+                 and (not status or a.status == status)
+                 and (not doctor_id or a.doctor.doctor_id == doctor_id)
+                 and (not patient_id or a.patient.patient_id == patient_id)]
+        found.sort(key=lambda a: (a.date, a.time, a.appointment_id))
+        return found
+
+    print(f"Appointments: {size:,}")
+    print(f"{'Query':<28}{'index (ms)':>12}{'scan (ms)':>12}{'rows':>8}")
+    for label, filters in queries.items():
+        rows = list(hs.query_appointments(**filters))
+        assert rows == scan(**filters)
+        indexed = _timed(lambda: list(hs.query_appointments(**filters)))
+        scanned = _timed(lambda: scan(**filters))
+        print(f"{label:<28}{indexed * 1000:>12.2f}{scanned * 1000:>12.1f}"
+              f"{len(rows):>8}")
+
+
+def bench_memory(size: int) -> None:
+    # bytes per patient and per appointment: the slotted, interned records
+    # against the same values held in plain dict-backed objects (the
+    # earlier layout: free strings, eager names, a list per patient)
+    class Plain:
+        pass
+
+    rng = random.Random(6)
+    first = ["Ann", "Mark", "Kemar", "Shanice", "Andre", "Tanya", "Omar"]
+    wards = ["A", "B", "C", "Maternity", "Surgical"]
+    base = datetime.datetime(2025, 1, 1, 8)
+    patient_lines, appointment_lines = [], []
+    for i in range(size):
+        fields = _bench_patient_fields(i)
+        fields[0] = rng.choice(first)
+        fields[15] = rng.choice(wards)
+        patient_lines.append(json.dumps(fields + [f"P{i + 1:03}"]))
+        date, time = format_slot(base + datetime.timedelta(minutes=15 * i))
+        appointment_lines.append(json.dumps([f"A{i + 1:03}", date, time,
+                                             "Confirmed"]))
+    doctor = Doctor("Bench", "Mark", "M", "D001", "General", ())
+
+    def plain_patient(row):
+        obj = Plain()
+        obj.__dict__.update(zip(PATIENT_FIELDS, row))
+        obj.father_name = f"{obj.father_fn} {obj.father_ln}"
+        obj.mother_name = f"{obj.mother_fn} {obj.mother_ln}"
+        obj.nok_name = f"{obj.nok_fn} {obj.nok_ln}"
+        obj.appointment_list = []
+        return obj
+
+    def plain_appointment(row, patient):
+        obj = Plain()
+        obj.appointment_id, obj.date, obj.time, obj.status = row
+        obj.patient, obj.doctor = patient, doctor
+        return obj
+
+    def compact_appointment(row, patient):
+        appt = Appointment(row[0], patient, doctor, row[1], row[2])
+        appt.status = row[3]
+        return appt
+
+    def measure(build) -> int:
+        # bytes still allocated once build() has run; records are decoded
+        # from JSON inside the build, as they are when loaded from the
+        # journal, an import or the exec protocol
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        build()
+        used = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        return used
+
+    layouts = {"dict-based": (plain_patient, plain_appointment),
+               "compact": (lambda row: Patient(*row), compact_appointment)}
+    print(f"Records: {size:,} patients, {size:,} appointments")
+    print(f"{'Layout':<12}{'B/patient':>11}{'B/appointment':>15}")
+    for name, (make_patient, make_appointment) in layouts.items():
+        patients, appointments = [], []
+        per_patient = measure(lambda: patients.extend(
+            make_patient(json.loads(line)) for line in patient_lines)) / size
+        per_appt = measure(lambda: appointments.extend(
+            make_appointment(json.loads(line), patient)
+            for line, patient in zip(appointment_lines, patients))) / size
+        print(f"{name:<12}{per_patient:>11.0f}{per_appt:>15.0f}")
+        del patients, appointments
+
+
+def bench_columns(size: int) -> None:
+    # aggregate queries over the appointment objects against the columns
+    hs = HospitalSystem()
+    with _gc_paused(freeze=True):
+        _populate(hs, size)
+        rng = random.Random(7)
+        for i in rng.sample(range(1, size + 1), size // 10):
+            hs.cancel_booking(f"A{i:03}")
+    first = min(hs.appointment_index._dates)
+    last = (datetime.date.fromisoformat(first) +
+            datetime.timedelta(days=30)).isoformat()
+
+    def objects_daily():
+        counts = collections.Counter(
+            (a.doctor.doctor_id, a.date) for a in hs.appointments.values()
+            if a.status == "Confirmed" and first <= a.date <= last)
+        return dict(counts)
+
+    def objects_rates():
+        totals, canceled = collections.Counter(), collections.Counter()
+        for a in hs.appointments.values():
+            totals[a.doctor.doctor_id] += 1
+            if a.status == "Canceled":
+                canceled[a.doctor.doctor_id] += 1
+        return {did: canceled[did] / n for did, n in totals.items()}
+
+    build = _timed(hs.analytics)
+    assert objects_daily() == hs.daily_counts(first, last, "Confirmed")
+    assert objects_rates() == hs.cancellation_rates()
+    print(f"Appointments: {size:,}  (columns built in {build:.2f} s, "
+          f"{'NumPy' if numpy is not None else 'pure Python'})")
+    print(f"{'Aggregate':<26}{'objects (ms)':>14}{'columns (ms)':>14}")
+    for label, slow, fast in (
+            ("confirmed/doctor/day 31d", objects_daily,
+             lambda: hs.daily_counts(first, last, "Confirmed")),
+            ("cancellation rates", objects_rates, hs.cancellation_rates)):
+        print(f"{label:<26}{_timed(slow) * 1000:>14.1f}"
+              f"{_timed(fast) * 1000:>14.1f}")
+
+
+def _check_consistency(hs: HospitalSystem, slots: dict) -> None:
+    # assert the invariants concurrent booking must preserve; slots maps
+    # doctor_id -> every (date, time) slot the doctor was registered with
+    ids = list(hs.appointments)
+    if ids != [f"A{n:03}" for n in range(1, hs._acounter + 1)]:
+        raise AssertionError("appointment IDs are duplicated or missing")
+    merged = set()
+    for did, doctor in hs.doctors.items():
+        booked = [(a.date, a.time) for a in hs.query_appointments(
+            doctor_id=did, status="Confirmed")]
+        free = set(doctor.schedule)
+        if len(booked) != len(set(booked)):
+            raise AssertionError(f"{did} has a double-booked slot")
+        if free & set(booked) or free | set(booked) != set(slots[did]):
+            raise AssertionError(f"{did}'s free slots disagree with bookings")
+        merged.update((parse_slot(*slot), did) for slot in free)
+    indexed = set()
+    for index in hs.slot_finder._by_speciality.values():
+        indexed.update(index.iter_datetimes())
+    if indexed != merged:
+        raise AssertionError("speciality index disagrees with schedules")
+    per_patient = collections.Counter(a.patient.patient_id
+                                      for a in hs.appointments.values())
+    for pid, patient in hs.patients.items():
+        if len(patient.appointment_list) != per_patient[pid]:
+            raise AssertionError(f"{pid}'s appointment list lost a booking")
+
+
+def bench_concurrency(size: int) -> None:
+    # hammer book/cancel/batch from many threads, verify nothing was
+    # double-booked or issued twice, and report throughput per thread count
+    n_doctors, n_patients, per_doctor = 32, 500, 100
+    base = datetime.datetime(2025, 1, 1, 8, 0)
+    slot_times = [format_slot(base + datetime.timedelta(minutes=15 * k))
+                  for k in range(per_doctor)]
+    interval = sys.getswitchinterval()
+    # switch threads far more often than usual to provoke interleavings
+    sys.setswitchinterval(1e-5)
+    try:
+        print(f"Operations per run: {size:,}  ({n_doctors} doctors x "
+              f"{per_doctor} slots, 70% book / 20% cancel / 10% batch of 3)")
+        print(f"{'Threads':>7}{'ops/s':>10}{'booked':>9}{'conflicts':>11}  check")
+        for threads in (1, 2, 4, 8):
+            hs = ThreadSafeHospitalSystem()
+            for i in range(n_patients):
+                hs.register_patient(*_bench_patient_fields(i))
+            slots = {hs.register_doctor(f"Doc{d}", "Bench", "M",
+                                        f"Spec{d % 4}", slot_times): slot_times
+                     for d in range(n_doctors)}
+            doctor_ids = list(slots)
+            counts = collections.Counter()
+            failures = []
+            barrier = threading.Barrier(threads + 1)
+
+            def worker(seed: int, ops: int) -> None:
+                rng = random.Random(seed)
+                mine = []
+                try:
+                    barrier.wait()
+                    for _ in range(ops):
+                        roll = rng.random()
+                        pick = lambda: (f"P{rng.randrange(n_patients) + 1:03}",
+                                        rng.choice(doctor_ids),
+                                        *rng.choice(slot_times))
+                        if roll < 0.2 and mine:
+                            hs.cancel_booking(mine.pop(rng.randrange(len(mine))))
+                        elif roll < 0.3:
+                            report = hs.book_batch([pick() for _ in range(3)])
+                            mine.extend(report.appointment_ids)
+                            counts["conflicts" if not report.applied
+                                   else "booked"] += 1
+                        else:
+                            try:
+                                mine.append(hs.make_booking(*pick()).appointment_id)
+                                counts["booked"] += 1
+                            except BookingError:
+                                counts["conflicts"] += 1
+                except BaseException as err:
+                    failures.append(err)
+                    barrier.abort()
 
-    def add_patient(self) -> None:
-        # start patient registration sequence
-        print("\n-- Register New Patient --")
+            pool = [threading.Thread(target=worker, args=(t, size // threads))
+                    for t in range(threads)]
+            for thread in pool:
+                thread.start()
+            barrier.wait()
+            start = _time.perf_counter()
+            for thread in pool:
+                thread.join()
+            elapsed = _time.perf_counter() - start
+            if failures:
+                raise failures[0]
+            _check_consistency(hs, slots)
+            print(f"{threads:>7}{size / elapsed:>10,.0f}{counts['booked']:>9,}"
+                  f"{counts['conflicts']:>11,}  ok")
+    finally:
+        sys.setswitchinterval(interval)
 
-        # prompt for and validate each name part
-        fn = get_alpha("First Name        : ")
-        mn = get_alpha("Middle Name       : ")
-        ln = get_alpha("Last Name         : ")
 
-        # loop until DOB and age match
-        while True:
-            # get valid date object for DOB
-            dob_date = get_dob("Date of Birth (YYYY-MM-DD): ")
-            # get integer age
-            age = get_int("Age               : ")
-            # calculate age from DOB
-            calc_age = compute_age(dob_date)
-            # if mismatch between entered and calculated age
-            if calc_age != age:
-                print(f"Invalid age; calculated age is {calc_age} based on DOB.")
-                continue
-            # convert date object back to ISO string
-            dob_str = dob_date.isoformat()
-            break
+def bench_server(size: int) -> None:
+    # start 'serve' (memory backend) in a child process on a free port and
+    # load-test it over localhost at several concurrency levels
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                             "serve", "--port", "0"],
+                            stdout=subprocess.PIPE, text=True)
+    try:
+        # "Serving on host:port"
+        port = int(proc.stdout.readline().rsplit(":", 1)[1])
+        print(f"Requests per run: {size:,}  (40% book, 15% cancel, 25% "
+              f"patient, 10% appointments, 10% next_available)")
+        print(f"{'clients':>8}{'pipeline':>9}{'req/s':>9}{'p50 (ms)':>10}"
+              f"{'p99 (ms)':>10}")
+        for clients, pipeline in ((1, 1), (16, 1), (16, 8), (64, 4)):
+            report = asyncio.run(load_test("127.0.0.1", port, clients, size,
+                                           pipeline))
+            print(f"{clients:>8}{pipeline:>9}{report['per_second']:>9,.0f}"
+                  f"{report['p50_ms']:>10.2f}{report['p99_ms']:>10.2f}")
+    finally:
+        proc.terminate()
+        proc.wait()
 
-        # prompt for gender and contact details
-        gender = input("Gender            : ").strip()
-        address = input("Address           : ").strip()
-        telephone = get_phone("Telephone Number  : ")
-        pob = input("Place of Birth    : ").strip()
-        occupation = input("Occupation        : ").strip()
-        employer = input("Employer          : ").strip()
-        # ward, union status, religion are patient-level fields
-        ward = input("Ward               : ").strip()
-        union_status = input("Union Status       : ").strip()
-        religion = input("Religion           : ").strip()
 
-        # parental names, validated alphabetically
-        print("\n-- Parental Details --")
-        father_fn = get_alpha("Father's First Name: ")
-        father_ln = get_alpha("Father's Last Name : ")
-        mother_fn = get_alpha("Mother's First Name: ")
-        mother_ln = get_alpha("Mother's Last Name : ")
+def bench_waitlist(size: int) -> None:
+    # place size referrals into 50k free slots: one-by-one (greedy) vs
+    # the matching optimiser, serially and in a process pool
+    hs = HospitalSystem()
+    with _gc_paused(freeze=True):
+        n_specialities, per_speciality, n_days, per_day = 10, 10, 20, 25
+        start_day = datetime.date(2025, 3, 3)
+        day_list = [(start_day + datetime.timedelta(days=k)).isoformat()
+                    for k in range(n_days)]
+        slots = [(day, format_slot(datetime.datetime(2025, 1, 1, 8) +
+                                   datetime.timedelta(minutes=20 * k))[1])
+                 for day in day_list for k in range(per_day)]
+        by_speciality = {}
+        for spec in range(n_specialities):
+            by_speciality[f"Spec{spec}"] = [
+                hs.register_doctor(f"Doc{spec}x{d}", "Bench", "F",
+                                   f"Spec{spec}", slots)
+                for d in range(per_speciality)]
+        for i in range(size):
+            hs.register_patient(*_bench_patient_fields(i))
+        rng = random.Random(8)
+        # uneven demand: the first specialities are in short supply
+        weights = [n_specialities - k for k in range(n_specialities)]
+        referrals = []
+        for i in range(size):
+            spec = rng.choices(list(by_speciality), weights)[0]
+            preferred = (tuple(rng.sample(by_speciality[spec], 2))
+                         if rng.random() < 0.5 else ())
+            # most referrals want one of the first days, with a short window
+            first = min(n_days - 1, int(rng.expovariate(1 / 3)))
+            last = min(n_days - 1, first + rng.randrange(0, 4))
+            referrals.append((f"P{i + 1:03}", spec, preferred,
+                              day_list[first], day_list[last]))
+    print(f"Referrals: {size:,}  Free slots: {len(slots) * n_specialities * per_speciality:,}")
+    print(f"{'Method':<26}{'seconds':>9}{'placed':>9}{'preferred':>11}")
+    for label, kwargs in (("greedy, one by one", {"greedy": True}),
+                          ("matching", {}),
+                          ("matching, 4 processes", {"workers": 4})):
+        start = _time.perf_counter()
+        plan = plan_waitlist(hs, referrals, **kwargs)
+        elapsed = _time.perf_counter() - start
+        preferred = sum(1 for number, (_, did, _, _) in plan.assignments.items()
+                        if did in referrals[number - 1][2])
+        print(f"{label:<26}{elapsed:>9.2f}{len(plan.assignments):>9,}"
+              f"{preferred:>11,}")
+    rows = plan.rows()
+    if len(set((did, date, time) for _, did, date, time in rows)) != len(rows):
+        raise AssertionError("a slot was assigned twice")
+    report = hs.book_batch(rows)
+    if not report.applied:
+        raise AssertionError(f"plan could not be booked: {report.errors()[0]}")
 
-        # next-of-kin information
-        print("\n-- Next of Kin (NOK) Details --")
-        nok_fn = get_alpha("NOK First Name     : ")
-        nok_ln = get_alpha("NOK Last Name      : ")
-        nok_address = input("NOK Address        : ").strip()
-        nok_relation = input("NOK Relation       : ").strip()
-        nok_phone = get_phone("NOK Telephone No.  : ")
-        
-        # generate unique patient ID
-        pid = self._generate_id("P")
-        # create Patient instance with all collected data
-        patient = Patient(
-            fn, mn, ln,              # name parts
-            dob_str, age, gender,    # DOB, age, gender
-            address, telephone,      # contact info
-            pob, occupation, employer,# additional patient info
-            father_fn, father_ln,    # father's name
-            mother_fn, mother_ln,    # mother's name
-            ward, union_status, religion,                  # social info
-            nok_fn, nok_ln, nok_address, nok_relation,    # next-of-kin name & details
-            nok_phone, pid           # NOK phone and patient ID
-        )
-        # store patient in system dictionary
-        self.patients[pid] = patient
-        # confirm registration to user
-        print(f"\nPatient registered. Patient ID: {pid}\n")
-        
-    def add_doctor(self) -> None:
-        # begin the doctor registration process
-        print("\n-- Register New Doctor --")  
 
-        # prompt for the doctor's first name
-        fn = input("First Name       : ").strip()  
-        # prompt for the doctor's last name
-        ln = input("Last Name        : ").strip()  
-        # prompt for the doctor's gender
-        gender = input("Gender           : ").strip()  
-        # prompt for the doctor's specialty
-        speciality = input("Speciality       : ").strip()  
+def bench_rules(size: int) -> None:
+    # size doctors working Mon-Fri 09:00-17:00 in 15-minute slots for a
+    # year: explicit SlotIndex tuples against one AvailabilityRule each
+    first = datetime.date(2025, 1, 6)
+    rule = f"Mon-Fri 09:00-17:00 every 15 from {first} until 2025-12-31"
+    slots = list(AvailabilityRule.parse(rule).between())
+    labels = [format_slot(dt) for dt in slots]
+    rng = random.Random(16)
+    probes = [format_slot(rng.choice(slots) + datetime.timedelta(
+        minutes=rng.choice((0, 0, 0, 5)))) for _ in range(20_000)]
+    afters = [rng.choice(slots) for _ in range(1_000)]
+    print(f"Doctors: {size:,}  Slots per doctor: {len(slots):,}")
+    print(f"{'Schedule':<10}{'build s':>9}{'MB':>8}{'lookup s':>10}"
+          f"{'book s':>9}{'next s':>9}{'4 weeks s':>11}")
+    for name, schedule in (("explicit", lambda: labels),
+                           ("rule", lambda: {"rules": [rule]})):
+        hs = HospitalSystem()
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        start = _time.perf_counter()
+        doctors = [hs.doctors[hs.register_doctor(f"Doc{d}", "Bench", "M",
+                                                 "General", schedule())]
+                   for d in range(size)]
+        build = _time.perf_counter() - start
+        used = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        lookup = _timed(lambda: [doctors[i % size].is_available(*slot)
+                                 for i, slot in enumerate(probes)])
 
-        # inform user how to enter available schedule slots
-        print("Enter available slots (YYYY-MM-DD HH:MM). Type 'done' to finish.")
-        # initialize empty list to hold (date, time) tuples
-        schedule = []  
-        # loop until the user types 'done'
-        while True:  
-            # read a slot entry from the user
-            slot = input("Slot              : ").strip()  
-            # if the user indicates completion, exit loop
-            if slot.lower() == "done":  
-                break  
-            try:
-                # split the input into date and time components
-                date, time = slot.split()  
-                # append the tuple to the schedule list
-                schedule.append((date, time))  
-            except ValueError:
-                # notify user if the input is not in the correct format
-                print("Format error; use 'YYYY-MM-DD HH:MM'.")  
+        def book_cancel():
+            # take and give back 5k slots through the Doctor API
+            for i, slot in enumerate(probes[:5_000]):
+                doctor = doctors[i % size]
+                if doctor.is_available(*slot):
+                    doctor.book_slot(*slot)
+                    doctor.cancel_slot(*slot)
 
-        # generate a new unique doctor ID
-        did = self._generate_id("D")  
-        # instantiate a Doctor object with collected information
-        doctor = Doctor(fn, ln, gender, did, speciality, schedule)  
-        # add the new doctor to the system's dictionary
-        self.doctors[did] = doctor  
-        # confirm successful registration and display the new ID
-        print(f"\nDoctor registered. Doctor ID: {did}\n")
+        book = _timed(book_cancel)
+        nxt = _timed(lambda: [hs.next_available("General", 10, after)
+                              for after in afters])
+        weeks = _timed(lambda: [list(doctor.upcoming(28))
+                                for doctor in doctors])
+        print(f"{name:<10}{build:>9.2f}{used / 2**20:>8.1f}{lookup:>10.3f}"
+              f"{book:>9.3f}{nxt:>9.3f}{weeks:>11.3f}")
+        del hs, doctors
 
-    def book_appointment(self, patient_id: str,
-                         doctor_id: str, date: str, time: str) -> None:
-        # Attempt to book and confirm an appointment given IDs and slot
 
-        # Check that the patient ID exists in the system
-        if patient_id not in self.patients:
-            print("Error: Patient ID not found.\n")  # notify missing patient
-            return  # abort booking
+def bench_billing(size: int) -> None:
+    # invoice size appointments (one by one, then the rest as a batch) and
+    # answer revenue reports from the ledger vs re-scanning every invoice
+    hs = HospitalSystem()
+    with _gc_paused():
+        _populate(hs, size)
+        hs.set_fee("X-Ray", 5000)
+        hs.set_fee("Dressing", 800)
+        rng = random.Random(17)
+        single = list(hs.appointments)[:size // 10]
+        start = _time.perf_counter()
+        for aid in single:
+            hs.invoice(aid, rng.sample(["X-Ray", "Dressing"],
+                                       rng.randrange(3)),
+                       issued="2025-02-01")
+        one_by_one = _time.perf_counter() - start
+        start = _time.perf_counter()
+        batch = hs.invoice_range(issued="2025-02-01")
+        batched = _time.perf_counter() - start
+        days = sorted(hs.ledger.revenue("day"))
+        queries = []
+        for _ in range(100):
+            lo, hi = sorted(rng.sample(days, 2))
+            queries.append((rng.choice(RevenueLedger.DIMENSIONS), lo, hi))
 
-        # Check that the doctor ID exists in the system
-        if doctor_id not in self.doctors:
-            print("Error: Doctor ID not found.\n")  # notify missing doctor
-            return  # abort booking
+        def scan(by, date_from, date_to):
+            # what a report costs without the roll-ups
+            totals = collections.Counter()
+            for invoice in hs.invoices.values():
+                if date_from <= invoice.date <= date_to:
+                    if by == "service":
+                        for service, fee in invoice.items:
+                            totals[service] += fee
+                    else:
+                        totals[invoice.doctor_id if by == "doctor"
+                               else invoice.date] += invoice.total
+            return dict(totals)
 
-        # Retrieve Patient and Doctor objects by their IDs
-        patient = self.patients[patient_id]
-        doctor = self.doctors[doctor_id]
+        for query in queries[:10]:
+            if scan(*query) != hs.revenue(*query):
+                raise AssertionError(f"ledger disagrees with a scan for "
+                                     f"{query}")
+    print(f"Invoices: {len(hs.invoices):,}  Service days: {len(days)}")
+    print(f"{'Operation':<34}{'seconds':>9}{'per op (us)':>13}")
+    for label, seconds, count in (
+            ("invoice, one by one", one_by_one, len(single)),
+            ("invoice_range (one batch)", batched, len(batch)),
+            ("100 reports, re-scanning invoices",
+             _timed(lambda: [scan(*q) for q in queries]), len(queries)),
+            ("100 reports, revenue ledger",
+             _timed(lambda: [hs.revenue(*q) for q in queries]), len(queries))):
+        print(f"{label:<34}{seconds:>9.3f}{seconds / count * 1e6:>13.1f}")
 
-        # Verify the doctor is available at the requested date/time
-        if not doctor.is_available(date, time):
-            print("Error: Doctor not available at that slot.\n")  # slot taken or invalid
-            return  # abort booking
 
-        # Generate a unique appointment ID
-        aid = self._generate_id("A")
+def bench_report(size: int) -> None:
+    # a year at a large hospital: 150 doctors on weekday rules (about 1.4M
+    # slots), size appointments booked through the normal path
+    hs = HospitalSystem()
+    with _gc_paused(freeze=True):
+        n_doctors = 150
+        rule = "Mon-Fri 08:00-17:00 every 15 from 2025-01-01 until 2025-12-31"
+        slots = list(AvailabilityRule.parse(rule).between())
+        for i in range(max(n_doctors, size // 5)):
+            hs.register_patient(*_bench_patient_fields(i))
+        doctor_ids = [hs.register_doctor(f"Doc{d}", "Bench", "F",
+                                         f"Spec{d % 12}", {"rules": [rule]})
+                      for d in range(n_doctors)]
+        rng = random.Random(18)
+        picks = rng.sample(range(n_doctors * len(slots)),
+                           min(size, n_doctors * len(slots)))
+        now = datetime.datetime(2024, 12, 1)
+        for n, pick in enumerate(picks):
+            doctor, slot = divmod(pick, len(slots))
+            dt = slots[slot]
+            # bookings are made 0-60 days ahead
+            hs.clock = lambda: dt - datetime.timedelta(
+                minutes=rng.randrange(86400))
+            # patients at the same time differ (doctor < len(patients))
+            patient = (slot * n_doctors + doctor) % len(hs.patients)
+            appt = hs.make_booking(f"P{patient + 1:03}",
+                                   doctor_ids[doctor], *format_slot(dt))
+            if n % 7 == 0:
+                hs.cancel_booking(appt.appointment_id)
+    print(f"Appointments: {len(hs.appointments):,}  Doctors: {n_doctors}  "
+          f"Slots: {n_doctors * len(slots):,}")
+    print(f"{'Report':<34}{'seconds':>9}")
+    rows = [("first run (builds the columns)",
+             _timed(hs.operations_report, "2025-01-01", "2025-12-31")),
+            ("year", _timed(hs.operations_report, "2025-01-01", "2025-12-31")),
+            ("one month", _timed(hs.operations_report, "2025-06-01",
+                                 "2025-06-30"))]
+    global numpy
+    saved, numpy = numpy, None
+    try:
+        rows.append(("year, without NumPy",
+                     _timed(hs.operations_report, "2025-01-01", "2025-12-31")))
+    finally:
+        numpy = saved
+    for label, seconds in rows:
+        print(f"{label:<34}{seconds:>9.3f}")
 
-        # Create the Appointment object and mark it confirmed
-        appt = Appointment(aid, patient, doctor, date, time)
-        appt.confirm()  # set status to "Confirmed"
 
-        # Store the appointment in the system registry
-        self.appointments[aid] = appt
+# registry of benchmark name -> (function, default size)
+def bench_metrics(size: int) -> None:
+    # cost of instrumentation: size bookings (plus a tenth as many
+    # rejected double bookings) with it off, with metrics, and with
+    # make_booking also profiled
+    print(f"Bookings: {size:,} (+{size // 10:,} rejected)")
+    print(f"{'Mode':<22}{'seconds':>10}{'us/op':>9}{'overhead':>10}")
+    baseline = None
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in ("off", "metrics", "metrics + profile"):
+            hs = HospitalSystem()
+            metrics = OperationMetrics() if mode != "off" else None
+            profiler = (OperationProfiler("make_booking",
+                                          os.path.join(directory, "profile"))
+                        if mode == "metrics + profile" else None)
+            if metrics is not None:
+                instrument(hs, metrics, profiler)
+            seconds = _populate(hs, size)
+            start = _time.perf_counter()
+            for i in range(1, size // 10 + 1):
+                appt = hs.appointments[f"A{i:03}"]
+                try:
+                    hs.make_booking(appt.patient.patient_id,
+                                    appt.doctor.doctor_id, appt.date, appt.time)
+                except BookingError:
+                    pass
+            seconds += _time.perf_counter() - start
+            if profiler is not None:
+                profiler.write()
+            baseline = baseline or seconds
+            per_op = seconds / (size + size // 10) * 1e6
+            print(f"{mode:<22}{seconds:>10.3f}{per_op:>9.2f}"
+                  f"{(seconds / baseline - 1) * 100:>9.1f}%")
+            if mode == "metrics":
+                stats = metrics.snapshot()["operations"]["make_booking"]
+    print(f"make_booking: {stats['calls']:,} calls, {stats['errors']:,} errors "
+          f"{stats['error_reasons']}, p95 <= {stats['p95_le']} s")
 
-        # Link this appointment to the patient's record
-        patient.appointment_list.append(appt)
 
-        # Remove the booked slot from the doctor's schedule
-        doctor.book_slot(date, time)
+def bench_refill(size: int) -> None:
+    # cancellation churn against a waiting list of size patients: per-
+    # cancel latency with and without refilling, every refill checked
+    # against a brute-force search for the best eligible entry (whose
+    # patient is free at that time)
+    n_doctors, per_doctor = 50, 400
+    base = datetime.datetime(2030, 1, 7, 8, 0)
+    slot_times = [format_slot(base + datetime.timedelta(minutes=15 * k))
+                  for k in range(per_doctor)]
+    cancels = min(20_000, n_doctors * per_doctor)
+    rng = random.Random(7)
+    print(f"Waiting: {size:,}  cancels: {cancels:,}  "
+          f"({n_doctors} doctors x {per_doctor} booked slots)")
+    print(f"{'Mode':<16}{'seconds':>9}{'p50 us':>9}{'p99 us':>9}"
+          f"{'max us':>9}{'refilled':>10}")
+    order = rng.sample(range(n_doctors * per_doctor), cancels)
+    results = {}
+    for mode in ("no waitlist", "waitlist"):
+        hs = HospitalSystem()
+        # P001-P1000 hold the booked slots, P1001-P2000 wait
+        for i in range(2_000):
+            hs.register_patient(*_bench_patient_fields(i))
+        doctor_ids = [hs.register_doctor(f"Doc{d}", "Bench", "M",
+                                         f"Spec{d % 5}", slot_times)
+                      for d in range(n_doctors)]
+        for k, (date, time) in enumerate(slot_times):
+            for d, did in enumerate(doctor_ids):
+                hs.make_booking(f"P{(k + d) % 1_000 + 1:03}", did, date, time)
+        if mode == "waitlist":
+            pick = random.Random(8)
+            for i in range(size):
+                did = pick.choice(doctor_ids)
+                earliest = (slot_times[pick.randrange(per_doctor)][0]
+                            if pick.random() < 0.2 else None)
+                # half wait for a doctor, half for any doctor of a speciality
+                own = pick.random() < 0.5
+                hs.join_waitlist(f"P{i % 1_000 + 1_001}", did if own else None,
+                                 None if own else hs.doctors[did].speciality,
+                                 pick.randint(1, 5), earliest, None,
+                                 joined=pick.randrange(10 ** 6))
+        latencies = []
+        for n in order:
+            aid = f"A{n + 1:03}"
+            start = _time.perf_counter()
+            hs.cancel_booking(aid)
+            latencies.append(_time.perf_counter() - start)
+        results[mode] = hs
+        latencies.sort()
+        refilled = len(hs.waitlist.filled)
+        print(f"{mode:<16}{sum(latencies):>9.3f}"
+              f"{latencies[len(latencies) // 2] * 1e6:>9.1f}"
+              f"{latencies[int(len(latencies) * 0.99)] * 1e6:>9.1f}"
+              f"{latencies[-1] * 1e6:>9.1f}{refilled:>10,}")
+    # check: no slot holds two confirmed appointments, and each refill
+    # took the best entry still waiting at that moment (replayed in order)
+    hs = results["waitlist"]
+    seen = set()
+    for appt in hs.appointments.values():
+        if appt.status == "Confirmed":
+            slot = (appt.doctor.doctor_id, appt.at)
+            assert slot not in seen, f"double booking {slot}"
+            seen.add(slot)
+    # every entry of each queue in priority order, for a linear search
+    queues = collections.defaultdict(list)
+    for entry in hs.waitlist.entries.values():
+        queues[WaitingList.scope(entry.doctor_id, entry.speciality)].append(entry)
+    for queue in queues.values():
+        queue.sort(key=WaitlistEntry.key)
+    taken = set()
+    busy = set()  # (patient_id, at) booked by refills so far
+    for n in order:
+        appt = hs.appointments[f"A{n + 1:03}"]
+        best = None
+        for scope in (("D", appt.doctor.doctor_id),
+                      WaitingList.scope(speciality=appt.doctor.speciality)):
+            for entry in queues[scope]:
+                if (entry.entry_id not in taken and entry.accepts(appt.date)
+                        and (entry.patient_id, appt.at) not in busy):
+                    if best is None or entry.key() < best.key():
+                        best = entry
+                    break
+        assert hs.waitlist.filled.get(appt.appointment_id) is best, \
+            f"wrong refill for {appt.appointment_id}"
+        if best is not None:
+            taken.add(best.entry_id)
+            busy.add((best.patient_id, appt.at))
+    print("check: no double bookings; every refill went to the best "
+          "eligible entry")
 
-        # Inform the user that booking succeeded
-        print(f"Appointment confirmed. ID: {aid}\n")
 
-    def cancel_appointment(self, appointment_id: str) -> None:
-        # Cancel an appointment and restore the doctor's slot.
-        """Cancel an appointment and restore doctor's slot."""
-        
-        # If the appointment ID is not registered, show error and exit.
-        if appointment_id not in self.appointments:
-            print("Error: Appointment ID not found.\n"); return
-        
-        # Retrieve the Appointment object from the system.
-        appt = self.appointments[appointment_id]
-        
-        # If the appointment is already marked canceled, notify and exit.
-        if appt.status == "Canceled":
-            print("Error: Already canceled.\n"); return
-        
-        # Mark the appointment status as canceled.
-        appt.cancel()
-        
-        # Return the slot back to the doctor's availability.
-        appt.doctor.cancel_slot(appt.date, appt.time)
-        
-        # Inform the user that cancellation succeeded.
-        print(f"Appointment {appointment_id} canceled.\n")
+def bench_overlap(size: int) -> None:
+    # size bookings of mixed length (15 minutes to 2 hours) through
+    # make_booking, then overlap window queries per doctor and per
+    # patient: the interval indexes against scanning each one's
+    # confirmed appointments
+    hs = HospitalSystem()
+    with _gc_paused(freeze=True):
+        rule = "Mon-Fri 08:00-17:00 every 15 from 2025-01-06 until 2025-12-31"
+        slots = list(AvailabilityRule.parse(rule).between())
+        n_doctors = max(1, size // 1_000)
+        n_patients = max(1, size // 20)
+        for i in range(n_patients):
+            hs.register_patient(*_bench_patient_fields(i))
+        doctor_ids = [hs.register_doctor(f"Doc{d}", "Bench", "M",
+                                         f"Spec{d % 10}", {"rules": [rule]})
+                      for d in range(n_doctors)]
+        rng = random.Random(22)
+        durations = (15, 15, 15, 30, 30, 45, 60, 90, 120)
+        rejected = 0
+        start = _time.perf_counter()
+        for _ in range(size):
+            try:
+                hs.make_booking(f"P{rng.randrange(n_patients) + 1:03}",
+                                rng.choice(doctor_ids),
+                                *format_slot(rng.choice(slots)),
+                                rng.choice(durations))
+            except BookingError:
+                rejected += 1
+        booking = _time.perf_counter() - start
+    print(f"Bookings: {size:,} tried, {rejected:,} rejected (overlap or "
+          f"slot taken), {booking / size * 1e6:.1f} us/booking")
+    # the scan baseline: every confirmed appointment per doctor / patient
+    lists = {}
+    for appt in hs.appointments.values():
+        if appt.status == "Confirmed":
+            lists.setdefault(appt.doctor.doctor_id, []).append(appt)
+            lists.setdefault(appt.patient.patient_id, []).append(appt)
+    queries = []
+    for n in range(2_000):
+        key = (rng.choice(doctor_ids) if n % 2
+               else f"P{rng.randrange(n_patients) + 1:03}")
+        lo = _minutes(rng.choice(slots))
+        queries.append((key, lo, lo + rng.choice((15, 60, 240, 1440))))
 
-    def view_appointments(self) -> None:
-        # List all appointments with status.
-        if not self.appointments:
-            # If no appointments are in the system, inform the user and exit.
-            print("\nNo appointments scheduled.\n"); return
+    def indexed():
+        return [hs.overlapping(lo, hi, *((key, None) if key[0] == "D"
+                                         else (None, key)))
+                for key, lo, hi in queries]
 
-        # Print a header for the appointments list.
-        print("\n--- All Appointments ---")
+    def scan():
+        return [sorted((a for a in lists.get(key, ())
+                        if a.at < hi and a.end > lo), key=lambda a: a.at)
+                for key, lo, hi in queries]
 
-        # Loop through each Appointment object stored in the system.
-        for appt in self.appointments.values():
-            # Display appointment details: ID, patient name, doctor name,
-            # date, time, and current status.
-            print(f"{appt.appointment_id}: Patient {appt.patient.first_name} "
-                  f"{appt.patient.last_name} | Doctor {appt.doctor.first_name} "
-                  f"{appt.doctor.last_name} | {appt.date} {appt.time} "
-                  f"| {appt.status}")
+    print(f"{'Window queries':<28}{'seconds':>9}{'us/query':>10}")
+    results = {}
+    for label, fn in (("scan appointments", scan), ("interval index", indexed)):
+        start = _time.perf_counter()
+        results[label] = fn()
+        seconds = _time.perf_counter() - start
+        print(f"{label:<28}{seconds:>9.3f}"
+              f"{seconds / len(queries) * 1e6:>10.1f}")
+    if ([[a.appointment_id for a in found]
+         for found in results["scan appointments"]]
+            != [[a.appointment_id for a in found]
+                for found in results["interval index"]]):
+        raise AssertionError("index and scan disagree")
+    found = sum(len(r) for r in results["interval index"])
+    print(f"check: both found the same {found:,} appointments")
 
-        # Print a blank line to separate from subsequent output.
-        print()
 
-    def generate_bill(self, appointment_id: str) -> None:
-        
-        #Print formatted receipt for confirmed appointment:
-           #Hospital header
-           #Consultation fee + additional services
-           #Dynamic column widths + thousands separators
-        
-        if appointment_id not in self.appointments:
-            print("Error: Appointment ID not found.\n"); return
-        appt = self.appointments[appointment_id]
-        if appt.status != "Confirmed":
-            print("Error: Only confirmed appointments can be billed.\n"); return
+def bench_archive(size: int) -> None:
+    # a synthetic hospital with size bookings, built twice: one copy keeps
+    # everything in memory, the other archives the oldest ~90% of its
+    # appointments. Reports the memory released and the cost of reading
+    # archived appointments back (lookups, patient histories, one day's
+    # listing) against the same reads on the in-memory copy
+    workload = SyntheticWorkload(size, seed=23)
+    cutoff = workload.first + (workload.last - workload.first) * 9 // 10
+    # both copies stamp their bookings with the same time
+    now = datetime.datetime.now().replace(second=0, microsecond=0)
+    memory = HospitalSystem()
+    memory.clock = lambda: now
+    workload.populate(memory)
+    rng = random.Random(23)
+    ids = rng.sample(list(memory.appointments),
+                     min(2_000, len(memory.appointments)))
+    pids = rng.sample(list(memory.patients), min(500, len(memory.patients)))
+    days = [(workload.first + datetime.timedelta(days=d)).isoformat()
+            for d in rng.choices(range((cutoff - workload.first).days), k=50)]
+    reads = (
+        ("lookup by ID", ids,
+         lambda hs, aid: hs.find_appointment(aid).record()),
+        ("patient history", pids,
+         lambda hs, pid: [appt.record() for appt in hs.patient_history(pid)]),
+        ("one day's appointments", days,
+         lambda hs, day: [appt.appointment_id for appt in
+                          hs.query_appointments(date_from=day, date_to=day)]))
+    with tempfile.TemporaryDirectory() as directory:
+        hs = HospitalSystem()
+        hs.clock = memory.clock
+        hs.archive = AppointmentArchive(os.path.join(directory, "traced"))
+        # the copy that is archived is traced for its memory use (tracing
+        # slows every allocation, so the archive run is timed separately)
+        tracemalloc.start()
+        workload.populate(hs)
+        gc.collect()
+        loaded = tracemalloc.get_traced_memory()[0]
+        moved = hs.archive_appointments(cutoff.isoformat())
+        gc.collect()
+        released = loaded - tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        gc.collect()
+        gc.freeze()
+        total = moved + len(hs.appointments)
+        print(f"Archived {moved:,} of {total:,} appointments (before "
+              f"{cutoff}); {released / 2 ** 20:.1f} MiB released "
+              f"({released / max(moved, 1):.0f} bytes/appointment)")
+        print(f"{'Reads':<28}{'in memory':>12}{'archived':>12}")
+        for label, keys, read in reads:
+            results, line = [], f"{label:<28}"
+            for system in (memory, hs):
+                # the first pass warms up (and gives the check its results)
+                results.append([read(system, key) for key in keys])
+                start = _time.perf_counter()
+                for key in keys:
+                    read(system, key)
+                seconds = _time.perf_counter() - start
+                line += f"{seconds / len(keys) * 1e6:>9.1f} us"
+            print(line)
+            if results[0] != results[1]:
+                raise AssertionError(f"{label}: archived reads differ")
+        hs.close()
+        # finally the archive run itself, untraced, on the in-memory copy
+        memory.archive = AppointmentArchive(os.path.join(directory, "timed"))
+        seconds = _timed(memory.archive_appointments, cutoff.isoformat())
+        memory.close()
+        gc.unfreeze()
+    print(f"Archive run: {seconds:.2f}s ({seconds / max(moved, 1) * 1e6:.1f} "
+          f"us/appointment)")
+    print("check: archived reads match the in-memory ones")
 
-        items = [("Consultation Fee", CONSULTATION_FEE)]
-        while True:
-            svc = input("Enter extra service (blank to finish): ").strip()
-            if not svc:
-                break
-            fee = get_int(f"Fee for '{svc}' (JMD$): ")
-            items.append((svc, fee))
-
-        # Compute widths
-        hdr_svc = "Service"; hdr_amt = "Amount (JMD$)"
-        max_s = max(len(hdr_svc), *(len(s) for s, _ in items))
-        max_a = max(len(hdr_amt), *(len(f"{f:,}") for _, f in items))
-        total = sum(f for _, f in items)
-        width = max_s + max_a + 5
-
-        # Print header
-        name = "Blake Memorial Hospital"
-        print("\n" + "=" * width)
-        print(name.center(width))
-        print("OFFICIAL RECEIPT".center(width))
-        print("=" * width + "\n")
-
-        # Details
-        print(f"Appointment ID : {appointment_id}")
-        print(f"Date/Time      : {appt.date}   {appt.time}")
-        print(f"Patient        : {appt.patient.first_name} {appt.patient.last_name} ({appt.patient.patient_id})")
-        print(f"Doctor         : Dr. {appt.doctor.first_name} {appt.doctor.last_name} ({appt.doctor.doctor_id})")
-        print("-" * width)
-
-        # Table
-        print(f"{hdr_svc:<{max_s}}   {hdr_amt:>{max_a}}")
-        print("-" * width)
-        for s, f in items:
-            print(f"{s:<{max_s}}   {f:>{max_a},}")
-        print("-" * width)
-        print(f"{'TOTAL':<{max_s}}   {total:>{max_a},}")
-        print("=" * width + "\n")
+
+def bench_snapshot(size: int) -> None:
+    # a thread-safe system with size bookings and one writer thread that
+    # books and cancels non-stop. The operations report runs twice: under
+    # the shared lock (the writer waits until it is done) and on a
+    # ReadSnapshot taken at the same moment (the writer carries on); both
+    # must print the same report. Also times taking a snapshot against
+    # copying the appointments, and counts what the snapshot had to keep
+    workload = SyntheticWorkload(size, seed=24)
+    hs = ThreadSafeHospitalSystem()
+    workload.populate(hs)
+    date_from, date_to = workload.first.isoformat(), workload.last.isoformat()
+    gc.collect()
+    gc.freeze()
+    start = _time.perf_counter()
+    with hs.lock:
+        copies = [appt.copy() for appt in hs.appointments.values()]
+    copy_seconds = _time.perf_counter() - start
+    del copies
+    start = _time.perf_counter()
+    for _ in range(1_000):
+        hs.read_snapshot().close()
+    take_seconds = (_time.perf_counter() - start) / 1_000
+    print(f"Appointments: {len(hs.appointments):,}; copying them all: "
+          f"{copy_seconds * 1e3:.1f} ms, taking a snapshot: "
+          f"{take_seconds * 1e6:.1f} us")
+
+    done = threading.Event()
+    ops = [0]
+    failures = []
+
+    def writer() -> None:
+        rng = random.Random(24)
+        doctors = list(hs.doctors.values())
+        patients = list(hs.patients)
+        first = datetime.datetime.combine(workload.first, datetime.time())
+        hours = (workload.last - workload.first).days * 24
+        try:
+            while not done.is_set():
+                try:
+                    if rng.random() < 0.5:
+                        doctor = rng.choice(doctors)
+                        slot = doctor.schedule.first_after(
+                            first + datetime.timedelta(
+                                hours=rng.randrange(hours)))
+                        if slot is not None:
+                            hs.make_booking(rng.choice(patients),
+                                            doctor.doctor_id,
+                                            *format_slot(slot))
+                    else:
+                        hs.cancel_booking(
+                            f"A{rng.randrange(1, hs._acounter + 1):03}")
+                except BookingError:
+                    pass
+                ops[0] += 1
+        except BaseException as err:
+            failures.append(err)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        _time.sleep(0.2)
+        print(f"{'Report':<24}{'seconds':>9}{'writer ops meanwhile':>22}")
+        with hs.lock:
+            before, start = ops[0], _time.perf_counter()
+            locked = hs.operations_report(date_from, date_to).render()
+            seconds, count = _time.perf_counter() - start, ops[0] - before
+            snapshot = hs.read_snapshot()
+        print(f"{'under the lock':<24}{seconds:>9.3f}{count:>22,}")
+        before, start = ops[0], _time.perf_counter()
+        consistent = snapshot.operations_report(date_from, date_to).render()
+        seconds, count = _time.perf_counter() - start, ops[0] - before
+        print(f"{'on a snapshot':<24}{seconds:>9.3f}{count:>22,}")
+    finally:
+        done.set()
+        thread.join()
+        gc.unfreeze()
+    if failures:
+        raise failures[0]
+    kept = len(snapshot._kept)
+    slots = sum(len(kept_slots) for kept_slots in snapshot._slots.values())
+    snapshot.close()
+    print(f"Kept by the snapshot: {kept:,} appointments and {slots:,} slot "
+          f"states (of {snapshot._appointments:,} appointments)")
+    if consistent != locked:
+        raise AssertionError("the snapshot report differs from the locked one")
+    print("check: the snapshot report matches the one taken under the lock")
+
+
+def bench_export(size: int) -> None:
+    # a synthetic hospital with size bookings (the first half of its days
+    # invoiced) exported in every format: rows/sec and bytes/row per kind,
+    # against just reading the rows. The columnar file is read back and
+    # compared with the rows; the peak memory of a traced export shows
+    # it does not grow with the data; and an incremental export after
+    # some cancellations and bookings must write exactly those
+    workload = SyntheticWorkload(size, seed=25)
+    hs = HospitalSystem()
+    seconds = _timed(workload.populate, hs)
+    middle = workload.first + (workload.last - workload.first) / 2
+    hs.invoice_range(None, middle.isoformat())
+    gc.collect()
+    gc.freeze()
+    print(f"Built {len(hs.appointments):,} appointments, "
+          f"{len(hs.patients):,} patients and {len(hs.invoices):,} invoices "
+          f"in {seconds:.1f}s")
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{'Export':<26}{'rows/sec':>12}{'bytes/row':>11}")
+        for kind in EXPORT_COLUMNS:
+            start = _time.perf_counter()
+            count = sum(1 for _ in hs.export_rows(kind))
+            rate = count / (_time.perf_counter() - start)
+            print(f"{kind + ' (rows only)':<26}{rate:>12,.0f}{'':>11}")
+            for fmt in EXPORT_FORMATS:
+                path = os.path.join(directory, f"{kind}.{fmt}")
+                report = export_records(hs, kind, path, fmt)
+                print(f"{kind + ' ' + fmt:<26}"
+                      f"{report.rows / report.seconds:>12,.0f}"
+                      f"{report.bytes / report.rows:>11.1f}")
+        # read back: the same rows, in the same order
+        start = _time.perf_counter()
+        columnar = read_columnar(os.path.join(directory,
+                                              "appointments.columnar"))
+        if next(columnar) != EXPORT_COLUMNS["appointments"]:
+            raise AssertionError("columnar header differs")
+        count = 0
+        for got, want in itertools.zip_longest(
+                columnar, hs.export_rows("appointments")):
+            if got != want:
+                raise AssertionError(f"columnar row differs: {got} != {want}")
+            count += 1
+        seconds = _time.perf_counter() - start
+        print(f"Columnar read-back and compare: {count / seconds:,.0f} rows/sec")
+        # constant memory: the traced peak of a CSV and a columnar export
+        for fmt in ("csv", "columnar"):
+            tracemalloc.start()
+            export_records(hs, "appointments",
+                           os.path.join(directory, "traced"), fmt)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"Peak memory exporting {count:,} appointments as {fmt}: "
+                  f"{peak / 2 ** 20:.1f} MiB")
+        # incremental: everything once, then only what changed
+        state = os.path.join(directory, "state.json")
+        path = os.path.join(directory, "changed.jsonl")
+        export_records(hs, "appointments", path, since=state)
+        rng = random.Random(25)
+        changed = set()
+        for aid in rng.sample(list(hs.appointments), max(1, size // 100)):
+            if hs.appointments[aid].status != "Canceled":
+                hs.cancel_booking(aid)
+                changed.add(aid)
+        first = datetime.datetime.combine(middle, datetime.time())
+        for doctor in list(hs.doctors.values())[:50]:
+            slot = doctor.schedule.first_after(first)
+            if slot is None:
+                continue
+            patient = rng.choice(list(itertools.islice(hs.patients, 100)))
+            try:
+                changed.add(hs.make_booking(patient, doctor.doctor_id,
+                                            *format_slot(slot)).appointment_id)
+            except BookingError:
+                # the patient is busy then (small workloads)
+                pass
+        report = export_records(hs, "appointments", path, since=state)
+        with open(path, encoding="utf-8") as f:
+            written = {json.loads(line)["appointment_id"] for line in f}
+        print(f"Incremental export after {len(changed):,} changes: "
+              f"{report.rows:,} rows in {report.seconds:.2f}s "
+              f"(state file {os.path.getsize(state):,} bytes)")
+        if written != changed or report.rows != len(changed):
+            raise AssertionError("the incremental export differs from the "
+                                 "changes made")
+    gc.unfreeze()
+    print("check: columnar rows match the source; the incremental export "
+          "holds exactly the changes")
+
+
+BENCHMARKS = {
+    "slots": (bench_slots, 20_000),
+    "journal": (bench_journal, 200_000),
+    "storage": (bench_storage, 100_000),
+    "search": (bench_search, 200_000),
+    "appointments": (bench_appointments, 200_000),
+    "memory": (bench_memory, 200_000),
+    "columns": (bench_columns, 500_000),
+    "concurrency": (bench_concurrency, 100_000),
+    "server": (bench_server, 20_000),
+    "waitlist": (bench_waitlist, 10_000),
+    "rules": (bench_rules, 20),
+    "billing": (bench_billing, 200_000),
+    "report": (bench_report, 500_000),
+    "metrics": (bench_metrics, 200_000),
+    "refill": (bench_refill, 100_000),
+    "overlap": (bench_overlap, 200_000),
+    "archive": (bench_archive, 100_000),
+    "snapshot": (bench_snapshot, 100_000),
+    "export": (bench_export, 200_000),
+}
 
 
 # -----------------------------------------------------------------------------
-# Utility Validators
+# Benchmark Suite (scaling runs with a stored baseline)
 # -----------------------------------------------------------------------------
+# front-desk operations timed by the suite, in report order
+SUITE_OPERATIONS = ("book_appointment", "cancel_appointment",
+                    "view_appointments", "is_available", "view_schedule",
+                    "generate_bill")
+# a figure more than this fraction above its baseline is a regression
+SUITE_TOLERANCE = 0.25
+# timed passes per operation; the fastest is kept, which filters out
+# scheduler and cache noise
+SUITE_ROUNDS = 5
 
-def get_int(prompt: str) -> int:
-    # repeatedly prompt until user enters a valid integer
-    while True:
-        val = input(prompt).strip()
-        # read input and remove surrounding whitespace
-        if val.isdigit():
-            # if input contains only digits
-            return int(val)
-            # convert to integer and return
-        print("Invalid input; enter a number.")
-        # inform user and repeat on invalid input
 
+def _suite_calls(hs: HospitalSystem, workload: SyntheticWorkload,
+                 confirmed: list, samples: int) -> dict:
+    # argument lists for each timed operation, drawn before any timing
+    rng = workload._rng(4)
+    doctors = list(hs.doctors)
+    span = (workload.last - workload.first).days
+    base = datetime.datetime.combine(workload.first, datetime.time())
 
-def get_digits(prompt: str) -> str:
-    # repeatedly prompt until user enters digits only
-    while True:
-        val = input(prompt).strip()
-        # read input and trim whitespace
-        if val.isdigit():
-            # if all characters are digits
-            return val
-        print("Invalid input; only digits allowed.")
-        # reject any non-digit input
+    def some_day() -> datetime.datetime:
+        return base + datetime.timedelta(days=rng.randrange(span),
+                                         minutes=15 * rng.randrange(96))
 
+    # free slots to book: the first free slot after a random moment
+    free = {}
+    for _ in range(samples * 4):
+        did = rng.choice(doctors)
+        dt = hs.doctors[did].schedule.first_after(some_day())
+        if dt is not None:
+            free.setdefault((did, dt), None)
+        if len(free) == samples:
+            break
+    patients = list(itertools.islice(hs.patients, 1000))
+    book = [(rng.choice(patients), did, *format_slot(dt)) for did, dt in free]
+    # listings are a tenth as frequent as single-slot operations
+    listings = max(1, samples // 10)
+    week = []
+    for _ in range(listings):
+        day = some_day().date()
+        week.append({"doctor_id": rng.choice(doctors),
+                     "date_from": day.isoformat(),
+                     "date_to": (day + datetime.timedelta(days=6)).isoformat()})
+    return {
+        "book_appointment": book,
+        "is_available": [(rng.choice(doctors), *format_slot(some_day()))
+                         for _ in range(samples)],
+        "view_appointments": week,
+        "view_schedule": [rng.choice(doctors) for _ in range(listings)],
+        "generate_bill": rng.sample(confirmed, min(samples * SUITE_ROUNDS,
+                                                   len(confirmed))),
+    }
 
-def get_phone(prompt: str) -> str:
-    # prompt until user enters at least 10 digits for a phone number
-    while True:
-        tel = input(prompt).strip()
-        # read and strip whitespace
-        if tel.isdigit() and len(tel) >= 10:
-            # ensure numeric and minimum length
-            return tel
-        print("Invalid telephone number; must be at least 10 digits.")
-        # reject input not meeting criteria
 
+def bench_suite_size(size: int, seed: int = 1, samples: int = 1000,
+                     backend: str = "memory") -> dict:
+    # build a synthetic system of size bookings and time each front-desk
+    # operation; returns {"build_s", "memory_mb", "<operation>_us", ...}
+    # with the best per-call microseconds over SUITE_ROUNDS passes. The
+    # build runs under tracemalloc (its time includes the tracing cost).
+    # Console output goes to a null device and generate_bill gets blank
+    # answers to its extra-service prompt
+    workload = SyntheticWorkload(size, seed,
+                                 rule_share=0.5 if backend == "memory" else 0.0)
+    hs = HospitalSystem() if backend == "memory" else SQLiteHospitalSystem(":memory:")
+    gc.collect()
+    tracemalloc.start()
+    start = _time.perf_counter()
+    with hs.bulk():
+        confirmed = workload.populate(hs)
+    build = _time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    calls = _suite_calls(hs, workload, confirmed, samples)
+    # move the built system out of the collector's view, so a full GC
+    # pass over millions of objects doesn't land inside one timing
+    gc.collect()
+    gc.freeze()
+    # each pass bills different appointments (a second bill is a reprint)
+    bills = calls["generate_bill"]
+    per_round = max(1, len(bills) // SUITE_ROUNDS)
 
-def get_alpha(prompt: str) -> str:
-    # prompt until user enters letters, spaces, or hyphens only
-    while True:
-        val = input(prompt).strip()
-        # trim whitespace
-        cleaned = val.replace(" ", "").replace("-", "")
-        # remove spaces and hyphens for validation
-        if cleaned.isalpha():
-            # ensure remaining characters are alphabetic
-            return val
-        print("Invalid input; please enter letters only.")
-        # reject any numeric or symbolic characters
+    def per_call(fn, args_list) -> float:
+        # seconds per call for one pass over args_list
+        start = _time.perf_counter()
+        for args in args_list:
+            fn(*args)
+        return (_time.perf_counter() - start) / len(args_list)
 
+    best = collections.defaultdict(lambda: float("inf"))
 
-def get_dob(prompt: str) -> datetime.date:
-    # prompt until user enters a date in YYYY-MM-DD format
-    while True:
-        val = input(prompt).strip()
-        # trim whitespace
+    def record(name, seconds):
+        best[name] = min(best[name], seconds)
+
+    saved_in = sys.stdin
+    with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+        sys.stdin = io.StringIO("\n" * len(bills))
         try:
-            dob = datetime.datetime.strptime(val, "%Y-%m-%d").date()
-            # parse string into date object
-            return dob
-        except ValueError:
-            # catch parsing errors
-            print("Invalid date format; please use YYYY-MM-DD.")
-            # inform user of correct format
+            for r in range(SUITE_ROUNDS):
+                book = calls["book_appointment"]
+                if book:
+                    first_new = len(hs.appointments) + 1
+                    record("book_appointment",
+                           per_call(hs.book_appointment, book))
+                    # cancel what was just booked, freeing the slots again
+                    record("cancel_appointment", per_call(
+                        hs.cancel_appointment,
+                        [(f"A{n:03}",) for n in
+                         range(first_new, first_new + len(book))]))
+                record("view_appointments", per_call(
+                    lambda f: hs.view_appointments(interactive=False, **f),
+                    [(f,) for f in calls["view_appointments"]]))
+                record("is_available", per_call(
+                    lambda did, date, time:
+                        hs.doctors[did].is_available(date, time),
+                    calls["is_available"]))
+                record("view_schedule", per_call(
+                    lambda did: hs.doctors[did].view_schedule(
+                        interactive=False),
+                    [(did,) for did in calls["view_schedule"]]))
+                chunk = bills[r * per_round:(r + 1) * per_round]
+                if chunk:
+                    record("generate_bill",
+                           per_call(hs.generate_bill, [(aid,) for aid in chunk]))
+        finally:
+            sys.stdin = saved_in
+            gc.unfreeze()
+    hs.close()
+    result = {"build_s": round(build, 4),
+              "memory_mb": round(memory / 2 ** 20, 2)}
+    for name in SUITE_OPERATIONS:
+        if name in best:
+            result[f"{name}_us"] = round(best[name] * 1e6, 2)
+    return result
 
 
-def compute_age(dob: datetime.date) -> int:
-    # calculate age in full years from date of birth
-    today = datetime.date.today()
-    # get today's date
-    years = today.year - dob.year
-    # initial year difference
-    if (today.month, today.day) < (dob.month, dob.day):
-        # subtract one if birthday hasn't occurred yet this year
-        years -= 1
-    return years
-    # return computed age
+def find_regressions(results: dict, baseline: dict,
+                     tolerance: float = SUITE_TOLERANCE) -> list:
+    # (size, metric, baseline, now) for every figure more than tolerance
+    # above the baseline; sizes or metrics missing from either side are
+    # skipped. Timings only compare on the machine that recorded them
+    found = []
+    for size, figures in results.get("sizes", {}).items():
+        reference = baseline.get("sizes", {}).get(size, {})
+        for metric, value in figures.items():
+            old = reference.get(metric)
+            if old and value > old * (1 + tolerance):
+                found.append((size, metric, old, value))
+    return found
+
+
+def run_bench_suite(sizes, seed: int = 1, samples: int = 1000,
+                    backend: str = "memory", baseline_path: str = None,
+                    save: bool = False,
+                    tolerance: float = SUITE_TOLERANCE) -> list:
+    # run the suite at each size, print a table, compare against (or
+    # save) the baseline file; returns the regressions found
+    results = {"seed": seed, "samples": samples, "backend": backend,
+               "sizes": {}}
+    metrics = ["build_s", "memory_mb"] + [f"{op}_us" for op in SUITE_OPERATIONS]
+    print(f"{'Metric':<24}" + "".join(f"{size:>14,}" for size in sizes))
+    for size in sizes:
+        results["sizes"][str(size)] = bench_suite_size(size, seed, samples,
+                                                       backend)
+    for metric in metrics:
+        print(f"{metric:<24}" + "".join(
+            f"{results['sizes'][str(size)].get(metric, float('nan')):>14,.2f}"
+            for size in sizes))
+    regressions = []
+    if baseline_path and not save and os.path.exists(baseline_path):
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if (baseline.get("seed"), baseline.get("backend")) != (seed, backend):
+            print(f"Note: baseline was recorded with seed "
+                  f"{baseline.get('seed')} on {baseline.get('backend')}.")
+        regressions = find_regressions(results, baseline, tolerance)
+        for size, metric, old, new in regressions:
+            print(f"REGRESSION size {int(size):,}: {metric} {old:,.2f} -> "
+                  f"{new:,.2f} (+{(new / old - 1) * 100:.0f}%)")
+        if not regressions:
+            print(f"No regressions against {baseline_path} "
+                  f"(tolerance {tolerance:.0%}).")
+    elif baseline_path:
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {baseline_path}.")
+    return regressions
 
 
 # -----------------------------------------------------------------------------
@@ -630,7 +8314,8 @@ def patient_menu() -> None:
     print("\n-- Patient Management --")
     print("1) Register New Patient")
     print("2) View Patient Profile")
-    print("3) Back")
+    print("3) Search Patients")
+    print("4) Back")
 
 
 def doctor_menu() -> None:
@@ -647,19 +8332,390 @@ def appointment_menu() -> None:
     print("1) Book Appointment")
     print("2) View All Appointments")
     print("3) Cancel Appointment")
-    print("4) Back")
+    print("4) Find Next Available Slot")
+    print("5) Operations Report")
+    print("6) Waiting List")
+    print("7) Back")
 
 
 def billing_menu() -> None:
     # Display billing menu and prompt for choice
     print("\n-- Billing --")
     print("1) Generate Bill")
-    print("2) Back")
+    print("2) Invoice Date Range")
+    print("3) Revenue Report")
+    print("4) Fee Catalogue")
+    print("5) Back")
 
 
-def main() -> None:
+def build_parser() -> argparse.ArgumentParser:
+    # command-line options; with no command the interactive menu starts
+    parser = argparse.ArgumentParser(
+        description="Blake Memorial Hospital management system")
+    parser.add_argument("--backend", choices=("memory", "sqlite"),
+                        default="memory",
+                        help="storage engine (default: in-memory dicts)")
+    parser.add_argument("--db",
+                        help="SQLite database file for --backend sqlite "
+                             "(default: hms.sqlite3 in --data-dir or here)")
+    parser.add_argument("--data-dir",
+                        help="persist data in this directory (journal + "
+                             "snapshots); default keeps data in memory only")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="count calls, errors and latencies of every "
+                             "operation and write them to FILE on exit "
+                             "(*.json = JSON snapshot, else Prometheus text)")
+    parser.add_argument("--profile", metavar="OPERATION",
+                        choices=METRIC_OPERATIONS,
+                        help="profile one operation (cProfile + tracemalloc)")
+    parser.add_argument("--profile-out", default="hms-profile",
+                        metavar="PREFIX",
+                        help="profile output files PREFIX.prof and PREFIX.txt")
+    commands = parser.add_subparsers(dest="command")
+    # snapshot (compaction) of a data directory
+    commands.add_parser("snapshot",
+                        help="write a snapshot and truncate the journal")
+    # move past appointments out of memory into the archive
+    arch = commands.add_parser(
+        "archive", help="archive appointments dated before a day, then "
+                        "snapshot")
+    arch.add_argument("--before", required=True, metavar="YYYY-MM-DD",
+                      help="archive appointments dated before this day")
+    # bulk import of patients/doctors
+    imp = commands.add_parser("import",
+                              help="bulk import patients or doctors from a file")
+    imp.add_argument("kind", choices=("patients", "doctors"))
+    imp.add_argument("file", help="CSV (with header) or JSONL file")
+    imp.add_argument("--format", choices=("csv", "jsonl"),
+                     help="file format (default: from the file extension)")
+    imp.add_argument("--errors", help="write rejected rows to this JSONL file")
+    # streaming export of appointments/patients/invoices
+    exp = commands.add_parser(
+        "export", help="export appointments, patients or invoices to a file")
+    exp.add_argument("kind", choices=tuple(EXPORT_COLUMNS))
+    exp.add_argument("file", help="output file (.csv, .jsonl or .hcol)")
+    exp.add_argument("--format", choices=EXPORT_FORMATS,
+                     help="file format (default: from the file extension)")
+    exp.add_argument("--from", dest="date_from", help="first date (YYYY-MM-DD)")
+    exp.add_argument("--to", dest="date_to", help="last date (YYYY-MM-DD)")
+    exp.add_argument("--doctor", dest="doctor_id", help="one doctor's rows")
+    exp.add_argument("--patient", dest="patient_id",
+                     help="one patient's appointments")
+    exp.add_argument("--status", help="appointments with this status")
+    exp.add_argument("--since", metavar="STATE",
+                     help="only rows changed since the last export with "
+                          "this state file (created on first use)")
+    # all-or-nothing batch booking
+    batch = commands.add_parser("book-batch",
+                                help="book a file of appointments all-or-nothing")
+    batch.add_argument("file", help="CSV/JSONL with patient_id, doctor_id, "
+                                    "date, time")
+    batch.add_argument("--format", choices=("csv", "jsonl"),
+                       help="file format (default: from the file extension)")
+    batch.add_argument("--report", help="write per-row outcomes to this JSONL file")
+    # operations report
+    report = commands.add_parser(
+        "report", help="utilisation, cancellations, lead times, busy hours")
+    report.add_argument("--from", dest="date_from",
+                        help="first date (default: first appointment)")
+    report.add_argument("--to", dest="date_to",
+                        help="last date (default: last appointment)")
+    report.add_argument("--csv", help="write the report to this CSV file")
+    report.add_argument("--top", type=int, default=5,
+                        help="busiest hours to list")
+    # batch invoicing
+    inv = commands.add_parser(
+        "invoice-batch",
+        help="invoice every confirmed, uninvoiced appointment in a date range")
+    inv.add_argument("--from", dest="date_from", help="first date (YYYY-MM-DD)")
+    inv.add_argument("--to", dest="date_to", help="last date (YYYY-MM-DD)")
+    inv.add_argument("--extra", action="append", default=[],
+                     help="catalogue service added to every invoice "
+                          "(repeatable)")
+    # scripted mode: JSON-lines commands in, JSON-lines replies out
+    run = commands.add_parser("exec",
+                              help="run JSON-lines commands from a file or stdin")
+    run.add_argument("file", nargs="?", help="command file (default: stdin)")
+    run.add_argument("--output", help="write replies here (default: stdout)")
+    run.add_argument("--flush", action="store_true",
+                     help="flush after every reply (for request/response drivers)")
+    # network service and its load generator
+    serve = commands.add_parser("serve",
+                                help="serve the exec protocol over TCP")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765,
+                       help="TCP port (0 = pick a free one)")
+    serve.add_argument("--max-clients", type=int, default=256,
+                       help="connections served at once (others wait)")
+    load = commands.add_parser("loadgen",
+                               help="load-test a running 'serve' process")
+    load.add_argument("--host", default="127.0.0.1")
+    load.add_argument("--port", type=int, default=8765)
+    load.add_argument("--clients", type=int, default=16,
+                      help="concurrent connections")
+    load.add_argument("--requests", type=int, default=20_000,
+                      help="total requests across all clients")
+    load.add_argument("--pipeline", type=int, default=8,
+                      help="commands each client sends before reading replies")
+    # waiting-list optimiser
+    waitlist = commands.add_parser(
+        "schedule-waitlist", help="place a file of referrals into free slots")
+    waitlist.add_argument("file", help="CSV/JSONL with patient_id, speciality, "
+                                       "doctors, earliest, latest")
+    waitlist.add_argument("--format", choices=("csv", "jsonl"),
+                          help="file format (default: from the file extension)")
+    waitlist.add_argument("--workers", type=int, default=1,
+                          help="solve specialities in this many processes")
+    waitlist.add_argument("--dry-run", action="store_true",
+                          help="plan only; book nothing")
+    waitlist.add_argument("--report",
+                          help="write per-referral outcomes to this JSONL file")
+    # benchmark runner
+    bench = commands.add_parser("bench", help="run a performance benchmark")
+    bench.add_argument("name", choices=sorted(BENCHMARKS))
+    bench.add_argument("--size", type=int, help="workload size")
+    suite = commands.add_parser(
+        "bench-suite",
+        help="time the front-desk operations at several sizes and compare "
+             "with a stored baseline")
+    suite.add_argument("--sizes", default="1000,10000,100000",
+                       help="comma-separated booking counts "
+                            "(e.g. 1000,10000,100000,1000000)")
+    suite.add_argument("--seed", type=int, default=1,
+                       help="synthetic workload seed")
+    suite.add_argument("--samples", type=int, default=1000,
+                       help="calls timed per operation")
+    suite.add_argument("--baseline",
+                       help="baseline JSON: compared against if it exists, "
+                            "written otherwise")
+    suite.add_argument("--save-baseline", action="store_true",
+                       help="overwrite the baseline with this run")
+    suite.add_argument("--tolerance", type=float, default=SUITE_TOLERANCE,
+                       help="allowed slowdown/growth before a figure is "
+                            "flagged (default 0.25 = 25%%)")
+    # synthetic data files
+    gen = commands.add_parser(
+        "generate", help="write a synthetic workload as import files")
+    gen.add_argument("directory", help="output directory")
+    gen.add_argument("--size", type=int, default=10_000,
+                     help="number of bookings")
+    gen.add_argument("--seed", type=int, default=1)
+    return parser
+
+
+def open_system(args, sync_every: int = 1) -> HospitalSystem:
+    # build the HospitalSystem selected by the command-line options;
+    # interactive use fsyncs every operation (sync_every=1)
+    if args.backend == "sqlite":
+        # the database provides its own durability; no journal needed
+        path = args.db or os.path.join(args.data_dir or ".", "hms.sqlite3")
+        hs = SQLiteHospitalSystem(path)
+    else:
+        hs = HospitalSystem()
+        if args.data_dir:
+            # restore from the snapshot/journal and keep journaling
+            Journal(args.data_dir, sync_every=sync_every).attach(hs)
+    # instrumentation is only installed when asked for
+    if args.metrics or args.profile:
+        instrument(hs, OperationMetrics() if args.metrics else None,
+                   (OperationProfiler(args.profile, args.profile_out)
+                    if args.profile else None),
+                   args.metrics)
+    return hs
+
+
+def main(argv=None) -> None:
+    # parse command-line arguments
+    args = build_parser().parse_args(argv)
+    if args.command == "bench":
+        # run the chosen benchmark and exit
+        fn, default_size = BENCHMARKS[args.name]
+        fn(args.size or default_size)
+        return
+
+    if args.command == "bench-suite":
+        try:
+            sizes = [int(size) for size in args.sizes.split(",")]
+        except ValueError:
+            sys.exit("Error: --sizes must be comma-separated integers")
+        regressions = run_bench_suite(sizes, args.seed, args.samples,
+                                      args.backend, args.baseline,
+                                      args.save_baseline, args.tolerance)
+        # a non-zero exit lets CI fail the build on a regression
+        if regressions:
+            sys.exit(1)
+        return
+
+    if args.command == "generate":
+        workload = SyntheticWorkload(args.size, args.seed)
+        for kind, path in workload.write_files(args.directory).items():
+            print(f"{kind:<9} {path}")
+        print(f"Load in order: import patients, import doctors, book-batch "
+              f"(into an empty system; {workload.n_patients:,} patients, "
+              f"{workload.n_doctors:,} doctors, {args.size:,} bookings).")
+        return
+
+    if args.command == "import":
+        # stream the file in, journaling in large fsync batches
+        hs = open_system(args, sync_every=10_000)
+        report = bulk_import(hs, args.kind, args.file, args.format, args.errors)
+        hs.close()
+        print(report.summary())
+        return
+
+    if args.command == "export":
+        hs = open_system(args)
+        try:
+            report = export_records(hs, args.kind, args.file, args.format,
+                                    args.since, date_from=args.date_from,
+                                    date_to=args.date_to,
+                                    doctor_id=args.doctor_id,
+                                    patient_id=args.patient_id,
+                                    status=args.status)
+        except ValueError as err:
+            sys.exit(f"Error: {err}")
+        finally:
+            hs.close()
+        print(report.summary())
+        return
+
+    if args.command == "report":
+        hs = open_system(args)
+        try:
+            report = hs.operations_report(args.date_from, args.date_to)
+        except ValueError as err:
+            sys.exit(f"Error: {err}")
+        finally:
+            hs.close()
+        if args.csv:
+            with open(args.csv, "w", newline="", encoding="utf-8") as f:
+                report.write_csv(f, args.top)
+        else:
+            sys.stdout.write(report.render(args.top))
+        return
+
+    if args.command == "invoice-batch":
+        hs = open_system(args)
+        try:
+            invoices = hs.invoice_range(args.date_from, args.date_to,
+                                        args.extra)
+        except ValueError as err:
+            sys.exit(f"Error: {err}")
+        finally:
+            hs.close()
+        total = sum(invoice.total for invoice in invoices)
+        print(f"Issued {len(invoices):,} invoices totalling JMD$ {total:,}.")
+        return
+
+    if args.command == "exec":
+        # journal in batches; everything is committed when the run ends
+        hs = open_system(args, sync_every=256)
+        infile = open(args.file, "rb") if args.file else sys.stdin.buffer
+        # replies go through one large write buffer instead of per-line print
+        outfile = (open(args.output, "wb", buffering=1 << 16) if args.output
+                   else open(sys.stdout.fileno(), "wb", buffering=1 << 16,
+                             closefd=False))
+        try:
+            run_commands(hs, infile, outfile, args.flush)
+        finally:
+            outfile.close()
+            if args.file:
+                infile.close()
+            hs.close()
+        return
+
+    if args.command == "serve":
+        # replies are only sent after their journal entries are fsync'd,
+        # and the server groups those commits itself
+        hs = open_system(args, sync_every=1 << 30)
+        server = CommandServer(hs, args.max_clients)
+
+        def ready(listener) -> None:
+            host, port = listener.sockets[0].getsockname()[:2]
+            print(f"Serving on {host}:{port}", flush=True)
+
+        try:
+            asyncio.run(server.serve(args.host, args.port, ready))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            hs.close()
+        return
+
+    if args.command == "loadgen":
+        print_load_report(asyncio.run(load_test(
+            args.host, args.port, args.clients, args.requests, args.pipeline)))
+        return
+
+    if args.command == "schedule-waitlist":
+        hs = open_system(args)
+        start = _time.perf_counter()
+        plan = plan_waitlist(hs, (row for _, row in
+                                  read_referrals(args.file, args.format)),
+                             args.workers)
+        elapsed = _time.perf_counter() - start
+        if args.report:
+            with open(args.report, "w", encoding="utf-8") as f:
+                for outcome in plan.outcomes():
+                    f.write(json.dumps(outcome) + "\n")
+        print(f"{plan.summary()} Planned in {elapsed:.2f} s.")
+        if not args.dry_run and plan.assignments:
+            # the whole plan is booked all-or-nothing as one batch
+            report = hs.book_batch(plan.rows())
+            if not report.applied:
+                hs.close()
+                print(f"Plan not booked: {report.errors()[0][1]}")
+                sys.exit(1)
+            print(f"Booked {report.total:,} appointments.")
+        hs.close()
+        return
+
+    if args.command == "book-batch":
+        hs = open_system(args)
+        start = _time.perf_counter()
+        report = hs.book_batch(read_booking_rows(args.file, args.format))
+        elapsed = _time.perf_counter() - start
+        hs.close()
+        if args.report:
+            with open(args.report, "w", encoding="utf-8") as f:
+                for outcome in report.outcomes():
+                    f.write(json.dumps(outcome) + "\n")
+        if report.applied:
+            print(f"Booked {report.total:,} appointments in {elapsed:.2f} s.")
+            return
+        print(f"Batch rejected: {report.rejected:,} of {report.total:,} rows "
+              f"failed validation; nothing was booked.")
+        for number, reason in report.errors()[:10]:
+            print(f"  row {number}: {reason}")
+        sys.exit(1)
+
     # create an instance of HospitalSystem to manage data and operations
-    hs = HospitalSystem()
+    hs = open_system(args)
+    if args.command == "snapshot":
+        # compact the data directory and exit
+        if hs.journal is None:
+            print("Error: --data-dir with the memory backend is required "
+                  "for 'snapshot'.")
+            sys.exit(2)
+        hs.journal.snapshot()
+        hs.close()
+        return
+
+    if args.command == "archive":
+        # archive, then snapshot so the next start loads only the rest
+        if hs.journal is None:
+            print("Error: --data-dir with the memory backend is required "
+                  "for 'archive'.")
+            sys.exit(2)
+        try:
+            count = hs.archive_appointments(args.before)
+        except ValueError as err:
+            hs.close()
+            sys.exit(f"Error: {err}")
+        hs.journal.snapshot()
+        hs.close()
+        print(f"Archived {count:,} appointments dated before {args.before}.")
+        return
 
     # enter the main interactive loop
     while True:
@@ -683,11 +8739,15 @@ def main() -> None:
                     pid = input("Patient ID: ").strip()
                     if pid in hs.patients:
                         # if found, display patient profile
-                        hs.patients[pid].view_profile()
+                        hs.patients[pid].view_profile(
+                            history=hs.patient_history(pid))
                     else:
                         # otherwise, inform user of invalid ID
                         print("Patient not found.\n")
                 elif sub == "3":
+                    # search by name, phone or date of birth
+                    hs.find_patient()
+                elif sub == "4":
                     # go back to the main menu
                     break
                 else:
@@ -735,17 +8795,32 @@ def main() -> None:
                     did = input("Doctor ID : ").strip()
                     date = input("Date (YYYY-MM-DD): ").strip()
                     time = input("Time (HH:MM): ").strip()
+                    # longer procedures take several consecutive slots
+                    minutes = input(f"Minutes (blank = {SLOT_MINUTES}): ").strip()
+                    if minutes and not minutes.isdigit():
+                        print("Invalid input; enter a number.\n")
+                        continue
                     # attempt booking with given details
-                    hs.book_appointment(pid, did, date, time)
+                    hs.book_appointment(pid, did, date, time,
+                                        int(minutes or SLOT_MINUTES))
                 elif sub == "2":
-                    # view all scheduled appointments
-                    hs.view_appointments()
+                    # view scheduled appointments (optionally filtered)
+                    hs.browse_appointments()
                 elif sub == "3":
                     # prompt for appointment ID to cancel
                     aid = input("Appointment ID: ").strip()
                     # attempt to cancel the appointment
                     hs.cancel_appointment(aid)
                 elif sub == "4":
+                    # search the earliest free slots for a speciality
+                    hs.find_next_available()
+                elif sub == "5":
+                    # utilisation/cancellation/lead-time report
+                    hs.show_operations_report()
+                elif sub == "6":
+                    # patients waiting for a cancelled slot
+                    hs.manage_waitlist()
+                elif sub == "7":
                     # go back to the main menu
                     break
                 else:
@@ -765,6 +8840,15 @@ def main() -> None:
                     # generate and display the bill
                     hs.generate_bill(aid)
                 elif sub == "2":
+                    # invoice every confirmed appointment in a date range
+                    hs.batch_invoice()
+                elif sub == "3":
+                    # revenue per doctor/day/service
+                    hs.revenue_report()
+                elif sub == "4":
+                    # list and re-price catalogue services
+                    hs.manage_fees()
+                elif sub == "5":
                     # go back to the main menu
                     break
                 else:
@@ -774,6 +8858,8 @@ def main() -> None:
         elif choice == "5":
             # if user selects Exit, print goodbye and terminate
             print("Exiting... Goodbye!")
+            # make sure every journaled operation is on disk
+            hs.close()
             sys.exit(0)
 
         else:
@@ -0,0 +1,346 @@
+# Behavioural tests for the Hospital Management System
+# run from the project directory with:  python -m pytest -q
+
+import csv
+import importlib.util
+import json
+import os
+import pathlib
+import sys
+
+import pytest
+
+# the program's file name is not importable as a module name, so load it
+# by path (registered in sys.modules for the process-pool pickling)
+_PATH = (pathlib.Path(__file__).resolve().parent.parent
+         / "Blake.Kobe-HMS_Program-ITT103-SP2025.py")
+_spec = importlib.util.spec_from_file_location("hms", _PATH)
+hms = importlib.util.module_from_spec(_spec)
+sys.modules["hms"] = hms
+_spec.loader.exec_module(hms)
+
+# a Monday comfortably in the future, so bookings and refills are allowed
+DAY = "2030-01-07"
+
+
+def patients(hs, n):
+    # register n synthetic patients; returns their IDs
+    return [hs.register_patient(*hms._bench_patient_fields(i))
+            for i in range(n)]
+
+
+def slots(date, *times):
+    return [(date, time) for time in times]
+
+
+@pytest.fixture(params=["memory", "sqlite", "threadsafe"])
+def system(request):
+    # every backend must behave the same for the shared operations
+    if request.param == "sqlite":
+        hs = hms.SQLiteHospitalSystem(":memory:")
+    elif request.param == "threadsafe":
+        hs = hms.ThreadSafeHospitalSystem()
+    else:
+        hs = hms.HospitalSystem()
+    yield hs
+    hs.close()
+
+
+# -- slot index ----------------------------------------------------------------
+def test_slot_index_keeps_order_through_book_and_cancel():
+    index = hms.SlotIndex(slots(DAY, "10:00", "09:00", "09:30", "09:00"))
+    assert list(index) == slots(DAY, "09:00", "09:30", "10:00")
+    first = hms.parse_slot(DAY, "09:00")
+    assert index.discard(first) and not index.discard(first)
+    assert (DAY, "09:00") not in index and len(index) == 2
+    assert index.add(first) and not index.add(first)
+    assert list(index) == slots(DAY, "09:00", "09:30", "10:00")
+    assert ("bad", "slot") not in index
+
+
+def test_slot_index_compacts_tombstones():
+    # compaction starts once tombstones outnumber the free slots by 64
+    times = [f"{h:02}:{m:02}" for h in range(24) for m in (0, 15, 30, 45)]
+    index = hms.SlotIndex(slots(DAY, *times))
+    for time in times[:-1]:
+        index.discard(hms.parse_slot(DAY, time))
+    assert list(index) == [(DAY, times[-1])]
+    assert len(index._order) < len(times)
+
+
+def test_rule_schedule_books_in_the_rules_own_step():
+    hs = hms.HospitalSystem()
+    pid, other = patients(hs, 2)
+    did = hs.register_doctor("Ann", "Lee", "F", "Cardiology", {
+        "rules": [f"Mon-Fri 09:00-12:00 every 30 from {DAY}"]})
+    doctor = hs.doctors[did]
+    assert doctor.is_available(DAY, "09:00", 30)
+    assert not doctor.is_available(DAY, "09:15")
+    hs.make_booking(pid, did, DAY, "09:00", 30)
+    assert not doctor.is_available(DAY, "09:00")
+    assert doctor.is_available(DAY, "09:30", 60)
+    appt = hs.make_booking(other, did, DAY, "09:30", 45)
+    assert not doctor.is_available(DAY, "10:00")
+    hs.cancel_booking(appt.appointment_id)
+    assert doctor.is_available(DAY, "09:30", 60)
+
+
+# -- booking, overlaps and batches ----------------------------------------------
+def test_double_booking_and_overlaps_are_rejected(system):
+    pid, other = patients(system, 2)
+    did = system.register_doctor("Ann", "Lee", "F", "Cardiology",
+                                  slots(DAY, "09:00", "09:15", "09:30"))
+    system.make_booking(pid, did, DAY, "09:00", 30)
+    with pytest.raises(hms.BookingError):
+        system.make_booking(other, did, DAY, "09:15")
+    second = system.register_doctor("Mark", "Reid", "M", "Cardiology",
+                                    slots(DAY, "09:15"))
+    # the patient is already in a procedure until 09:30
+    with pytest.raises(hms.BookingError):
+        system.make_booking(pid, second, DAY, "09:15")
+    system.make_booking(other, second, DAY, "09:15")
+
+
+def test_batch_is_all_or_nothing(system):
+    p1, p2, p3 = patients(system, 3)
+    did = system.register_doctor("Ann", "Lee", "F", "Cardiology",
+                                 slots(DAY, "09:00", "09:15", "09:30"))
+    report = system.book_batch([(p1, did, DAY, "09:00"),
+                                (p2, did, DAY, "09:15"),
+                                (p3, did, DAY, "09:15")])
+    assert not report.applied
+    assert report.rejections == {
+        3: "Slot already booked earlier in this batch."}
+    assert len(system.appointments) == 0
+    assert system.slot_is_free(did, DAY, "09:00")
+    # nothing was used up by the rejected batch, IDs included
+    report = system.book_batch([(p1, did, DAY, "09:00"),
+                                (p2, did, DAY, "09:15")])
+    assert report.applied and report.appointment_ids == ["A001", "A002"]
+
+
+def test_batch_names_doctor_and_patient_overlaps(system):
+    p1, p2 = patients(system, 2)
+    did = system.register_doctor("Ann", "Lee", "F", "Cardiology",
+                                 slots(DAY, "09:00", "09:10", "09:15"))
+    report = system.book_batch([(p1, did, DAY, "09:00", 30),
+                                (p2, did, DAY, "09:10")])
+    assert report.rejections == {
+        2: "Doctor already booked at that time earlier in this batch."}
+    other = system.register_doctor("Mark", "Reid", "M", "Cardiology",
+                                   slots(DAY, "09:15"))
+    report = system.book_batch([(p1, did, DAY, "09:00", 30),
+                                (p1, other, DAY, "09:15")])
+    assert report.rejections == {
+        2: "Patient already booked at that time earlier in this batch."}
+
+
+# -- journal -------------------------------------------------------------------
+def journaled(directory):
+    hs = hms.HospitalSystem()
+    hms.Journal(str(directory)).attach(hs)
+    return hs
+
+
+def state(hs):
+    return sorted(tuple(row) for row in hs.appointment_rows())
+
+
+def test_journal_replays_every_operation(tmp_path):
+    hs = journaled(tmp_path)
+    pid, other = patients(hs, 2)
+    did = hs.register_doctor("Ann", "Lee", "F", "Cardiology",
+                             slots(DAY, "09:00", "09:15", "09:30"))
+    hs.make_booking(pid, did, DAY, "09:00")
+    appt = hs.make_booking(other, did, DAY, "09:15", 30)
+    hs.cancel_booking(appt.appointment_id)
+    expected = state(hs)
+    hs.close()
+    restored = journaled(tmp_path)
+    assert state(restored) == expected
+    assert list(restored.doctors[did].upcoming()) == slots(DAY, "09:15",
+                                                           "09:30")
+    # IDs carry on where the journal left off
+    assert restored.register_patient(
+        *hms._bench_patient_fields(9)) == "P003"
+    restored.close()
+
+
+def test_journal_drops_a_torn_tail(tmp_path):
+    hs = journaled(tmp_path)
+    pid, = patients(hs, 1)
+    did = hs.register_doctor("Ann", "Lee", "F", "Cardiology",
+                             slots(DAY, "09:00", "09:15"))
+    hs.make_booking(pid, did, DAY, "09:00")
+    expected = state(hs)
+    hs.close()
+    log = tmp_path / hms.Journal.JOURNAL
+    size = log.stat().st_size
+    with open(log, "ab") as f:
+        # a crash halfway through writing the next entry
+        f.write(b'12345 [99, "B", "P001", "D0')
+    restored = journaled(tmp_path)
+    assert state(restored) == expected
+    assert log.stat().st_size == size
+    restored.make_booking(pid, did, DAY, "09:15")
+    restored.close()
+    again = journaled(tmp_path)
+    assert len(state(again)) == 2
+    again.close()
+
+
+def test_journal_refuses_damage_before_the_tail(tmp_path):
+    hs = journaled(tmp_path)
+    patients(hs, 3)
+    hs.close()
+    log = tmp_path / hms.Journal.JOURNAL
+    lines = log.read_bytes().splitlines(keepends=True)
+    lines[0] = lines[0].replace(b"P001", b"P00X")
+    log.write_bytes(b"".join(lines))
+    with pytest.raises(hms.JournalError):
+        journaled(tmp_path)
+
+
+def test_archive_survives_a_snapshot_and_replay(tmp_path):
+    hs = journaled(tmp_path)
+    hms._populate(hs, 200)
+    expected = state(hs)
+    assert hs.archive_appointments("2025-01-03")
+    hs.close()
+    restored = journaled(tmp_path)
+    assert state(restored) == expected
+    restored.close()
+
+
+# -- snapshots and export ---------------------------------------------------------
+def test_read_snapshot_is_isolated_from_later_changes():
+    hs = hms.HospitalSystem()
+    pid, other = patients(hs, 2)
+    did = hs.register_doctor("Ann", "Lee", "F", "Cardiology",
+                             slots(DAY, "09:00", "09:15"))
+    appt = hs.make_booking(pid, did, DAY, "09:00")
+    with hs.read_snapshot() as snap:
+        hs.cancel_booking(appt.appointment_id)
+        hs.make_booking(other, did, DAY, "09:15")
+        patients(hs, 1)
+        assert [(a.appointment_id, a.status)
+                for a in snap.appointments()] == [("A001", "Confirmed")]
+        assert snap.free_slots(did) == slots(DAY, "09:15")
+        assert len(list(snap.patients())) == 2
+    assert not hs._snapshots
+    assert hs.find_appointment("A001").status == "Canceled"
+
+
+@pytest.mark.parametrize("fmt", hms.EXPORT_FORMATS)
+def test_export_writes_every_row(tmp_path, fmt):
+    hs = hms.HospitalSystem()
+    hms._populate(hs, 300)
+    rows = list(hs.export_rows("appointments"))
+    path = str(tmp_path / "appointments.out")
+    report = hms.export_records(hs, "appointments", path, fmt)
+    assert report.rows == len(rows) == 300
+    if fmt == "columnar":
+        read = hms.read_columnar(path)
+        assert next(read) == hms.EXPORT_COLUMNS["appointments"]
+        assert list(read) == rows
+    elif fmt == "csv":
+        with open(path, newline="") as f:
+            written = list(csv.reader(f))[1:]
+        assert written == [[str(value) for value in row] for row in rows]
+    else:
+        with open(path) as f:
+            assert [tuple(json.loads(line).values()) for line in f] == rows
+
+
+def test_export_since_state_writes_only_changes(tmp_path):
+    hs = hms.HospitalSystem()
+    hms._populate(hs, 100)
+    state_file = str(tmp_path / "appointments.state")
+    path = str(tmp_path / "changes.csv")
+    assert hms.export_records(hs, "appointments", path,
+                              since=state_file).rows == 100
+    assert hms.export_records(hs, "appointments", path,
+                              since=state_file).rows == 0
+    hs.cancel_booking("A005")
+    report = hms.export_records(hs, "appointments", path, since=state_file)
+    with open(path, newline="") as f:
+        written = list(csv.reader(f))[1:]
+    assert report.rows == 1 and written[0][0] == "A005"
+    # a state file belongs to one kind of export
+    with pytest.raises(ValueError):
+        hms.export_records(hs, "patients", str(tmp_path / "p.csv"),
+                           since=state_file)
+    assert not os.path.exists(tmp_path / "p.csv")
+
+
+# -- waiting list ------------------------------------------------------------------
+def test_cancelled_slot_goes_to_the_best_eligible_patient():
+    hs = hms.HospitalSystem()
+    booked, routine, urgent, late = patients(hs, 4)
+    did = hs.register_doctor("Ann", "Lee", "F", "Cardiology",
+                             slots(DAY, "09:00"))
+    appt = hs.make_booking(booked, did, DAY, "09:00")
+    hs.join_waitlist(routine, did, urgency=1)
+    # most urgent, but only for dates before the freed slot
+    hs.join_waitlist(urgent, None, "cardiology", urgency=5,
+                     latest="2030-01-06")
+    hs.join_waitlist(late, None, "Cardiology", urgency=3,
+                     earliest=DAY, latest=DAY)
+    hs.cancel_booking(appt.appointment_id)
+    refill = hs.refill_of(appt.appointment_id)
+    assert refill.patient.patient_id == late
+    assert [e.patient_id for e in hs.waitlist_queue(did)] == [routine]
+
+
+# -- search ------------------------------------------------------------------------
+def test_search_matches_in_both_backends():
+    names = [("Ann", "Mary", "Brown"), ("Joanne", "", "Browne"),
+             ("Hanna", "Li", "Smith"), ("Mark", "", "Lin")]
+    memory = hms.HospitalSystem()
+    sqlite = hms.SQLiteHospitalSystem(":memory:")
+    for i, (first, middle, last) in enumerate(names):
+        fields = hms._bench_patient_fields(i)
+        fields[:3] = [first, middle, last]
+        for hs in (memory, sqlite):
+            hs.register_patient(*fields)
+    for query in ("ann", "brown", "an", "li", "nne", "mary brown", "x"):
+        assert ([p.patient_id for _, p in sqlite.search_patients(query)]
+                == [p.patient_id for _, p in memory.search_patients(query)])
+    assert [p.first_name for _, p in memory.search_patients("ann")] == [
+        "Ann", "Joanne", "Hanna"]
+    sqlite.close()
+
+
+# -- JSON commands ---------------------------------------------------------------
+@pytest.mark.parametrize("cmd", [
+    [], "book", {"op": 5}, {"op": "nope"}, {"op": "book"},
+    {"op": "book", "patient_id": ["P001"], "doctor_id": "D001",
+     "date": DAY, "time": "09:00"},
+    {"op": "book_batch", "rows": "P001"},
+    {"op": "book_batch", "rows": [[1, 2, 3, 4]]},
+    {"op": "register_patient", "fields": []},
+    {"op": "overlapping", "doctor_id": "D001", "from": "soon", "to": "later"},
+    {"op": "appointments", "limit": 2 ** 70},
+    {"op": "invoice_range", "from": "2030-13-01"},
+])
+def test_malformed_commands_get_error_replies(system, cmd):
+    patients(system, 1)
+    system.register_doctor("Ann", "Lee", "F", "Cardiology",
+                           slots(DAY, "09:00"))
+    reply = hms.CommandProcessor(system).execute(cmd)
+    assert reply["ok"] is False and reply["error"]
+
+
+def test_rejected_batch_command_lists_its_rows(system):
+    pid, = patients(system, 1)
+    did = system.register_doctor("Ann", "Lee", "F", "Cardiology",
+                                 slots(DAY, "09:00"))
+    processor = hms.CommandProcessor(system)
+    row = {"patient_id": pid, "doctor_id": did, "date": DAY, "time": "09:00"}
+    reply = processor.execute({"op": "book_batch", "rows": [row, row],
+                               "ref": 7})
+    assert reply == {"ok": False, "error": "batch rejected", "ref": 7,
+                     "rejections": [{"row": 2, "error": "Slot already "
+                                     "booked earlier in this batch."}]}
+    reply = processor.execute({"op": "book_batch", "rows": [row]})
+    assert reply == {"ok": True, "appointment_ids": ["A001"]}